@@ -0,0 +1,123 @@
+"""Fetches saved by url canonicalization on a graph with aliased links.
+
+Run from the project root:
+    python -m benchmarks.bench_canonical [--pages 2000] [--aliases 0.1]
+
+Serves a WebGraph whose links to content pages are spelled another way
+(see WebGraph aliases) from a CacheServer in this process, and crawls it
+once with [CANONICAL] ENABLED false and once with true, with one thread and
+POLITENESS 0. For both it reports the fetches, the distinct pages of the
+graph they fetched, the fetches of a page fetched before under another
+spelling, the distinct content pages (/page/<id>) the server answered with
+200, and the pages counted in the report. The refetches left with
+canonicalization are of pages linked both with and without a query the
+server ignores, which no canonical form can tell from a query that matters.
+
+Both crawls reach the same content pages. The distinct pages also count the
+levels of the calendar and archive traps and the 404s of relative links on
+pages copied from another host, and those depend on the order pages are
+crawled in, which fewer refetches change: a trap level or copy found to be a
+near-duplicate of a page crawled before is not scraped, so its links are not
+followed.
+"""
+import os
+import posixpath
+import tempfile
+import time
+from argparse import ArgumentParser
+from configparser import ConfigParser
+from urllib.parse import urlparse, unquote
+
+from benchmarks.cache_server import CacheServer
+from benchmarks.webgraph import WebGraph
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def page_key(url):
+    """The page of the graph the server answers url with."""
+    parsed = urlparse(url)
+    path = posixpath.normpath(unquote(parsed.path)).rstrip("/") if parsed.path else ""
+    query = parsed.query if path == "/events" else ""
+    return (parsed.hostname or "").lower(), path.lstrip("."), query
+
+
+def content_page(graph, url):
+    """The content page the server answers url with, None for other answers."""
+    page = graph.get(url)
+    key = page_key(page.final_url)
+    if page.status != 200 or not key[1].startswith("/page/"):
+        return None
+    return key
+
+
+def recording_frontier(fetched):
+    """Frontier that appends every url handed to a worker to fetched."""
+    from crawler.frontier import Frontier
+
+    class RecordingFrontier(Frontier):
+        def get_tbd_url(self):
+            url = super().get_tbd_url()
+            if url is not None:
+                fetched.append(url)
+            return url
+
+    return RecordingFrontier
+
+
+def run_crawl(canonical, cache_server, workdir):
+    """Crawls the cache server and returns the fetched urls and the pages
+    counted in the report."""
+    from crawler import Crawler
+    from crawler.worker import Worker
+    from utils.config import Config
+
+    cparser = ConfigParser()
+    cparser.read(os.path.join(ROOT, "config.ini"))
+    cparser["CRAWLER"]["POLITENESS"] = "0"
+    cparser["CANONICAL"]["ENABLED"] = "true" if canonical else "false"
+    cparser["LOCAL PROPERTIES"]["THREADCOUNT"] = "1"
+    cparser["LOCAL PROPERTIES"]["SAVE"] = os.path.join(workdir, "frontier.save")
+    cparser["LOCAL PROPERTIES"]["HASHFILE"] = os.path.join(workdir, "fingerprints.bin")
+    cparser["LOCAL PROPERTIES"]["CHECKPOINT"] = os.path.join(workdir, "frontier.ckpt")
+    config = Config(cparser)
+    config.cache_server = cache_server
+
+    fetched = []
+    crawler = Crawler(config, True, recording_frontier(fetched), Worker)
+    crawler.start()
+    statistics = crawler.frontier.statistics
+    return fetched, sum(count for _, count in statistics.subdomain_counts())
+
+
+def main(args):
+    graph = WebGraph(args.pages, args.seed, aliases=args.aliases)
+    server = CacheServer(graph)
+    host, port = server.start()
+    print(f"{'canonical':>9} {'fetches':>8} {'pages':>7} {'refetches':>10} {'content':>8}"
+          f" {'ics pages':>10} {'seconds':>8}")
+    cwd = os.getcwd()
+    for canonical in (False, True):
+        with tempfile.TemporaryDirectory() as workdir:
+            # Logs/, records/ and STATS_FILE.txt go to the scratch directory.
+            os.chdir(workdir)
+            try:
+                start = time.perf_counter()
+                fetched, ics_pages = run_crawl(canonical, (host, port), workdir)
+                elapsed = time.perf_counter() - start
+            finally:
+                os.chdir(cwd)
+        pages = len(set(map(page_key, fetched)))
+        content = len({content_page(graph, url) for url in fetched} - {None})
+        print(f"{str(canonical).lower():>9} {len(fetched):>8} {pages:>7} {len(fetched) - pages:>10}"
+              f" {content:>8} {ics_pages:>10} {elapsed:>8.1f}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--pages", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--aliases", type=float, default=0.1)
+    args = parser.parse_args()
+    main(args)
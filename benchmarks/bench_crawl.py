@@ -0,0 +1,192 @@
+"""End to end crawl throughput against the local cache server.
+
+Run from the project root:
+    python -m benchmarks.bench_crawl [--engines thread,async,process]
+        [--storages sqlite,shelve] [--threads 4] [--pages 2000] [--latency 0.0]
+
+Serves a WebGraph from a CacheServer in this process and crawls it once per
+engine and save file backend, each crawl in a fresh subprocess so its peak
+RSS is its own. POLITENESS is 0 so the numbers measure the crawler, not the
+delay. For every crawl it reports pages/second, p50/p99 latency of each
+stage of a url and peak RSS of the crawler (and of its parse processes):
+
+    fetch    from the frontier handing out the url to the download finishing
+    process  from the download finishing to the url being marked complete
+    total    from the frontier handing out the url to it being marked complete
+"""
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser, SUPPRESS
+from configparser import ConfigParser
+from threading import Lock
+
+from benchmarks.cache_server import CacheServer
+from benchmarks.webgraph import WebGraph
+
+STAGES = ["fetch", "process", "total"]
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(values, fraction):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def timed_frontier(stages):
+    """Frontier that records when each url is handed out, downloaded and completed."""
+    from crawler.frontier import Frontier
+
+    class TimedFrontier(Frontier):
+        def __init__(self, config, restart):
+            super().__init__(config, restart)
+            self.timing_lock = Lock()
+            self.handed_out = {}
+            self.downloaded = {}
+
+        def try_get_tbd_url(self):
+            url, wait = super().try_get_tbd_url()
+            if url is not None:
+                with self.timing_lock:
+                    self.handed_out[url] = time.perf_counter()
+            return url, wait
+
+        def record_download(self, url):
+            with self.timing_lock:
+                self.downloaded[url] = time.perf_counter()
+
+        def mark_url_complete(self, url):
+            super().mark_url_complete(url)
+            now = time.perf_counter()
+            with self.timing_lock:
+                start = self.handed_out.pop(url, None)
+                downloaded = self.downloaded.pop(url, None)
+            if start is not None and downloaded is not None:
+                stages["fetch"].append(downloaded - start)
+                stages["process"].append(now - downloaded)
+                stages["total"].append(now - start)
+
+    return TimedFrontier
+
+
+def record_downloads(frontier):
+    """Wraps the download function of every engine to report to frontier."""
+    import crawler.async_worker
+    import crawler.pipeline
+    import crawler.worker
+
+    def wrap(download):
+        def timed_download(url, config, logger=None):
+            resp = download(url, config, logger)
+            frontier().record_download(url)
+            return resp
+        return timed_download
+
+    fetch = crawler.async_worker.fetch
+
+    async def timed_fetch(url, config, pool=None):
+        try:
+            return await fetch(url, config, pool)
+        finally:
+            frontier().record_download(url)
+
+    crawler.worker.download = wrap(crawler.worker.download)
+    crawler.pipeline.download = wrap(crawler.pipeline.download)
+    crawler.async_worker.fetch = timed_fetch
+
+
+def run_crawl(engine, storage, threads, cache_server, workdir):
+    """Crawls the cache server once and returns the measurements as a dict."""
+    from crawler import Crawler
+    from launch import ENGINES
+    from utils.config import Config
+
+    cparser = ConfigParser()
+    cparser.read(os.path.join(ROOT, "config.ini"))
+    cparser["CRAWLER"]["POLITENESS"] = "0"
+    cparser["LOCAL PROPERTIES"]["THREADCOUNT"] = str(threads)
+    cparser["LOCAL PROPERTIES"]["STORAGE"] = storage
+    cparser["LOCAL PROPERTIES"]["SAVE"] = os.path.join(workdir, "frontier.save")
+    cparser["LOCAL PROPERTIES"]["HASHFILE"] = os.path.join(workdir, "fingerprints.bin")
+    config = Config(cparser)
+    config.cache_server = cache_server
+
+    stages = {stage: [] for stage in STAGES}
+    crawler = None
+    record_downloads(lambda: crawler.frontier)
+    start = time.perf_counter()
+    crawler = Crawler(config, True, timed_frontier(stages), ENGINES[engine])
+    crawler.start()
+    # parse processes count towards RUSAGE_CHILDREN once they exited, which
+    # Crawler.join waits for
+    elapsed = time.perf_counter() - start
+
+    pages = len(stages["total"])
+    result = {
+        "engine": engine, "storage": storage, "pages": pages, "seconds": elapsed,
+        "pages_per_second": pages / elapsed,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "children_peak_rss_mb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024}
+    for stage, values in stages.items():
+        result[f"{stage}_p50_ms"] = percentile(values, 0.5) * 1000
+        result[f"{stage}_p99_ms"] = percentile(values, 0.99) * 1000
+    return result
+
+
+def child(args):
+    host, port = args.cache_server.rsplit(":", 1)
+    with tempfile.TemporaryDirectory() as workdir:
+        result = run_crawl(args.engine, args.storage, args.threads, (host, int(port)), workdir)
+    print(json.dumps(result))
+
+
+def main(args):
+    graph = WebGraph(args.pages, args.seed)
+    server = CacheServer(graph, latency=args.latency)
+    host, port = server.start()
+    print(f"{'engine':>8} {'storage':>8} {'pages':>6} {'pages/s':>8}"
+          + "".join(f" {stage + ' p50':>11} {stage + ' p99':>11}" for stage in STAGES)
+          + f" {'rss MB':>7} {'child MB':>8}")
+    for engine in args.engines.split(","):
+        for storage in args.storages.split(","):
+            with tempfile.TemporaryDirectory() as cwd:
+                # Logs/ and STATS_FILE.txt go to the scratch directory.
+                out = subprocess.run(
+                    [sys.executable, "-m", "benchmarks.bench_crawl", "--child",
+                     "--engine", engine, "--storage", storage, "--threads", str(args.threads),
+                     "--cache_server", f"{host}:{port}"],
+                    cwd=cwd, env=dict(os.environ, PYTHONPATH=ROOT),
+                    stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True,
+                    universal_newlines=True).stdout
+            result = json.loads(out.strip().splitlines()[-1])
+            print(f"{engine:>8} {storage:>8} {result['pages']:>6} {result['pages_per_second']:>8.1f}"
+                  + "".join(f" {result[stage + '_p50_ms']:>11.1f} {result[stage + '_p99_ms']:>11.1f}"
+                            for stage in STAGES)
+                  + f" {result['peak_rss_mb']:>7.1f} {result['children_peak_rss_mb']:>8.1f}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--engines", type=str, default="thread,async,process")
+    parser.add_argument("--storages", type=str, default="sqlite,shelve")
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--pages", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.0)
+    # used by main to run one crawl in a subprocess
+    parser.add_argument("--child", action="store_true", help=SUPPRESS)
+    parser.add_argument("--engine", type=str, help=SUPPRESS)
+    parser.add_argument("--storage", type=str, help=SUPPRESS)
+    parser.add_argument("--cache_server", type=str, help=SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args)
+    else:
+        main(args)
@@ -0,0 +1,106 @@
+"""Lookups in FingerprintStore that find no similar fingerprint.
+
+Run from the project root:
+    python -m benchmarks.bench_fingerprints [--stored 4000] [--lookups 1000]
+
+A lookup that finds a similar page stops at its first candidate, one that
+finds none probes every key and checks every candidate, which is the cost of
+each new page of a crawl. Fingerprints of --stored synthetic pages of a
+WebGraph are indexed, and the fingerprints of the next pages that match none
+of them are looked up, for several band counts and with a linear scan. The
+same is done with random fingerprints, which do not share the bits of common
+words the way page fingerprints do. Candidates are the stored fingerprints
+compared with a popcount per lookup, counting a fingerprint once for every
+band it is found in.
+"""
+import random
+import time
+from argparse import ArgumentParser
+
+from bs4 import BeautifulSoup
+
+from benchmarks.webgraph import WebGraph
+from tokenizer import countTokens, getFingerprint
+from tokenizer.fingerprints import FingerprintStore, default_bands, max_distance, popcount
+
+BAND_COUNTS = (7, 9, 10, 13, 26)
+
+
+def page_fingerprints(count, seed):
+    """Fingerprints of the first count normal pages of a WebGraph."""
+    graph = WebGraph(seed=seed)
+    fingerprints = []
+    page_id = 0
+    while len(fingerprints) < count:
+        if graph.kind(page_id) == "normal":
+            text = BeautifulSoup(graph.content(page_id), "html.parser").get_text()
+            fingerprints.append(getFingerprint(countTokens(text)))
+        page_id += 1
+    return fingerprints
+
+
+def candidates(store, fingerprint):
+    """Stored fingerprints find_similar compares with fingerprint on a miss."""
+    count = 0
+    for table, (shift, mask) in zip(store.tables, store.bands):
+        key = (fingerprint >> shift) & mask
+        for flip in store.flips[mask.bit_length()]:
+            bucket = table.get(key ^ flip)
+            if bucket is not None:
+                count += len(bucket)
+    return count
+
+
+def linear_find(stored, fingerprint, limit):
+    for candidate in stored:
+        if popcount(candidate ^ fingerprint) <= limit:
+            return candidate
+    return None
+
+
+def run(name, stored, queries, threshold):
+    limit = max_distance(threshold)
+    misses = [query for query in queries if linear_find(stored, query, limit) is None]
+    if not misses:
+        print(f"{name:>7} no lookup misses")
+        return
+    start = time.perf_counter()
+    for query in misses:
+        linear_find(stored, query, limit)
+    linear = (time.perf_counter() - start) / len(misses)
+    print(f"{name:>7} {'linear':>7} {'':>7} {len(stored):>10} {100.0:>6.1f} {linear * 1e6:>9.0f}")
+    for bands in sorted(set(BAND_COUNTS + (default_bands(limit),))):
+        store = FingerprintStore(None, threshold, bands)
+        for fingerprint in stored:
+            store.add(fingerprint)
+        start = time.perf_counter()
+        for query in misses:
+            assert store.find_similar(query) is None
+        elapsed = (time.perf_counter() - start) / len(misses)
+        checked = sum(candidates(store, query) for query in misses) / len(misses)
+        label = f"{bands}*" if bands == default_bands(limit) else str(bands)
+        # keys probed in each band, of the widest band
+        keys = len(store.flips[store.bands[0][1].bit_length()])
+        print(f"{name:>7} {label:>7} {keys:>7}"
+              f" {checked:>10.0f} {100 * checked / len(stored):>6.1f} {elapsed * 1e6:>9.0f}")
+
+
+def main(args):
+    fingerprints = page_fingerprints(args.stored + args.lookups, args.seed)
+    rand = random.Random(args.seed)
+    print(f"{len(fingerprints[:args.stored])} stored, SIMILARITY {args.threshold}, "
+          f"max distance {max_distance(args.threshold)}, * marks the default band count")
+    print(f"{'source':>7} {'bands':>7} {'keys':>7} {'candidates':>10} {'%':>6} {'us/miss':>9}")
+    run("pages", fingerprints[:args.stored], fingerprints[args.stored:], args.threshold)
+    run("random", [rand.getrandbits(128) for _ in range(args.stored)],
+        [rand.getrandbits(128) for _ in range(args.lookups)], args.threshold)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--stored", type=int, default=4000)
+    parser.add_argument("--lookups", type=int, default=1000)
+    parser.add_argument("--threshold", type=float, default=0.8)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,168 @@
+"""Parity and speed of the streaming link extractor against the soup.
+
+Run from the project root:
+    python -m benchmarks.bench_links [page.html ...]
+
+Without arguments, pages of benchmarks.webgraph, a directory listing with
+5000 links and a few hand-written edge cases (comments, scripts, entities,
+unquoted and repeated attributes, <base>, non-ASCII pages) are used. Pages
+given as arguments are scraped as if fetched from https://www.ics.uci.edu/.
+
+The links of scraper.extract_next_links are checked against those of the
+extractor that walked the BeautifulSoup tree and timed, once the page text
+is extracted, on the two paths a crawl takes:
+
+    soup built   TEXTBACKEND html.parser: the text was taken from the soup,
+                 so the hrefs are found in it, the old extractor against
+                 extract_next_links.
+    no soup      TEXTBACKEND selectolax or lxml: the old extractor builds a
+                 soup for the links, extract_next_links streams the hrefs
+                 out of the page with extract_hrefs. Skipped when neither
+                 is installed.
+
+The times include resolving the hrefs, which extract_next_links does once
+per distinct href with resolve_link, and the old extractor with urljoin for
+every href. The "hrefs ms" columns time finding the hrefs alone.
+"""
+import os
+import sys
+import time
+from urllib.parse import urlparse, urljoin
+
+import requests
+
+import scraper
+from benchmarks.webgraph import WebGraph
+from utils.canonical import canonicalize
+from utils.page import ParsedPage, TEXT_BACKENDS, extract_hrefs, set_text_backend
+from utils.response import Response
+
+BASE_URL = "https://www.ics.uci.edu/dir/page.html"
+FILLER = " ".join(f"filler{i} words" for i in range(60))
+EDGE_CASES = [
+    f"<html><body><p>{FILLER}</p>"
+    '<A HREF="/Upper">upper</A> <a href=/unquoted>unquoted</a> <a href=\'/single\'>single</a>'
+    '<a href="/q?a=1&amp;b=2&#47;c">entities</a> <a href="/first" href="/second">repeated</a>'
+    '<a href>valueless</a> <a name="anchor">no href</a> <a href="/self"/>'
+    "<!-- <a href=\"/commented\"> --> <script>document.write('<a href=\"/scripted\">')</script>"
+    '<a href="#top">top</a> <a href="/page#frag">frag</a> <a href="relative/path">relative</a>'
+    '<a href="//www.ics.uci.edu/protocol">protocol</a> <a href="  /spaced  ">spaced</a>'
+    '<a href="mailto:someone@uci.edu">mail</a> <a href="javascript:void(0)">js</a>'
+    '<a href="/q?share=1">share</a> <a href="/file.pdf">pdf</a> <a href="/Upper">again</a>'
+    "</body></html>".encode("utf-8"),
+    # relative links are made absolute from the root, so a <base> on the same
+    # host resolves them as the page url does
+    f'<html><head><base href="https://www.ics.uci.edu/base/"></head><body><p>{FILLER}</p>'
+    '<a href="in/base">in base</a> <a href="/rooted">rooted</a></body></html>'.encode("utf-8"),
+    f'<html><head><meta charset="iso-8859-1"></head><body><p>{FILLER} caf\xe9</p>'
+    '<a href="/caf\xe9">latin-1</a></body></html>'.encode("iso-8859-1"),
+    f"<html><body><p>{FILLER} naïve</p><a href=\"/naïve\">utf-8</a>"
+    '<a href="/unclosed">unclosed <div><a href="/nested">nested</div></body>'.encode("utf-8"),
+]
+
+
+def directory_listing(entries=5000):
+    rows = "\n".join(
+        f'<tr><td><a href="file{i}.txt">file{i}.txt</a></td><td>2020-01-{i % 28 + 1:02d}</td></tr>'
+        for i in range(entries))
+    return f"<html><body><h1>Index of /dir {FILLER}</h1><table>{rows}</table></body></html>".encode("utf-8")
+
+
+def response(url, content):
+    raw = requests.models.Response()
+    raw.status_code = 200
+    raw.url = url
+    raw._content = content
+    resp = Response({"url": url, "status": 200})
+    resp.raw_response = raw
+    return resp
+
+
+def reference_extract_next_links(url, resp, page):
+    """The link extractor before the streaming one, for a 200 response,
+    with links canonicalized as the scraper now does."""
+    links = []
+    if page.token_count < 50:
+        return links
+    for link in [a.get("href") for a in page.soup.find_all("a")]:
+        if(not link or link is None):
+            continue
+        link = link.strip()
+        if (bool(urlparse(link).netloc) == False):
+            if (link is not None and link != "" and link[0] != "/"):
+                link = "/" + link
+            link = urljoin(url, link)
+        if (bool(urlparse(link).fragment)):
+            link = link.split('#')[0]
+        link = canonicalize(link)
+        if (scraper.is_valid(link)):
+            links.append(link)
+    return links
+
+
+def soup_hrefs(url, resp, page):
+    return [a.get("href") for a in page.soup.find_all("a")]
+
+
+def stream_hrefs(url, resp, page):
+    return extract_hrefs(page.content)[0]
+
+
+def timed(func, pages, backend):
+    """Runs func(url, resp, page) on fresh ParsedPages whose text was already
+    extracted by backend, so only link extraction is timed."""
+    set_text_backend(backend)
+    try:
+        prepared = []
+        for url, resp in pages:
+            page = ParsedPage(resp)
+            page.freqs
+            prepared.append((url, resp, page))
+        start = time.perf_counter()
+        results = [func(url, resp, page) for url, resp, page in prepared]
+        return results, time.perf_counter() - start
+    finally:
+        set_text_backend()
+
+
+def main(paths):
+    if paths:
+        pages = []
+        for path in paths:
+            with open(path, "rb") as f:
+                pages.append((f"https://www.ics.uci.edu/{os.path.basename(path)}", f.read()))
+        listing = []
+    else:
+        graph = WebGraph(400)
+        pages = [(graph.page_url(page_id), graph.content(page_id)) for page_id in range(400)]
+        pages += [(BASE_URL, content) for content in EDGE_CASES]
+        listing = [("https://www.ics.uci.edu/dir/", directory_listing())]
+
+    no_soup = next((name for name in ("selectolax", "lxml") if name in TEXT_BACKENDS), None)
+    extractions = [("soup built", "html.parser")]
+    if no_soup is not None:
+        extractions.append(("no soup", no_soup))
+    else:
+        print("neither selectolax nor lxml is installed, the streaming path is not timed")
+    print(f"{'pages':>12} {'path':>11} {'links':>7} {'soup ms':>8} {'stream ms':>10}"
+          f" {'hrefs ms':>9} {'hrefs ms':>9}")
+    print(f"{'':>12} {'':>11} {'':>7} {'':>8} {'':>10} {'soup':>9} {'stream':>9}")
+    for name, group in (("corpus", pages), ("dir listing", listing)):
+        if not group:
+            continue
+        group = [(url, response(url, content)) for url, content in group]
+        for path, backend in extractions:
+            expected, soup_time = timed(reference_extract_next_links, group, backend)
+            got, stream_time = timed(scraper.extract_next_links, group, backend)
+            for (url, _), want, have in zip(group, expected, got):
+                assert have == want, f"links differ on {url} ({path}): {want} != {have}"
+            hrefs, soup_hrefs_time = timed(soup_hrefs, group, backend)
+            streamed, stream_hrefs_time = timed(stream_hrefs, group, backend)
+            assert hrefs == streamed, f"hrefs differ ({path})"
+            print(f"{name:>12} {path:>11} {sum(map(len, got)):>7} {soup_time * 1000:>8.1f}"
+                  f" {stream_time * 1000:>10.1f} {soup_hrefs_time * 1000:>9.1f}"
+                  f" {stream_hrefs_time * 1000:>9.1f}")
+    print("all links identical")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,111 @@
+"""Unique pages reached per fetch for every crawl order of the frontier.
+
+Run from the project root:
+    python -m benchmarks.bench_order [--orders dfs,bfs,best] [--pages 2000]
+        [--checkpoints 100,250,500,1000]
+
+Serves a WebGraph from a CacheServer in this process and crawls it once per
+[CRAWLER] ORDER with one thread and POLITENESS 0, so the order alone decides
+which url is fetched next. An order written as best+traps also turns on
+[TRAPS] ENABLED, which is otherwise left as config.ini has it. A fetch counts as a unique page when its page has
+content and is not a duplicate. For every order it reports the unique pages
+after each number of fetches in --checkpoints, the fetches needed to reach
+half and 90% of the unique pages of the whole crawl, and the totals.
+"""
+import os
+import tempfile
+import time
+from argparse import ArgumentParser
+from configparser import ConfigParser
+
+from benchmarks.cache_server import CacheServer
+from benchmarks.webgraph import WebGraph
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def counting_frontier(fetches):
+    """Frontier that appends, for every fetched url, whether it was a unique page."""
+    from crawler.frontier import Frontier
+
+    class CountingFrontier(Frontier):
+        def add_links(self, url, links, freqs=None):
+            fetches.append(bool(freqs))
+            return super().add_links(url, links, freqs)
+
+        def record_yield(self, url):
+            fetches.append(False)
+            super().record_yield(url)
+
+    return CountingFrontier
+
+
+def run_crawl(order, cache_server, workdir):
+    """Crawls the cache server with `order` and returns a list with one bool
+    per fetch, True for unique pages."""
+    from crawler import Crawler
+    from crawler.worker import Worker
+    from utils.config import Config
+
+    cparser = ConfigParser()
+    cparser.read(os.path.join(ROOT, "config.ini"))
+    cparser["CRAWLER"]["POLITENESS"] = "0"
+    order, _, traps = order.partition("+")
+    cparser["CRAWLER"]["ORDER"] = order
+    if traps:
+        cparser["TRAPS"]["ENABLED"] = "true"
+    cparser["LOCAL PROPERTIES"]["THREADCOUNT"] = "1"
+    cparser["LOCAL PROPERTIES"]["SAVE"] = os.path.join(workdir, "frontier.save")
+    cparser["LOCAL PROPERTIES"]["HASHFILE"] = os.path.join(workdir, "fingerprints.bin")
+    cparser["LOCAL PROPERTIES"]["CHECKPOINT"] = os.path.join(workdir, "frontier.ckpt")
+    config = Config(cparser)
+    config.cache_server = cache_server
+
+    fetches = []
+    Crawler(config, True, counting_frontier(fetches), Worker).start()
+    return fetches
+
+
+def fetches_to_reach(fetches, pages):
+    unique = 0
+    for fetch, is_unique in enumerate(fetches, 1):
+        unique += is_unique
+        if unique >= pages:
+            return fetch
+    return len(fetches)
+
+
+def main(args):
+    graph = WebGraph(args.pages, args.seed)
+    server = CacheServer(graph, latency=args.latency)
+    host, port = server.start()
+    checkpoints = [int(n) for n in args.checkpoints.split(",")]
+    print(f"{'order':>10}" + "".join(f" {f'@{n}':>6}" for n in checkpoints)
+          + f" {'50% at':>7} {'90% at':>7} {'unique':>7} {'fetches':>8} {'seconds':>8}")
+    cwd = os.getcwd()
+    for order in args.orders.split(","):
+        with tempfile.TemporaryDirectory() as workdir:
+            # Logs/ and STATS_FILE.txt go to the scratch directory.
+            os.chdir(workdir)
+            try:
+                start = time.perf_counter()
+                fetches = run_crawl(order, (host, port), workdir)
+                elapsed = time.perf_counter() - start
+            finally:
+                os.chdir(cwd)
+        unique = sum(fetches)
+        print(f"{order:>10}" + "".join(f" {sum(fetches[:n]):>6}" for n in checkpoints)
+              + f" {fetches_to_reach(fetches, unique / 2):>7} {fetches_to_reach(fetches, unique * 0.9):>7}"
+              + f" {unique:>7} {len(fetches):>8} {elapsed:>8.1f}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--orders", type=str, default="dfs,bfs,best")
+    parser.add_argument("--pages", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--checkpoints", type=str, default="100,250,500,1000")
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,84 @@
+"""Throughput of the process-pool parse stage against parsing in-process.
+
+Run from the project root:
+    python -m benchmarks.bench_parse_pool [max processes] [pages]
+
+Synthetic pages with ics.uci.edu links and Zipf-distributed words are parsed
+with parse_page, first in this process and then in pools of 1, 2, 4, ... up to
+max processes (default: one per core). Pages/second should grow with the
+number of processes until the cores run out. Every pool's results are
+checked against the in-process ones.
+"""
+import multiprocessing
+import os
+import pickle
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import requests
+
+from crawler.pipeline import parse_page
+
+
+def synthetic_page(seed, links=60, words=800):
+    rand = random.Random(seed)
+    vocabulary = [f"word{i}" for i in range(5000)]
+    body = " ".join(
+        vocabulary[min(len(vocabulary) - 1, int(rand.paretovariate(1.2)) - 1)]
+        for _ in range(words))
+    anchors = "".join(
+        f'<a href="https://www.ics.uci.edu/page/{rand.randrange(100000)}">link</a> '
+        f'<a href="/relative/{rand.randrange(1000)}.html#top">rel</a> '
+        f'<a href="https://www.ics.uci.edu/files/{rand.randrange(1000)}.pdf">pdf</a>'
+        for _ in range(links // 3))
+    html = f"<html><head><title>page {seed}</title></head><body><p>{body}</p>{anchors}</body></html>"
+    return html.encode("utf-8")
+
+
+def jobs(count):
+    for seed in range(count):
+        url = f"https://www.ics.uci.edu/page/{seed}"
+        raw = requests.models.Response()
+        raw.status_code = 200
+        raw.url = url
+        raw._content = synthetic_page(seed)
+        # pages reach the parse stage still pickled, as the cache server sent them
+        yield url, 200, url, pickle.dumps(raw)
+
+
+def parse_serial(pages):
+    return [parse_page(*page) for page in pages]
+
+
+def parse_pool(pages, processes):
+    with ProcessPoolExecutor(
+            processes, mp_context=multiprocessing.get_context("spawn")) as pool:
+        # start the processes before timing
+        list(pool.map(parse_page, *zip(*pages[:processes])))
+        start = time.perf_counter()
+        results = list(pool.map(parse_page, *zip(*pages), chunksize=4))
+        return results, time.perf_counter() - start
+
+
+def main(max_processes, count):
+    pages = list(jobs(count))
+    start = time.perf_counter()
+    expected = parse_serial(pages)
+    serial_time = time.perf_counter() - start
+    print(f"{os.cpu_count()} cores, {count} pages")
+    print(f"{'processes':>10} {'pages/s':>9} {'speedup':>8}")
+    print(f"{'in-process':>10} {count / serial_time:>9.1f} {1.0:>8.2f}")
+
+    counts = [1 << i for i in range(max_processes.bit_length()) if 1 << i < max_processes]
+    for processes in counts + [max_processes]:
+        results, elapsed = parse_pool(pages, processes)
+        assert results == expected, f"results differ with {processes} processes"
+        print(f"{processes:>10} {count / elapsed:>9.1f} {serial_time / elapsed:>8.2f}")
+    print("all results identical")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else os.cpu_count(),
+         int(sys.argv[2]) if len(sys.argv) > 2 else 400)
@@ -0,0 +1,69 @@
+"""Micro-benchmark of SimHasher against generateHashes + getFinalHash.
+
+Run from the project root:
+    python -m benchmarks.bench_simhash [page.html ...]
+
+Without arguments, synthetic pages with Zipf-distributed word counts are used,
+sized like a short page, a typical page, a long page and ~kay/wordlist.txt.
+Saved pages given on the command line are tokenized the same way the crawler
+does. Every fingerprint is checked against the legacy functions.
+"""
+import random
+import sys
+import time
+
+from tokenizer import tokenize, computeWordFrequencies, generateHashes, getFinalHash
+from tokenizer import simhash
+from tokenizer.simhash import SimHasher
+
+PAGE_SIZES = [("short", 50), ("typical", 800), ("long", 5000), ("wordlist", 50000)]
+
+
+def synthetic_freqs(vocabulary, seed=0):
+    rand = random.Random(seed)
+    words = ["w%x%s" % (i, rand.choice("abcdefgh")) for i in range(vocabulary)]
+    return {word: max(1, int(1000 / (rank + 1))) for rank, word in enumerate(words)}
+
+
+def page_freqs(path):
+    from bs4 import BeautifulSoup
+    with open(path, "rb") as f:
+        return computeWordFrequencies(tokenize(BeautifulSoup(f.read(), "html.parser").get_text()))
+
+
+def timed(func, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        res = func()
+        best = min(best, time.perf_counter() - start)
+    return res, best
+
+
+def main(paths):
+    pages = [(path, page_freqs(path)) for path in paths] or [
+        (name, synthetic_freqs(size, seed)) for seed, (name, size) in enumerate(PAGE_SIZES)]
+
+    engines = [("python", False)]
+    if simhash.numpy is not None:
+        engines.append(("numpy", True))
+
+    print(f"{'page':>12} {'tokens':>7} {'legacy ms':>10}"
+          + "".join(f" {name + ' cold':>12} {name + ' warm':>12}" for name, _ in engines))
+    for name, freqs in pages:
+        repeat = 1 if len(freqs) > 10000 else 5
+        legacy, legacy_time = timed(
+            lambda: int(getFinalHash(freqs, generateHashes(freqs)), 2), repeat)
+        row = f"{name[-12:]:>12} {len(freqs):>7} {legacy_time * 1000:>10.2f}"
+        for engine, use_numpy in engines:
+            hasher = SimHasher(use_numpy=use_numpy)
+            cold, cold_time = timed(lambda: hasher.fingerprint(freqs), 1)
+            warm, warm_time = timed(lambda: hasher.fingerprint(freqs), repeat)
+            assert cold == warm == legacy, f"{engine} fingerprint differs on {name}"
+            row += f" {cold_time * 1000:>12.2f} {warm_time * 1000:>12.2f}"
+        print(row)
+    print("all fingerprints identical")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
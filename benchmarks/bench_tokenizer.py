@@ -0,0 +1,102 @@
+"""Parity and speed of the tokenizer and of the text extraction backends.
+
+Run from the project root:
+    python -m benchmarks.bench_tokenizer [page.html ...]
+
+Without arguments, pages of benchmarks.webgraph and a few hand-written edge
+cases (non-ASCII letters that lowercase to ASCII, stop words, short tokens,
+entities, scripts) are used. iterTokens, tokenize, countTokens and
+computeWordFrequencies are checked against the original tokenizer on the
+BeautifulSoup text of every page, and the tokens of every installed text
+backend against html.parser.
+"""
+import re
+import sys
+import time
+from collections import Counter
+
+from bs4 import BeautifulSoup
+
+from benchmarks.webgraph import WebGraph
+from tokenizer import STOP_WORDS, iterTokens, tokenize, countTokens, computeWordFrequencies
+from utils import page as page_module
+
+EDGE_CASES = [
+    b"",
+    b"<html><body></body></html>",
+    "<p>İstanbul Kelvin Straße naïve café ＡＢＣ ABC</p>".encode("utf-8"),
+    b"<p>The and THE a an it's don't aren't ab abc ABCD 123 12 a1b2c3</p>",
+    b"<p>snake_case kebab-case dotted.name e-mail@uci.edu x86_64 &amp;&lt;tag&gt; &copy;2020</p>",
+    b"<head><title>Title words</title><style>p {color: red}</style></head>"
+    b"<body><script>var hidden = 'script words';</script><!-- comment words -->"
+    b"<template>template words</template><p>body<br>words</p>tail words</body>",
+    b"<p>unclosed <b>bold <i>italic</p> stray </div> text",
+]
+
+
+def reference_tokenize(text):
+    """The tokenizer before iterTokens."""
+    tokens = re.findall(r"[a-zA-Z0-9]+", text.lower())
+    return [i.lower() for i in tokens if i.lower() not in STOP_WORDS and len(i.lower()) >= 3]
+
+
+def reference_frequencies(tokens):
+    freq = {}
+    for i in tokens:
+        i = i.lower()
+        if i not in freq:
+            freq[i] = 1
+        else:
+            freq[i] += 1
+    return freq
+
+
+def timed(func, pages):
+    start = time.perf_counter()
+    results = [func(content) for content in pages]
+    return results, time.perf_counter() - start
+
+
+def main(paths):
+    if paths:
+        pages = []
+        for path in paths:
+            with open(path, "rb") as f:
+                pages.append(f.read())
+    else:
+        graph = WebGraph(400)
+        pages = [graph.content(page_id) for page_id in range(400)] + EDGE_CASES
+
+    texts, soup_time = timed(lambda content: BeautifulSoup(content, "html.parser").get_text(), pages)
+    reference, reference_time = timed(reference_tokenize, texts)
+    tokens, tokenize_time = timed(tokenize, texts)
+    counts, count_time = timed(countTokens, texts)
+    for text, expected, got, counted in zip(texts, reference, tokens, counts):
+        assert got == expected, f"tokenize differs on {text[:60]!r}"
+        assert list(iterTokens(text)) == expected, f"iterTokens differs on {text[:60]!r}"
+        assert counted == reference_frequencies(expected), f"countTokens differs on {text[:60]!r}"
+        assert computeWordFrequencies(got) == reference_frequencies(expected)
+        assert countTokens(text.encode("utf-8")) == counted, f"bytes differ on {text[:60]!r}"
+
+    print(f"{len(pages)} pages, {sum(len(t) for t in reference)} tokens")
+    print(f"{'stage':>24} {'ms':>9}")
+    print(f"{'reference tokenize':>24} {reference_time * 1000:>9.1f}")
+    print(f"{'tokenize':>24} {tokenize_time * 1000:>9.1f}")
+    print(f"{'countTokens':>24} {count_time * 1000:>9.1f}")
+    print(f"{'text html.parser':>24} {soup_time * 1000:>9.1f}")
+
+    expected_counts = [Counter(t) for t in reference]
+    for name, extract in sorted(page_module.TEXT_BACKENDS.items()):
+        if extract is None:
+            continue
+        backend_texts, backend_time = timed(extract, pages)
+        differ = sum(
+            1 for text, expected in zip(backend_texts, expected_counts)
+            if text is not None and countTokens(text) != expected)
+        print(f"{'text ' + name:>24} {backend_time * 1000:>9.1f}   {differ} pages with other tokens")
+        assert differ == 0, f"{name} text gives other tokens than html.parser on {differ} pages"
+    print("all tokens identical")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
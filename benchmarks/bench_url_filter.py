@@ -0,0 +1,110 @@
+"""Benchmark of scraper.is_valid against the original uncompiled version.
+
+Run from the project root:
+    python -m benchmarks.bench_url_filter [links.txt | frontier save file]
+
+The corpus is a text file with one link per line, or every url recorded in a
+frontier save file. Without arguments a synthetic corpus mixing the link
+shapes seen on the ICS sites is used. A crawl sees most links many times, so
+the corpus is replayed several times to measure the warm verdict cache too.
+Every verdict is checked against the original function.
+"""
+import random
+import re
+import sys
+import time
+from urllib.parse import urlparse
+
+import scraper
+from crawler.storage import detect_backend, open_storage
+
+REPLAYS = 5
+
+
+def legacy_is_valid(url):
+    parsed = urlparse(url)
+    if parsed.scheme not in set(["http", "https"]):
+        return False
+    new_domain = parsed.netloc.split('.', 1)
+    if len(new_domain) > 1 and new_domain[1] not in set(["ics.uci.edu", "cs.uci.edu", "informatics.uci.edu", "stat.uci.edu"]):
+        return False
+    if re.match(r"/(mailto):.*", parsed.path):
+        return False
+    if re.match(r"/javascript:.*", parsed.path):
+        return False
+    if re.search(r"/(pdf|wp-json)/", parsed.path.lower()):
+        return False
+    if re.search(r"share=", parsed.query.lower()):
+        return False
+    if re.search(r".*\=pdf", parsed.query.lower()):
+        return False
+    return not re.match(
+        r".*\.(css|js|bmp|gif|jpe?g|ico"
+        + r"|png|tiff?|mid|mp2|mp3|mp4"
+        + r"|wav|avi|mov|mpeg|ram|m4v|mkv|ogg|ogv|pdf"
+        + r"|ps|eps|tex|ppt|pptx|doc|docx|xls|xlsx|names"
+        + r"|data|dat|exe|bz2|tar|msi|bin|7z|psd|dmg|iso"
+        + r"|epub|dll|cnf|tgz|sha1"
+        + r"|thmx|mso|arff|rtf|jar|csv"
+        + r"|apk|war|img|ppsx|pps|odc|bib|json|svg|tex|diff|db|ova|ps"
+        + r"|sql|r|m|py|r|c|h|java|scm|sh|ss|nb|ipynb|jsp"
+        + r"|rm|smil|wmv|swf|wma|zip|rar|gz)$", parsed.path.lower())
+
+
+def synthetic_corpus(size=20000, seed=0):
+    rand = random.Random(seed)
+    hosts = ["www.ics.uci.edu", "www.cs.uci.edu", "www.informatics.uci.edu", "www.stat.uci.edu",
+             "vision.ics.uci.edu", "wics.ics.uci.edu", "www.uci.edu", "www.google.com", "ics.uci.edu"]
+    shapes = [
+        "/~{user}/", "/~{user}/pubs/{n}.pdf", "/community/news/view_news?id={n}",
+        "/events/{year}-{month:02d}-{n}/", "/wp-json/wp/v2/posts/{n}", "/pdf/{n}",
+        "/faculty/profiles/view_faculty.php?ucinetid={user}", "/files/{n}.tar.gz",
+        "/img/{n}.JPG", "/{n}/?share=twitter", "/download?format=pdf&id={n}",
+        "/mailto:{user}@uci.edu", "/javascript:void(0)", "/~{user}/teaching/{n}.py",
+        "/doku.php/projects:{user}?do=media&ns={n}", "/a.css/{n}", "/{user}.c/index"]
+    links = []
+    for _ in range(size):
+        path = rand.choice(shapes).format(
+            user=rand.choice(["kay", "eppstein", "pattis", "dillenco", "thornton"]),
+            n=rand.randint(0, 500), year=rand.randint(2015, 2023), month=rand.randint(1, 12))
+        scheme = rand.choice(["https", "https", "http", "ftp"])
+        links.append(f"{scheme}://{rand.choice(hosts)}{path}")
+    return links
+
+
+def load_corpus(path):
+    if detect_backend(path):
+        return [url for url, _ in open_storage(path).values()]
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def run(func, links):
+    start = time.perf_counter()
+    verdicts = [func(link) for link in links]
+    return verdicts, time.perf_counter() - start
+
+
+def main(args):
+    corpus = load_corpus(args[0]) if args else synthetic_corpus()
+    replayed = corpus * REPLAYS
+
+    legacy, legacy_time = run(legacy_is_valid, replayed)
+    scraper.is_valid.cache_clear()
+    cold, cold_time = run(scraper.is_valid, corpus)
+    warm, warm_time = run(scraper.is_valid, replayed)
+    uncached, uncached_time = run(scraper.is_valid.__wrapped__, replayed)
+    assert legacy == warm == uncached and legacy[:len(corpus)] == cold, "verdicts differ"
+
+    per_link = lambda seconds, n: seconds / n * 1e6
+    print(f"{len(corpus)} links, {sum(legacy[:len(corpus)])} valid, replayed {REPLAYS} times")
+    print(f"legacy      {per_link(legacy_time, len(replayed)):8.2f} us/link")
+    print(f"compiled    {per_link(uncached_time, len(replayed)):8.2f} us/link (no cache)")
+    print(f"cold cache  {per_link(cold_time, len(corpus)):8.2f} us/link")
+    print(f"warm cache  {per_link(warm_time, len(replayed)):8.2f} us/link")
+    print(f"batch       {per_link(run(lambda links: scraper.valid_links(links), [replayed])[1], len(replayed)):8.2f} us/link")
+    print("all verdicts identical")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
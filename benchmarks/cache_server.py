@@ -0,0 +1,115 @@
+"""Local stand-in for the spacetime cache server.
+
+Answers `GET /?q=<url>&u=<user agent>` the way the cache server does: a cbor
+dict with the url, the status and, when there is a page, the pickled
+requests.Response holding it. Pages come from a benchmarks.webgraph.WebGraph.
+
+Run from the project root and point the crawler at it:
+    python -m benchmarks.cache_server --port 9000 [--pages 2000] [--latency 0.05]
+    python launch.py --cache_server 127.0.0.1:9000
+"""
+import pickle
+import random
+import sys
+import time
+from argparse import ArgumentParser
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from threading import Thread, Lock
+from urllib.parse import urlparse, parse_qs
+
+import cbor
+import requests
+
+from benchmarks.webgraph import WebGraph
+
+
+def encode(url, page):
+    """Returns the cbor body the cache server sends for url."""
+    if page.content is None:
+        return cbor.dumps({"url": url, "status": page.status, "error": page.error})
+    raw = requests.models.Response()
+    raw.status_code = page.status
+    raw.url = page.final_url
+    raw.encoding = "utf-8"
+    raw.headers["Content-Type"] = "text/html; charset=utf-8"
+    raw._content = page.content
+    return cbor.dumps({"url": url, "status": page.status, "response": pickle.dumps(raw)})
+
+
+class CacheRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # headers and body go out in separate writes, without this every
+    # keep-alive request waits for a delayed ACK
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        if "q" not in query:
+            self.send_error(400, "Missing q")
+            return
+        url = query["q"][0]
+        server = self.server
+        if server.latency:
+            time.sleep(random.expovariate(1 / server.latency))
+        body = encode(url, server.graph.get(url))
+        with server.lock:
+            server.requests += 1
+        self.send_response(200)
+        self.send_header("Content-Type", "application/cbor")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class CacheServer(ThreadingHTTPServer):
+    """HTTP server answering for a WebGraph, one thread per connection.
+
+    Args:
+        graph: WebGraph to serve
+        address: (host, port) to listen on, port 0 picks a free port
+        latency: float, mean seconds added to every answer, exponentially distributed
+
+    """
+    daemon_threads = True
+    # the async engine opens hundreds of connections at once
+    request_queue_size = 1024
+
+    def __init__(self, graph, address=("127.0.0.1", 0), latency=0.0):
+        self.graph = graph
+        self.latency = latency
+        self.lock = Lock()
+        self.requests = 0
+        super().__init__(address, CacheRequestHandler)
+
+    def handle_error(self, request, client_address):
+        # crawlers that time out or exit hang up on requests in progress
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    def start(self):
+        """Serves from a daemon thread, returns the (host, port) to use as cache_server."""
+        Thread(target=self.serve_forever, daemon=True).start()
+        return self.server_address[:2]
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--pages", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--fanout", type=int, default=20)
+    parser.add_argument("--trap_limit", type=int, default=200)
+    args = parser.parse_args()
+    graph = WebGraph(args.pages, args.seed, args.fanout, trap_limit=args.trap_limit)
+    server = CacheServer(graph, (args.host, args.port), args.latency)
+    print(f"Serving {args.pages} pages on {args.host}:{server.server_address[1]}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+"""Deterministic synthetic site graph served by benchmarks.cache_server.
+
+Every url the crawler may ask for maps to a page computed from the url and the
+graph seed alone, so the graph needs no storage and two servers with the same
+parameters serve identical sites. Pages live on the seed hosts of config.ini
+and a few ics.uci.edu subdomains:
+
+    https://<host>                      hub linking to the first pages of the host
+    https://<host>/page/<id>            one of `pages` content pages, id % hosts picks the host
+    https://<host>/events/?date=<day>   calendar trap, each day links to the next
+    https://<host>/archive/sub/sub/...  repeated path segment trap, each level links deeper
+
+A share of the content pages are special:
+    near_dups : copies of an earlier page, exact, as a print view with other
+                markup, or with a few words changed
+    redirects : answer with the content and final url of another page
+    errors    : 403/404/500 answers and 6xx cache server errors
+    large     : pages of `large_bytes` bytes
+    traps     : ordinary pages that also link into one of the traps
+
+A share `aliases` of the links to content pages is spelled another way that
+the server answers with the same page: other case, default port, "." segment,
+percent-escape, tracking or session parameters, or query order.
+
+Traps stop after `trap_limit` pages so a crawl of the graph always ends.
+"""
+import posixpath
+import random
+import zlib
+from collections import namedtuple
+from urllib.parse import urlparse, parse_qs, unquote
+
+HOSTS = [
+    "www.ics.uci.edu", "www.cs.uci.edu", "www.informatics.uci.edu", "www.stat.uci.edu",
+    "vision.ics.uci.edu", "ngs.ics.uci.edu", "wics.ics.uci.edu", "sdcl.ics.uci.edu"]
+
+WORDS = (
+    "research student faculty computer science data learning machine systems "
+    "network software graduate undergraduate course lecture project lab paper "
+    "algorithm theory security database vision language model analysis design "
+    "university informatics statistics engineering seminar event news award "
+    "professor program degree admission career alumni grant robot graph").split()
+
+# Rarer words, each page draws most of them around its own topic.
+SYLLABLES = ["ka", "lo", "mi", "ne", "su", "ta", "ri", "po", "da", "ve", "xu", "zo", "be", "gi", "hu", "fa"]
+VOCABULARY = [a + b + c + d for a in SYLLABLES for b in SYLLABLES for c in SYLLABLES for d in SYLLABLES]
+
+ERROR_STATUSES = [403, 404, 404, 500, 601, 603, 604, 606]
+
+# What the cache server answers for one url.
+#   final_url: url the page was served from, differs from the url on redirects
+#   content: page bytes, None for cache server errors
+#   error: cache server error message for 6xx statuses
+Page = namedtuple("Page", ["status", "final_url", "content", "error"])
+
+
+class WebGraph(object):
+    """Synthetic site graph, see the module docstring.
+
+    Args:
+        pages: int, number of content pages
+        seed: int, graph seed
+        fanout: int, mean number of links on a content page
+        words: int, mean number of words on a content page
+        near_dups: float, share of pages that copy another page
+        redirects: float, share of pages that redirect
+        errors: float, share of pages that answer with an error
+        large: float, share of very large pages
+        large_bytes: int, size of a very large page
+        traps: float, share of pages linking into a trap
+        trap_limit: int, pages in each trap
+        aliases: float, share of links to content pages spelled another way
+
+    """
+    def __init__(self, pages=2000, seed=0, fanout=20, words=600, near_dups=0.05,
+                 redirects=0.02, errors=0.03, large=0.002, large_bytes=2 << 20,
+                 traps=0.01, trap_limit=200, aliases=0.0):
+        self.pages = pages
+        self.seed = seed
+        self.fanout = fanout
+        self.words = words
+        self.near_dups = near_dups
+        self.redirects = redirects
+        self.errors = errors
+        self.large = large
+        self.large_bytes = large_bytes
+        self.traps = traps
+        self.trap_limit = trap_limit
+        self.aliases = aliases
+
+    @property
+    def seed_urls(self):
+        return [f"https://{host}" for host in HOSTS]
+
+    def page_url(self, page_id):
+        return f"https://{HOSTS[page_id % len(HOSTS)]}/page/{page_id}"
+
+    def _random(self, *key):
+        return random.Random(zlib.crc32(repr((self.seed,) + key).encode()))
+
+    def kind(self, page_id):
+        """Returns what page_id is: normal, near_dup, redirect, error, large or trap."""
+        draw = self._random("kind", page_id).random()
+        for kind, share in (("near_dup", self.near_dups), ("redirect", self.redirects),
+                            ("error", self.errors), ("large", self.large), ("trap", self.traps)):
+            draw -= share
+            # the first page has no earlier page to copy or redirect to
+            if draw < 0 and (page_id > 0 or kind not in ("near_dup", "redirect")):
+                return kind
+        return "normal"
+
+    def _word(self, rand, topic):
+        rank = int(rand.paretovariate(1.0)) - 1
+        if rand.random() < 0.4:
+            return WORDS[min(len(WORDS) - 1, rank)]
+        return VOCABULARY[(topic * 97 + rank) % len(VOCABULARY)]
+
+    def _text(self, rand, count, topic):
+        return " ".join(self._word(rand, topic) for _ in range(count))
+
+    def _alias(self, url, rand):
+        """Another spelling of the content page url."""
+        host, path = url[len("https://"):].split("/", 1)
+        draw = rand.randrange(8)
+        if draw == 0:
+            return f"HTTPS://{host.upper()}/{path}"
+        if draw == 1:
+            return f"https://{host}:443/{path}"
+        if draw == 2:
+            return f"https://{host}/./{path}"
+        if draw == 3:
+            return f"https://{host}/%70age/{path[len('page/'):]}"
+        if draw == 4:
+            return f"{url}?utm_source=feed&utm_medium=rss"
+        if draw == 5:
+            return f"{url}?replytocom={rand.randrange(1000)}"
+        if draw == 6:
+            return f"{url};jsessionid={rand.getrandbits(64):016X}"
+        return f"{url}?{rand.choice(['a=1&b=2', 'b=2&a=1'])}"
+
+    def _links(self, rand, page_id, count):
+        host = HOSTS[page_id % len(HOSTS)]
+        links = []
+        for index in range(count):
+            target = rand.randrange(self.pages)
+            draw = rand.random()
+            if draw < 0.5:
+                # drawn apart so that aliases leave the rest of the graph as it is
+                alias = self._random("alias", page_id, index)
+                if self.aliases and alias.random() < self.aliases:
+                    links.append(self._alias(self.page_url(target), alias))
+                else:
+                    links.append(self.page_url(target))
+            elif draw < 0.7:
+                # relative link to a page of the same host
+                same_host = target - target % len(HOSTS) + page_id % len(HOSTS)
+                if same_host >= self.pages:
+                    same_host -= len(HOSTS)
+                links.append(f"/page/{same_host}#section{rand.randrange(3)}")
+            elif draw < 0.8:
+                links.append(f"{self.page_url(target)}/")
+            elif draw < 0.85:
+                links.append(f"https://{host}/files/report{target}.pdf")
+            elif draw < 0.9:
+                links.append(f"https://www.example.com/{target}")
+            elif draw < 0.95:
+                links.append(f"mailto:contact{target}@uci.edu")
+            else:
+                links.append(f"{self.page_url(target)}?share=twitter")
+        return links
+
+    def _html(self, title, text, links):
+        anchors = "\n".join(f'<li><a href="{link}">{link.rsplit("/", 1)[-1]}</a></li>' for link in links)
+        return (
+            f"<html><head><title>{title}</title><script>var page = \"{title}\";</script></head>"
+            f"<body><h1>{title}</h1><p>{text}</p><ul>\n{anchors}\n</ul></body></html>").encode("utf-8")
+
+    def content(self, page_id):
+        """Returns the html of a content page, ignoring its kind."""
+        rand = self._random("page", page_id)
+        words = max(10, int(rand.gauss(self.words, self.words / 3)))
+        links = self._links(rand, page_id, max(0, int(rand.gauss(self.fanout, self.fanout / 3))))
+        host = HOSTS[page_id % len(HOSTS)]
+        kind = self.kind(page_id)
+        if kind == "trap":
+            if rand.random() < 0.5:
+                links.append(f"https://{host}/events/?date=0")
+            else:
+                links.append(f"https://{host}/archive/sub/")
+        if kind == "large":
+            words = self.large_bytes // 8
+        return self._html(f"Page {page_id}", self._text(rand, words, page_id), links)
+
+    def _near_dup(self, page_id):
+        rand = self._random("dup", page_id)
+        original = rand.randrange(page_id)
+        draw = rand.random()
+        if draw < 0.4:
+            return self.content(original)
+        if draw < 0.6:
+            # print view, same text in other markup
+            return self.content(original).replace(b"<p>", b'<p class="print">').replace(
+                b"<ul>", b'<ul class="print">')
+        html = self.content(original).decode("utf-8").split(" ")
+        for _ in range(max(1, len(html) // 50)):
+            html[rand.randrange(len(html))] = rand.choice(WORDS)
+        return " ".join(html).encode("utf-8")
+
+    def _calendar(self, host, day):
+        rand = self._random("calendar", host, day)
+        links = [f"https://{host}/events/?date={day + 1}", f"https://{host}/events/?date={day - 1}"]
+        # each day lists two of the host's few recurring events, so days differ
+        # but soon stop adding new words
+        events = range(self.pages + HOSTS.index(host) * 50, self.pages + HOSTS.index(host) * 50 + 50)
+        text = " ".join(self._text(rand, 150, event) for event in rand.sample(events, 2))
+        return self._html(f"Events on day {day}", text, links)
+
+    def _archive(self, host, depth):
+        rand = self._random("archive", host, depth)
+        path = f"https://{host}/archive" + "/sub" * depth
+        return self._html(f"Archive level {depth}", self._text(rand, 300, rand.randrange(len(VOCABULARY))), [f"{path}/sub/", path.rsplit("/", 1)[0]])
+
+    def get(self, url):
+        """Returns the Page the cache server answers for url."""
+        parsed = urlparse(url)
+        host, path = (parsed.hostname or "").lower(), parsed.path
+        if "%" in path or "/." in path:
+            # answered like a web server does, see aliases
+            path = posixpath.normpath(unquote(path))
+        path = path.rstrip("/")
+        if host not in HOSTS:
+            return Page(404, url, b"<html>Not Found</html>", None)
+        if not path:
+            rand = self._random("hub", host)
+            ids = range(HOSTS.index(host), self.pages, len(HOSTS))
+            return Page(200, url, self._html(
+                host, self._text(rand, self.words, HOSTS.index(host)), [self.page_url(i) for i in ids[:self.fanout]]), None)
+        if path == "/events":
+            date = parse_qs(parsed.query).get("date", ["x"])[0]
+            if date.lstrip("-").isdigit() and abs(int(date)) < self.trap_limit:
+                return Page(200, url, self._calendar(host, int(date)), None)
+        elif path.startswith("/archive"):
+            segments = path.split("/")[2:]
+            if set(segments) <= {"sub"} and len(segments) < self.trap_limit:
+                return Page(200, url, self._archive(host, len(segments)), None)
+        elif path.startswith("/page/") and path[6:].isdigit():
+            page_id = int(path[6:])
+            if page_id < self.pages and HOSTS[page_id % len(HOSTS)] == host:
+                return self._page(url, page_id)
+        return Page(404, url, b"<html>Not Found</html>", None)
+
+    def _page(self, url, page_id):
+        kind = self.kind(page_id)
+        if kind == "near_dup":
+            return Page(200, url, self._near_dup(page_id), None)
+        if kind == "redirect":
+            target = self._random("redirect", page_id).randrange(page_id)
+            return self._page(self.page_url(target), target)._replace(
+                final_url=self.page_url(target))
+        if kind == "error":
+            status = self._random("error", page_id).choice(ERROR_STATUSES)
+            if status >= 600:
+                return Page(status, url, None, f"Cache server error {status} for {url}")
+            return Page(status, url, f"<html>Error {status}</html>".encode("utf-8"), None)
+        return Page(200, url, self.content(page_id), None)
@@ -1,11 +1,18 @@
 from utils import get_logger
+from utils.metrics import start_metrics
+from utils.page import set_text_backend
+from utils.canonical import set_canonical_rules
 from crawler.frontier import Frontier
-from crawler.worker import Worker
+from crawler.worker import Worker, write_statistics
 
 class Crawler(object):
     def __init__(self, config, restart, frontier_factory=Frontier, worker_factory=Worker):
         self.config = config
         self.logger = get_logger("CRAWLER")
+        # before the frontier, which registers its gauges
+        self.metrics = start_metrics(config)
+        self.logger.info(f"Extracting page text with {set_text_backend(config.text_backend)}.")
+        set_canonical_rules(config.canonical_enabled, config.canonical_drop_params)
         self.frontier = frontier_factory(config, restart)
         self.workers = list()
         self.worker_factory = worker_factory
@@ -13,10 +20,17 @@ class Crawler(object):
     def start_async(self):
         self.workers = [
             self.worker_factory(worker_id, self.config, self.frontier)
-            for worker_id in range(self.config.threads_count)]
+            for worker_id in range(self.worker_count())]
         for worker in self.workers:
             worker.start()
 
+    def worker_count(self):
+        # With an adaptive window, workers that fetch one page at a time are
+        # started for the largest window, the window decides how many fetch.
+        if getattr(self.worker_factory, "one_fetch_per_thread", False):
+            return self.config.fetch_threads
+        return self.config.threads_count
+
     def start(self):
         self.start_async()
         self.join()
@@ -24,3 +38,12 @@ class Crawler(object):
     def join(self):
         for worker in self.workers:
             worker.join()
+        # Stops what the workers share, such as the parse processes.
+        shutdown = getattr(self.worker_factory, "shutdown", None)
+        if shutdown is not None:
+            shutdown()
+        write_statistics(self.frontier)
+        close = getattr(self.frontier, "close", None)
+        if close is not None:
+            close()
+        self.metrics.stop()
@@ -0,0 +1,336 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Thread
+from urllib.parse import urlencode
+
+import cbor
+
+from utils import get_logger
+from utils.response import Response
+from utils.download import (
+    NO_RESPONSE_STATUS, TOO_LARGE_STATUS, CHUNK_SIZE, ResponseTooLarge, backoff_delay)
+from utils.concurrency import get_controller
+from utils.metrics import get_metrics
+from crawler.worker import process_response
+
+# Longest time to sleep while only pages in flight on other workers can add
+# more urls.
+POLL_INTERVAL = 0.05
+# Pages per parse thread that may wait for or be in parsing before new
+# downloads pause.
+PARSE_BACKLOG = 2
+
+
+class ConnectionPool(object):
+    """Idle keep-alive connections to the cache server, for the fetches of
+    one event loop.
+
+    Args:
+        config : Config object with cache_server and connect_timeout set
+        size : most idle connections kept open
+
+    """
+    def __init__(self, config, size):
+        self.config = config
+        self.size = size
+        self.idle = []
+
+    async def get(self):
+        """Returns (reader, writer, whether the connection was used before)."""
+        while self.idle:
+            reader, writer = self.idle.pop()
+            if not writer.is_closing() and not reader.at_eof():
+                return reader, writer, True
+            writer.close()
+        host, port = self.config.cache_server
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(host, port), self.config.connect_timeout)
+        return reader, writer, False
+
+    def put(self, reader, writer):
+        if len(self.idle) < self.size and not writer.is_closing():
+            self.idle.append((reader, writer))
+        else:
+            writer.close()
+
+    def close(self):
+        for _, writer in self.idle:
+            writer.close()
+        self.idle = []
+
+
+def _parse_head(head):
+    lines = head.decode("latin-1").split("\r\n")
+    status = int(lines[0].split()[1])
+    headers = {}
+    for line in lines[1:]:
+        if ":" in line:
+            name, value = line.split(":", 1)
+            headers[name.strip().lower()] = value.strip()
+    keep_alive = (lines[0].startswith("HTTP/1.1")
+                  and headers.get("connection", "").lower() != "close")
+    return status, headers, keep_alive
+
+
+async def _read_body(reader, headers, max_bytes):
+    """Returns (body, whether the connection can carry another request)."""
+    if headers.get("transfer-encoding", "").lower() == "chunked":
+        chunks = []
+        total = 0
+        while True:
+            size = int((await reader.readline()).split(b";")[0], 16)
+            if size == 0:
+                break
+            total += size
+            if max_bytes and total > max_bytes:
+                raise ResponseTooLarge(total)
+            chunks.append(await reader.readexactly(size))
+            await reader.readexactly(2)
+        # trailers, up to the empty line that ends the response
+        while (await reader.readline()).strip():
+            pass
+        return b"".join(chunks), True
+    if "content-length" in headers:
+        length = int(headers["content-length"])
+        if max_bytes and length > max_bytes:
+            raise ResponseTooLarge(length)
+        return await reader.readexactly(length), True
+    chunks = []
+    total = 0
+    while True:
+        chunk = await reader.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        total += len(chunk)
+        if max_bytes and total > max_bytes:
+            raise ResponseTooLarge(total)
+        chunks.append(chunk)
+    return b"".join(chunks), False
+
+
+async def fetch(url, config, pool=None):
+    """Asynchronous counterpart of utils.download.download.
+
+    Sends the same query to the cache server over a plain asyncio stream and
+    returns the raw status code and body, decoding is left to the caller.
+    With a pool the request goes over a keep-alive connection of the pool,
+    and a pooled connection the server closed meanwhile is replaced by a new
+    one. Without a pool it opens a connection for this request only. It is
+    not retried, see AsyncWorker._download.
+
+    Args:
+        url : url to download from the cache server
+        config : Config object with cache_server and user_agent set
+        pool : ConnectionPool of the calling event loop, or None
+
+    Returns:
+        tuple : (http status code, body bytes)
+
+    Raises:
+        ResponseTooLarge : the body is larger than MAXBYTES, it is not read
+
+    """
+    host, port = config.cache_server
+    query = urlencode([("q", f"{url}"), ("u", f"{config.user_agent}")])
+    request = (
+        f"GET /?{query} HTTP/1.1\r\n"
+        f"Host: {host}:{port}\r\n"
+        f"Accept-Encoding: identity\r\n"
+        f"Connection: {'keep-alive' if pool is not None else 'close'}\r\n\r\n").encode("latin-1")
+    while True:
+        if pool is not None:
+            reader, writer, reused = await pool.get()
+        else:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(host, port), config.connect_timeout)
+            reused = False
+        reusable = False
+        try:
+            try:
+                writer.write(request)
+                await writer.drain()
+                head = await reader.readuntil(b"\r\n\r\n")
+            except (ConnectionError, asyncio.IncompleteReadError):
+                if reused:
+                    # closed by the server while idle, nothing was answered
+                    continue
+                raise
+            status, headers, keep_alive = _parse_head(head)
+            body, complete = await _read_body(reader, headers, config.max_bytes)
+            reusable = pool is not None and keep_alive and complete
+            return status, body
+        finally:
+            if reusable:
+                pool.put(reader, writer)
+            else:
+                writer.close()
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+def decode(url, status, body, logger):
+    """Builds a Response exactly like utils.download.download does."""
+    try:
+        if body:
+            return Response(cbor.loads(body))
+    except (EOFError, ValueError):
+        pass
+    logger.error(f"Spacetime Response error {status} with url {url}.")
+    return Response({
+        "error": f"Spacetime Response error {status} with url {url}.",
+        "status": status,
+        "url": url})
+
+
+class AsyncWorker(Thread):
+    """Worker that keeps many downloads in flight on one asyncio event loop.
+
+    Urls come from the frontier's non-blocking try_get_tbd_url, so the same
+    per-host politeness applies as with thread workers. At most
+    ASYNCFETCHES pages are in flight at once, and decoding and
+    process_response run on a pool of PARSEWORKERS threads so parsing never
+    stalls the event loop. New downloads pause while PARSE_BACKLOG pages per
+    parse thread wait for or are in parsing, so pages do not pile up
+    downloaded but unparsed. Requests reuse keep-alive connections to the
+    cache server, and failed downloads are retried like thread workers retry
+    them. Use it with `launch.py --engine async`.
+    """
+    def __init__(self, worker_id, config, frontier):
+        self.logger = get_logger(f"AsyncWorker-{worker_id}", "Worker")
+        self.config = config
+        self.frontier = frontier
+        super().__init__(daemon=True)
+
+    def run(self):
+        asyncio.run(self._crawl())
+
+    async def _crawl(self):
+        loop = asyncio.get_running_loop()
+        slots = asyncio.Semaphore(self.config.async_fetches)
+        controller = get_controller(self.config)
+        self.pool = ConnectionPool(self.config, self.config.async_fetches)
+        # Downloaded pages waiting for or in parsing. Downloads in flight stay
+        # under window, which grows while the pages they bring find fewer
+        # than backlog unparsed pages and shrinks while they find more.
+        self.unparsed = 0
+        self.downloading = 0
+        self.backlog = PARSE_BACKLOG * self.config.parse_workers
+        self.window = self.backlog
+        self.room = asyncio.Event()
+        self.room.set()
+        with ThreadPoolExecutor(self.config.parse_workers) as executor:
+            tasks = set()
+            while True:
+                await self.room.wait()
+                await slots.acquire()
+                # ASYNCFETCHES bounds the controller's window
+                while not controller.try_acquire():
+                    freed = loop.create_future()
+                    if controller.on_slot_free(
+                            lambda: loop.call_soon_threadsafe(_resolve, freed)):
+                        await freed
+                get_metrics().profile_checkpoint()
+                url, wait = self.frontier.try_get_tbd_url()
+                if url is None:
+                    controller.release()
+                    slots.release()
+                    if wait is None:
+                        self.logger.info("Frontier is empty. Stopping Crawler.")
+                        break
+                    if tasks and self.config.threads_count == 1:
+                        # only pages of this worker can add urls or free a host
+                        await asyncio.wait(
+                            set(tasks), timeout=wait if wait != float("inf") else None,
+                            return_when=asyncio.FIRST_COMPLETED)
+                    else:
+                        await asyncio.sleep(min(wait, POLL_INTERVAL))
+                    continue
+                self.downloading += 1
+                self._update_room()
+                task = loop.create_task(self._handle(url, slots, controller, executor))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            await asyncio.gather(*tasks)
+        self.pool.close()
+
+    async def _handle(self, url, slots, controller, executor):
+        loop = asyncio.get_running_loop()
+        try:
+            try:
+                status, body, latency = await self._download(url, controller)
+            finally:
+                controller.release()
+                self.downloading -= 1
+            if self.unparsed < self.backlog:
+                self.window = min(self.config.async_fetches, self.window + 1)
+            else:
+                self.window = max(1, self.window - 1)
+            self.unparsed += 1
+            self._update_room()
+            try:
+                await loop.run_in_executor(
+                    executor, self._process, url, status, body, latency)
+            finally:
+                self.unparsed -= 1
+                self._update_room()
+        finally:
+            slots.release()
+
+    def _update_room(self):
+        if self.unparsed < self.backlog and self.downloading < self.window:
+            self.room.set()
+        else:
+            self.room.clear()
+
+    async def _download(self, url, controller):
+        """Fetches url, retrying connection errors, timeouts and 5xx answers
+        with the backoff of utils.download.DownloadClient.
+
+        Returns:
+            tuple : (status, body, latency of the last attempt)
+
+        """
+        for attempt in range(self.config.retries + 1):
+            if attempt:
+                await asyncio.sleep(backoff_delay(self.config, attempt - 1))
+            start = time.monotonic()
+            error = None
+            try:
+                status, body = await asyncio.wait_for(
+                    fetch(url, self.config, self.pool), self.config.read_timeout)
+            except ResponseTooLarge as e:
+                self.logger.warning(f"Skipped {url}, {e} is over {self.config.max_bytes} bytes.")
+                latency = time.monotonic() - start
+                controller.observe(latency, False)
+                return TOO_LARGE_STATUS, b"", latency
+            except (OSError, ValueError, IndexError, asyncio.IncompleteReadError,
+                    asyncio.TimeoutError) as e:
+                status, body, error = NO_RESPONSE_STATUS, b"", e
+            latency = time.monotonic() - start
+            failed = status == NO_RESPONSE_STATUS or status >= 500
+            controller.observe(latency, failed)
+            if not failed:
+                break
+            reason = repr(error) if error is not None else status
+            self.logger.warning(f"Attempt {attempt + 1} for {url} failed: {reason}.")
+        if error is not None:
+            self.logger.error(f"Failed to download {url}: {error!r}")
+        return status, body, latency
+
+    def _process(self, url, status, body, latency):
+        try:
+            resp = decode(url, status, body, self.logger)
+            resp.latency = latency
+            self.logger.info(
+                f"Downloaded {url}, status <{resp.status}>, "
+                f"using cache {self.config.cache_server} in {latency:.3f}s.")
+            get_metrics().observe("download", latency)
+            process_response(self.frontier, url, resp, self.logger)
+        except Exception as e:
+            # Same as Worker.process, the url must not stay in flight.
+            self.logger.error(f"Failed to process {url}: {e!r}")
+            self.frontier.mark_url_complete(url)
@@ -0,0 +1,54 @@
+import os
+import pickle
+import struct
+import zlib
+
+# magic, format version, payload length, crc32 of the payload
+MAGIC = b"CRAWLCKP"
+VERSION = 2
+HEADER = struct.Struct(">8sHQI")
+
+
+class CheckpointError(Exception):
+    ''' The checkpoint file is torn, corrupt or of another format version. '''
+
+
+def write_checkpoint(path, state):
+    ''' Atomically replaces the checkpoint at path with the pickled state.
+    The file is a fixed header followed by the payload, and is fsynced
+    before it replaces the previous checkpoint. '''
+    payload = pickle.dumps(state, pickle.HIGHEST_PROTOCOL)
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(payload), zlib.crc32(payload)))
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return len(payload) + HEADER.size
+
+
+def read_checkpoint(path):
+    ''' Returns the state saved by write_checkpoint, None if there is no
+    checkpoint at path. Raises CheckpointError if it cannot be used. '''
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        header = f.read(HEADER.size)
+        if len(header) < HEADER.size:
+            raise CheckpointError(f"{path} is too short for a checkpoint")
+        magic, version, length, crc = HEADER.unpack(header)
+        if magic != MAGIC:
+            raise CheckpointError(f"{path} is not a checkpoint")
+        if version != VERSION:
+            raise CheckpointError(f"{path} has version {version}, expected {VERSION}")
+        payload = f.read(length)
+    if len(payload) != length or zlib.crc32(payload) != crc:
+        raise CheckpointError(f"{path} is truncated or corrupt")
+    return pickle.loads(payload)
+
+
+def remove_checkpoint(path):
+    for name in (path, f"{path}.tmp"):
+        if os.path.exists(name):
+            os.remove(name)
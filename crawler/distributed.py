@@ -0,0 +1,364 @@
+import json
+import os
+import subprocess
+import sys
+import time
+from collections import namedtuple
+from hashlib import blake2b
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from threading import Thread, Lock, Condition, Event
+from urllib.parse import urlparse
+
+import requests
+
+from utils import get_logger, get_urldigest
+from utils.canonical import canonicalize
+from utils.cuckoo import ScalableCuckooFilter
+from crawler.checkpoint import read_checkpoint, write_checkpoint
+from crawler.frontier import Frontier
+from crawler.statistics import CrawlStatistics
+from tokenizer.fingerprints import FingerprintStore, HASH_BYTES
+
+# Written by every node into its directory when it closes, read by merge_nodes.
+NODE_RESULT = "node_result.bin"
+# Enough for write_statistics to write the merged report. crossNodeDuplicates
+# counts the pages near-duplicates of a page of another node, which the merged
+# statistics still include.
+MergedCrawl = namedtuple(
+    "MergedCrawl", ["statistics", "uniquePages", "crossNodeDuplicates"], defaults=[0])
+
+
+def partition(url, nodes):
+    ''' Node that owns url: a hash of its host, so that one node holds the
+    whole queue and politeness state of a host. blake2b rather than hash()
+    or xxhash, so every node computes the same partition. '''
+    host = urlparse(url).netloc.lower().encode("utf-8")
+    return int.from_bytes(blake2b(host, digest_size=8).digest(), "big") % nodes
+
+
+def local_addresses(nodes, port):
+    ''' Addresses of `nodes` nodes on this machine, on consecutive ports. '''
+    return [("127.0.0.1", port + node) for node in range(nodes)]
+
+
+class Outbox(object):
+    ''' Batches of urls waiting to be forwarded to the nodes that own them.
+
+    A sender thread posts a peer's batch once it holds BATCH urls or its
+    oldest url waited FLUSHINTERVAL seconds. Batches a peer did not accept,
+    for example because it has not started yet, are retried, never dropped.
+    '''
+    def __init__(self, config, node_id, addresses, logger):
+        self.config = config
+        self.node_id = node_id
+        self.addresses = addresses
+        self.logger = logger
+        self.lock = Lock()
+        self.ready = Condition(self.lock)
+        self.batches = {peer: list() for peer in range(len(addresses))}
+        self.oldest = dict()
+        # Urls in a batch being posted, so the outbox is not empty meanwhile.
+        self.posting = 0
+        self.sent = 0
+        self.stopped = Event()
+        self.session = requests.Session()
+        self.thread = Thread(target=self._run, name="outbox", daemon=True)
+        self.thread.start()
+
+    def put(self, peer, url):
+        with self.lock:
+            batch = self.batches[peer]
+            if not batch:
+                self.oldest[peer] = time.monotonic()
+            batch.append(url)
+            if len(batch) >= self.config.node_batch:
+                self.ready.notify()
+
+    def empty(self):
+        with self.lock:
+            return not self.posting and not any(self.batches.values())
+
+    def _due(self):
+        now = time.monotonic()
+        for peer, batch in self.batches.items():
+            if batch and (len(batch) >= self.config.node_batch
+                          or now - self.oldest[peer] >= self.config.node_flush_interval):
+                return peer
+        return None
+
+    def _post(self, peer, batch):
+        host, port = self.addresses[peer]
+        try:
+            resp = self.session.post(
+                f"http://{host}:{port}/links", timeout=self.config.read_timeout,
+                data=json.dumps({"from": self.node_id, "urls": batch}))
+            resp.raise_for_status()
+            return True
+        except requests.RequestException as e:
+            self.logger.warning(f"Could not forward {len(batch)} urls to node {peer}: {e!r}")
+            return False
+
+    def _run(self):
+        while not self.stopped.is_set():
+            with self.lock:
+                peer = self._due()
+                if peer is None:
+                    self.ready.wait(self.config.node_flush_interval / 2)
+                    continue
+                batch, self.batches[peer] = self.batches[peer], list()
+                self.posting = len(batch)
+            posted = self._post(peer, batch)
+            with self.lock:
+                self.posting = 0
+                if posted:
+                    self.sent += len(batch)
+                else:
+                    self.batches[peer][:0] = batch
+                    self.oldest[peer] = time.monotonic()
+            if not posted:
+                self.stopped.wait(self.config.node_flush_interval)
+
+    def stop(self):
+        self.stopped.set()
+        with self.lock:
+            self.ready.notify()
+        self.thread.join()
+
+
+class NodeRequestHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, body):
+        body = json.dumps(body).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path != "/status":
+            self.send_error(404)
+            return
+        self._reply(self.server.frontier.status())
+
+    def do_POST(self):
+        if self.path != "/links":
+            self.send_error(404)
+            return
+        message = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.frontier.receive(message["urls"])
+        self._reply({"received": len(message["urls"])})
+
+
+class NodeServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, frontier, address):
+        self.frontier = frontier
+        super().__init__(address, NodeRequestHandler)
+
+
+class PartitionedFrontier(Frontier):
+    ''' Frontier of one node of a distributed crawl.
+
+    Urls are partitioned across the nodes by the hash of their host (see
+    partition). A node only queues and fetches the urls it owns, with its
+    own save file and politeness state, and forwards every other discovered
+    url in batches to its owner over HTTP. Each node serves POST /links for
+    the batches of the others and GET /status for termination detection.
+
+    The crawl is over once every node is idle, i.e. has nothing queued, in
+    flight or waiting to be forwarded, and the urls sent and received by all
+    nodes add up, on two polls in a row that see the same counts. A node
+    only becomes busy again by receiving urls, which changes the counts.
+
+    Near-duplicates are only detected within a node during the crawl. On
+    close each node writes its statistics to NODE_RESULT for merge_nodes.
+    '''
+    def __init__(self, config, restart):
+        self.node_id = config.node_id
+        self.addresses = config.node_addresses
+        self.node_logger = get_logger(f"NODE-{self.node_id}", "NODE")
+        self.outbox = Outbox(config, self.node_id, self.addresses, self.node_logger)
+        # Urls forwarded before, so each is sent to its owner once.
+        self.forwarded = ScalableCuckooFilter(config.seen_capacity, config.seen_error_rate)
+        self.received = 0
+        self.cluster_done = False
+        self.peer_done = set()
+        super().__init__(config, restart)
+        self.server = NodeServer(self, self.addresses[self.node_id])
+        Thread(target=self.server.serve_forever, name="node-http", daemon=True).start()
+        self.detector = Thread(target=self._detect_termination, name="termination", daemon=True)
+        self.detector.start()
+        self.node_logger.info(
+            f"Node {self.node_id} of {len(self.addresses)} serving on "
+            f"{self.addresses[self.node_id][0]}:{self.addresses[self.node_id][1]}.")
+
+    def add_url(self, url, depth=1, novelty=None):
+        url = canonicalize(url)
+        owner = partition(url, len(self.addresses))
+        if owner == self.node_id:
+            return super().add_url(url, depth, novelty)
+        with self.lock:
+            if not self.forwarded.add(get_urldigest(url)):
+                return False
+        self.outbox.put(owner, url)
+        return False
+
+    def receive(self, urls):
+        ''' Queues urls forwarded by another node, ranked as if found on a seed. '''
+        for url in urls:
+            super().add_url(url)
+        with self.lock:
+            self.received += len(urls)
+
+    def _idle(self):
+        with self.lock:
+            return Frontier._crawl_finished(self) and self.outbox.empty()
+
+    def status(self):
+        with self.lock:
+            return {"node": self.node_id, "idle": self._idle(), "done": self.cluster_done,
+                    "sent": self.outbox.sent, "received": self.received}
+
+    def _poll(self, session):
+        ''' Returns the status of every node, None if a node cannot be reached. '''
+        statuses = []
+        for peer, (host, port) in enumerate(self.addresses):
+            if peer == self.node_id:
+                statuses.append(self.status())
+                continue
+            try:
+                resp = session.get(f"http://{host}:{port}/status", timeout=self.config.read_timeout)
+                resp.raise_for_status()
+                status = resp.json()
+            except (requests.RequestException, ValueError):
+                if peer not in self.peer_done:
+                    return None
+                # a node that saw the crawl end may have exited already
+                status = {"idle": True, "done": True}
+            statuses.append(status)
+            if status["done"]:
+                self.peer_done.add(peer)
+        return statuses
+
+    def _detect_termination(self):
+        session = requests.Session()
+        previous = None
+        while not self.cluster_done:
+            time.sleep(self.config.node_flush_interval)
+            if not self._idle():
+                previous = None
+                continue
+            statuses = self._poll(session)
+            if statuses is None:
+                previous = None
+                continue
+            if any(status["done"] for status in statuses):
+                done = True
+            else:
+                counts = [(status["sent"], status["received"]) for status in statuses]
+                balanced = (all(status["idle"] for status in statuses)
+                            and sum(s for s, _ in counts) == sum(r for _, r in counts))
+                done = balanced and counts == previous
+                previous = counts if balanced else None
+            if done:
+                with self.lock:
+                    self.cluster_done = True
+                    self.host_ready.notify_all()
+                self.node_logger.info(
+                    f"All {len(self.addresses)} nodes are idle, node {self.node_id} "
+                    f"sent {self.outbox.sent} and received {self.received} urls.")
+
+    def _crawl_finished(self):
+        return super()._crawl_finished() and self.cluster_done
+
+    def close(self):
+        self.outbox.stop()
+        write_checkpoint(NODE_RESULT, {
+            "node": self.node_id,
+            "unique_pages": self.uniquePages,
+            "statistics": self.statistics.dumps(),
+            "hash_file": os.path.abspath(self.config.hash_file)})
+        super().close()
+        # Serve status a little longer, for nodes that have not polled since.
+        time.sleep(3 * self.config.node_flush_interval)
+        self.server.shutdown()
+
+
+def node_directory(config, node):
+    return os.path.join(config.node_directory, f"node{node}")
+
+
+def merge_nodes(config, directories, logger):
+    ''' Merges the statistics and fingerprints of finished nodes.
+
+    Nodes only keep their statistics summed up, not per page, so the words,
+    subdomains and longest page of a page that is a near-duplicate of a page
+    on another node stay counted. A single node would have skipped it. The
+    number of such pages is returned and written to the report.
+
+    Returns:
+        MergedCrawl : statistics and unique pages of the whole crawl
+
+    '''
+    statistics = CrawlStatistics(config.stats_merge, config.top_words_capacity)
+    unique_pages = 0
+    fingerprints = FingerprintStore(
+        config.hash_file, config.similarity_threshold, config.simhash_bands, restart=True)
+    cross_node = 0
+    for directory in directories:
+        result = read_checkpoint(os.path.join(directory, NODE_RESULT))
+        if result is None:
+            logger.error(f"Node in {directory} left no {NODE_RESULT}, its pages are not counted.")
+            continue
+        statistics.merge(result["statistics"])
+        unique_pages += result["unique_pages"]
+        if os.path.exists(result["hash_file"]):
+            with open(result["hash_file"], "rb") as f:
+                data = f.read()
+            for offset in range(0, len(data) - len(data) % HASH_BYTES, HASH_BYTES):
+                cross_node += fingerprints.check_and_add(
+                    int.from_bytes(data[offset:offset + HASH_BYTES], "big"))
+    fingerprints.close()
+    logger.info(
+        f"Merged {len(directories)} nodes: {unique_pages} pages, {len(fingerprints)} "
+        f"fingerprints, {cross_node} pages near-duplicates of pages on other nodes.")
+    return MergedCrawl(statistics, unique_pages, cross_node)
+
+
+def run_local_nodes(config_file, config, restart, engine, nodes, recrawl=False):
+    ''' Runs `nodes` crawler nodes as processes of launch.py on this machine,
+    each in its own directory under [DISTRIBUTED] DIRECTORY, and merges
+    their results once all exit.
+
+    Returns:
+        MergedCrawl : statistics and unique pages of the whole crawl
+
+    '''
+    logger = get_logger("NODES")
+    host, port = config.cache_server
+    launch = os.path.abspath(sys.argv[0])
+    directories = [node_directory(config, node) for node in range(nodes)]
+    processes = []
+    for node, directory in enumerate(directories):
+        os.makedirs(directory, exist_ok=True)
+        if os.path.exists(os.path.join(directory, NODE_RESULT)):
+            os.remove(os.path.join(directory, NODE_RESULT))
+        command = [
+            sys.executable, launch, "--config_file", os.path.abspath(config_file),
+            "--engine", engine, "--cache_server", f"{host}:{port}",
+            "--nodes", str(nodes), "--node", str(node)]
+        if recrawl:
+            command.append("--recrawl")
+        elif restart:
+            command.append("--restart")
+        processes.append(subprocess.Popen(command, cwd=directory))
+    logger.info(f"Started {nodes} nodes in {config.node_directory}.")
+    for node, process in enumerate(processes):
+        if process.wait() != 0:
+            logger.error(f"Node {node} exited with status {process.returncode}.")
+    return merge_nodes(config, directories, logger)
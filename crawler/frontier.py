@@ -1,79 +1,535 @@
-import os
-import shelve
-
-from threading import Thread, RLock
+import time
+from heapq import heappush, heappop, heapify
+from threading import Thread, RLock, Condition, local
 from queue import Queue, Empty
 from collections import defaultdict
+from urllib.parse import urlparse
 
-from utils import get_logger, get_urlhash, normalize
+from utils import get_logger, get_urldigest
+from utils.canonical import canonicalize
+from utils.cuckoo import ScalableCuckooFilter
+from utils.metrics import get_metrics
 from scraper import is_valid
+from crawler.storage import open_storage, remove_storage, storage_exists
+from crawler.checkpoint import (
+    CheckpointError, read_checkpoint, write_checkpoint, remove_checkpoint)
+from crawler.statistics import CrawlStatistics
+from crawler.traps import TrapDetector, DEFER, DROP
+from crawler.priority import get_order
+from crawler.history import PageHistory, PageRecord
+from crawler.records import RecordLog, CrawlRecord
+from tokenizer.fingerprints import FingerprintStore
+from tokenizer.duplicates import DuplicateDetector, TIERS
 
 class Frontier(object):
+    """ Thread-safe frontier that schedules downloads per host.
+
+    Urls wait in one heap per host, ranked by the crawl order ORDER (see
+    crawler/priority.py). Hosts wait in a heap ordered by the time they may
+    next be fetched, so a host is fetched at most once per POLITENESS seconds
+    while different hosts are fetched concurrently. Once that time has come
+    a host moves to a heap of due hosts ranked by their best url, and workers
+    take the best url of the best due host. Pushing and popping a url is
+    O(log n). get_tbd_url blocks until some host is due, and only returns
+    None once nothing is queued and no worker still holds a url that may add
+    more.
+
+    Every CHECKPOINTINTERVAL seconds and on close, the queued and in-flight
+    urls, the seen filter and the statistics are written to a checkpoint
+    together with the sequence number of the last save file write. A resume
+    loads the checkpoint and replays only the save file writes made after
+    it, instead of scanning the whole save file. Statistics counted after
+    the last checkpoint are lost if the crawler crashes.
+
+    With a page history (see crawler/history.py), every fetched page is
+    recorded with its content digest, links and tokens. A recrawl starts
+    from the seeds again, but a url whose page is not due for a visit is not
+    queued: its last visit is replayed instead, counting its tokens and
+    queueing its links as if it had been fetched. A due page whose content
+    did not change is replayed the same way instead of being parsed. Replays
+    run without the frontier lock, so workers keep fetching meanwhile.
+
+    Every processed page, replayed pages included, is also appended to the
+    record log (see crawler/records.py), from which report.py builds the
+    report while the crawl runs or after it.
+    """
     def __init__(self, config, restart):
         self.logger = get_logger("FRONTIER")
         self.config = config
-        self.to_be_downloaded = list()
+        self.lock = RLock()
+        self.host_ready = Condition(self.lock)
+        # host -> heap of (deferred, rank, sequence, url, depth)
+        self.host_queues = defaultdict(list)
+        # (time host may be fetched next, host) for every host with queued
+        # urls that is not due yet.
+        self.ready_hosts = list()
+        # (deferred, rank, sequence, host) for due hosts, an entry is current
+        # while due[host] holds its key, older entries are skipped.
+        self.due_hosts = list()
+        self.due = dict()
+        self.next_fetch = dict()
+        # Urls handed to workers and not completed yet, with their depth.
+        self.in_flight = dict()
+        self.queued = 0
+        self.sequence = 0
         self.uniquePages = 0
-        self.words = {}
-        self.longest_web_page = 0
-        self.subdomains = defaultdict(int)
-        self.longest_URL = ""
+        self.metrics = get_metrics()
+        self.metrics.gauge("frontier_size", lambda: self.queued)
+        self.metrics.gauge("frontier_hosts", lambda: len(self.host_queues))
+        self.metrics.gauge("in_flight", lambda: len(self.in_flight))
+        self.metrics.gauge("seen_urls", lambda: len(self.seen))
+        self.metrics.gauge("unique_pages", lambda: self.uniquePages)
+        # Words, subdomains and longest page for the report.
+        self.statistics = CrawlStatistics(
+            self.config.stats_merge, self.config.top_words_capacity)
 
-        if not os.path.exists(self.config.save_file) and not restart:
+        if not storage_exists(self.config.save_file) and not restart:
             # Save file does not exist, but request to load save.
             self.logger.info(
                 f"Did not find save file {self.config.save_file}, "
                 f"starting from seed.")
-        elif os.path.exists(self.config.save_file) and restart:
+        elif storage_exists(self.config.save_file) and restart:
             # Save file does exists, but request to start from seed.
             self.logger.info(
                 f"Found save file {self.config.save_file}, deleting it.")
-            os.remove(self.config.save_file)
+            remove_storage(self.config.save_file)
+        if restart:
+            remove_checkpoint(self.config.checkpoint_file)
+        self.last_checkpoint = time.monotonic()
+        # In-memory set of every url in the save file, so most membership
+        # checks never touch disk. May have false positives, see add_url.
+        self.seen = ScalableCuckooFilter(
+            self.config.seen_capacity, self.config.seen_error_rate)
         # Load existing save file, or create one if it does not exist.
-        self.save = shelve.open(self.config.save_file)
+        # Writes are group committed, see crawler/storage.py.
+        self.save = open_storage(
+            self.config.save_file, self.config.storage,
+            self.config.flush_batch, self.config.flush_interval)
+        # Simhash fingerprints of unique pages, shared by all workers.
+        self.fingerprints = FingerprintStore(
+            self.config.hash_file, self.config.similarity_threshold,
+            self.config.simhash_bands, restart)
+        # Digests of checked pages, rejects exact copies before the simhash.
+        self.duplicates = DuplicateDetector()
+        for tier in TIERS:
+            self.metrics.gauge(
+                f"duplicate_check_{tier}", lambda tier=tier: self.duplicates.hits[tier])
+        # Yield of every url template, defers or drops urls of crawl traps.
+        self.traps = TrapDetector(self.config) if self.config.traps_enabled else None
+        self.order = get_order(self.config, self.traps)
+        # Every token of the crawl, for the share of a page's tokens that are new.
+        self.vocabulary = set()
+        # What earlier crawls found on every page, for launch.py --recrawl.
+        self.history = None
+        if self.config.history_enabled:
+            if restart and not self.config.recrawl:
+                remove_storage(self.config.history_file)
+            self.history = PageHistory(self.config.history_file, self.config)
+            if self.config.recrawl:
+                self.logger.info(
+                    f"Recrawling with {len(self.history)} pages in history "
+                    f"{self.config.history_file}.")
+        # A record per processed page, for report.py.
+        self.records = None
+        if self.config.records_enabled:
+            self.records = RecordLog(
+                self.config.records_directory, self.config.records_segment_bytes, restart)
+        # Urls replayed from the history, see _replay_pending.
+        self.pending_replays = []
+        self.local = local()
         if restart:
             for url in self.config.seed_urls:
-                self.add_url(url)
+                self.add_url(url, depth=0)
         else:
-            # Set the frontier state with contents of save file.
-            self._parse_save_file()
+            # Set the frontier state with contents of the checkpoint and
+            # save file, or of the save file alone.
+            if not self._load_checkpoint():
+                self._parse_save_file()
             if not self.save:
                 for url in self.config.seed_urls:
-                    self.add_url(url)
+                    self.add_url(url, depth=0)
 
     def _parse_save_file(self):
-        ''' This function can be overridden for alternate saving techniques. '''
+        ''' This function can be overridden for alternate saving techniques.
+        self.save is either a shelve or a SQLite save file, whichever wrote it.
+        The save file does not keep how urls were found, they are ranked as
+        if found on a seed. '''
         total_count = len(self.save)
         tbd_count = 0
-        for url, completed in self.save.values():
-            if not completed and is_valid(url):
-                self.to_be_downloaded.append(url)
-                tbd_count += 1
+        with self.lock:
+            for urlhash, (url, completed) in self.save.items():
+                self.seen.add(bytes.fromhex(urlhash))
+                if not completed and is_valid(url):
+                    self._enqueue(url)
+                    tbd_count += 1
         self.logger.info(
             f"Found {tbd_count} urls to be downloaded from {total_count} "
             f"total urls discovered.")
 
-    def get_tbd_url(self):
+    def _load_checkpoint(self):
+        ''' Restores the state saved by checkpoint() and replays the save file
+        writes made since. Returns False if there is no usable checkpoint. '''
+        if self.save.seq is None:
+            return False
+        start = time.monotonic()
         try:
-            self.uniquePages += 1
-            return self.to_be_downloaded.pop()
-        except IndexError:
-            return None
-
-    def add_url(self, url):
-        url = normalize(url)
-        urlhash = get_urlhash(url)
-        if urlhash not in self.save:
-            self.save[urlhash] = (url, False)
+            state = read_checkpoint(self.config.checkpoint_file)
+        except (CheckpointError, OSError) as e:
+            self.logger.warning(f"Ignoring checkpoint: {e}")
+            return False
+        if state is None:
+            return False
+        if state["seq"] > self.save.seq:
+            self.logger.warning(
+                f"Ignoring checkpoint {self.config.checkpoint_file}, it is newer "
+                f"than save file {self.config.save_file}.")
+            return False
+        completed = set()
+        discovered = []
+        with self.lock:
+            self.seen = state["seen"]
+            for urlhash, (url, done) in self.save.changes_since(state["seq"]):
+                if done:
+                    completed.add(url)
+                else:
+                    self.seen.add(bytes.fromhex(urlhash))
+                    if is_valid(url):
+                        discovered.append(url)
+            self.sequence = state["sequence"]
+            for host, queue in state["queues"].items():
+                if completed:
+                    queue = [entry for entry in queue if entry[3] not in completed]
+                    heapify(queue)
+                if queue:
+                    self.host_queues[host] = queue
+                    self.queued += len(queue)
+                    heappush(self.ready_hosts, (0.0, host))
+            # Urls in flight at the checkpoint are fetched again.
+            for url, depth in state["in_flight"]:
+                if url not in completed:
+                    self._enqueue(url, depth=depth)
+            for url in discovered:
+                if url not in completed:
+                    self._enqueue(url)
+            self.uniquePages = state["unique_pages"]
+            self.statistics.loads(state["statistics"])
+        self.logger.info(
+            f"Resumed from checkpoint {self.config.checkpoint_file} with "
+            f"{self.queued} urls to be downloaded, replayed {len(completed)} "
+            f"completed and {len(discovered)} discovered urls since, "
+            f"in {time.monotonic() - start:.2f}s.")
+        return True
+
+    def checkpoint(self):
+        ''' Writes the frontier and statistics to the checkpoint file. Workers
+        wait while it is written. '''
+        if self.save.seq is None:
+            # Shelve save files cannot replay the writes after a checkpoint.
+            return
+        start = time.monotonic()
+        with self.lock:
+            # The checkpoint must not be ahead of the durable save file.
             self.save.sync()
-            self.to_be_downloaded.append(url)
+            state = {
+                "seq": self.save.seq,
+                "queues": {host: list(queue) for host, queue in self.host_queues.items()},
+                "sequence": self.sequence,
+                "in_flight": list(self.in_flight.items()),
+                # In-flight urls are handed out again after a resume.
+                "unique_pages": self.uniquePages - len(self.in_flight),
+                "seen": self.seen,
+                "statistics": self.statistics.dumps()}
+            size = write_checkpoint(self.config.checkpoint_file, state)
+            self.last_checkpoint = time.monotonic()
+        self.metrics.observe("checkpoint", self.last_checkpoint - start)
+        self.logger.info(
+            f"Wrote checkpoint of {self.queued} queued urls, {size} bytes, "
+            f"in {self.last_checkpoint - start:.2f}s.")
+
+    def _enqueue(self, url, defer=False, depth=1, novelty=None):
+        ''' Queues url in its host's heap with the rank the crawl order gives
+        it, behind every url that is not deferred if defer. '''
+        host = urlparse(url).netloc.lower()
+        self.sequence += 1
+        entry = (defer, self.order.rank(url, depth, novelty, self.sequence),
+                 self.sequence, url, depth)
+        queue = self.host_queues[host]
+        heappush(queue, entry)
+        self.queued += 1
+        if len(queue) == 1:
+            heappush(self.ready_hosts, (self.next_fetch.get(host, 0.0), host))
+            self.host_ready.notify()
+        elif host in self.due and queue[0] is entry:
+            # The host is due and has a new best url.
+            self._make_due(host)
+
+    def _make_due(self, host):
+        defer, rank, sequence = self.host_queues[host][0][:3]
+        key = (defer, self.order.host_rank(host, rank), sequence)
+        self.due[host] = key
+        heappush(self.due_hosts, key + (host,))
+
+    def _pop_ready_url(self):
+        ''' Returns (url, None) if a host is due, otherwise (None, seconds until
+        the next host is due), or (None, None) if no host has queued urls. '''
+        now = time.monotonic()
+        while self.ready_hosts and self.ready_hosts[0][0] <= now:
+            self._make_due(heappop(self.ready_hosts)[1])
+        while self.due_hosts:
+            entry = heappop(self.due_hosts)
+            host = entry[3]
+            if self.due.get(host) == entry[:3]:
+                break
+        else:
+            if not self.ready_hosts:
+                return None, None
+            return None, self.ready_hosts[0][0] - now
+        del self.due[host]
+        queue = self.host_queues[host]
+        url, depth = heappop(queue)[3:]
+        self.queued -= 1
+        self.next_fetch[host] = now + self.config.time_delay
+        if queue:
+            heappush(self.ready_hosts, (self.next_fetch[host], host))
+        else:
+            del self.host_queues[host]
+        self.order.fetched(host)
+        self.in_flight[url] = depth
+        return url, None
+
+    def _crawl_finished(self):
+        return not self.host_queues and not self.in_flight
+
+    def try_get_tbd_url(self):
+        ''' Non-blocking get_tbd_url for engines that cannot block a thread.
+
+        Returns (url, None) if a url is ready, (None, None) once the crawl is
+        over, otherwise (None, seconds to wait before asking again), which is
+        infinite while only urls in flight can add more work. '''
+        with self.lock:
+            url, wait = self._pop_ready_url()
+            if url is not None:
+                self.uniquePages += 1
+                return url, None
+            if self._crawl_finished():
+                # Nothing left to crawl, make everything durable.
+                self.save.sync()
+                self.host_ready.notify_all()
+                return None, None
+            return None, wait if wait is not None else float("inf")
+
+    def get_tbd_url(self):
+        with self.metrics.timer("frontier_get"), self.lock:
+            while True:
+                url, wait = self.try_get_tbd_url()
+                if url is not None or wait is None:
+                    return url
+                self.host_ready.wait(wait if wait != float("inf") else None)
+
+    def add_url(self, url, depth=1, novelty=None):
+        ''' Queues the canonical form of url (see utils/canonical.py) unless
+        it was seen before or is dropped as part of a crawl trap. Returns True
+        if url was new and queued.
+
+        Args:
+            url : url to queue
+            depth : number of links from a seed to url
+            novelty : share of new tokens on the page url was found on,
+                      None if unknown
+
+        '''
+        url = canonicalize(url)
+        urldigest = get_urldigest(url)
+        urlhash = urldigest.hex()
+        replay = False
+        with self.metrics.timer("frontier_add"), self.lock:
+            if urldigest in self.seen:
+                # Almost certainly seen before. Only ask the save file when a
+                # false positive must not drop a new url.
+                if not self.config.seen_verify or urlhash in self.save:
+                    return False
+            self.seen.add(urldigest)
+            verdict = self.traps.check(url) if self.traps is not None else None
+            if verdict == DROP:
+                # Kept out of the save file, seen only so that it is not
+                # judged again every time it is linked.
+                return False
+            self.save[urlhash] = (url, False)
+            self.metrics.inc("urls_discovered")
+            if self.config.recrawl:
+                record = self.history.get(urlhash)
+                if record is not None and not self.history.due(record):
+                    # In flight until it is replayed, so the crawl does not
+                    # end meanwhile.
+                    self.uniquePages += 1
+                    self.in_flight[url] = depth
+                    self.pending_replays.append((url, record))
+                    replay = True
+            if not replay:
+                self._enqueue(url, verdict == DEFER, depth, novelty)
+        if replay:
+            self._replay_pending()
+        return True
+
+    def _replay(self, url, record):
+        ''' Counts the page of url from its last visit, without fetching or
+        parsing it. The page is counted under the url it was served from,
+        like record_page. Called without the lock. '''
+        self.duplicates.check_raw(record.digest)
+        if record.fingerprint is not None:
+            self.fingerprints.add(record.fingerprint)
+            self.statistics.record_page(record.url, record.length, record.freqs, record.subdomain)
+        if self.records is not None:
+            duplicate = record.fingerprint is None
+            self.records.append(CrawlRecord(
+                url, record.url, 200, duplicate, 0 if duplicate else record.length,
+                None if duplicate else record.subdomain, record.digest, record.fingerprint,
+                None if duplicate else record.freqs))
+        self.add_links(url, record.links, record.freqs)
+
+    def _replay_pending(self):
+        ''' Replays the urls in pending_replays, and the urls not due among
+        their links, in turn rather than recursively. Only the pops hold the
+        lock. Returns at once in a thread that already replays, or that is
+        in add_links, which replays once it released the lock. '''
+        if getattr(self.local, "replay_later", False):
+            return
+        self.local.replay_later = True
+        try:
+            while True:
+                with self.lock:
+                    if not self.pending_replays:
+                        return
+                    url, record = self.pending_replays.pop()
+                try:
+                    self._replay(url, record)
+                finally:
+                    self.mark_url_complete(url)
+                self.metrics.inc("recrawl_replayed")
+        finally:
+            self.local.replay_later = False
+
+    def reuse_unchanged(self, url, content_digest):
+        ''' Completes a fetched url from its last visit if its content did not
+        change since, instead of parsing the page again.
+
+        Returns:
+            bool : True if url was completed, False if it has no history or
+                   its content changed
+
+        '''
+        if self.history is None:
+            return False
+        urlhash = get_urldigest(url).hex()
+        record = self.history.get(urlhash)
+        if record is None or record.digest != content_digest:
+            return False
+        self.history.visit(urlhash, record._replace(fetched=time.time()), record)
+        self._replay(url, record)
+        self.mark_url_complete(url)
+        self.metrics.inc("recrawl_unchanged")
+        return True
+
+    def record_page(self, url, status, duplicate, content_digest=None, fingerprint=None,
+                    links=(), freqs=None, length=0, subdomain=None, final_url=None):
+        ''' Records what a fetched page held in the record log and the
+        history, whichever are enabled.
+
+        Args:
+            url : url that was fetched
+            status : status of the response
+            duplicate : the page is a duplicate, or has no content
+            content_digest : digest() of the page content, None for pages
+                             without content, which the history skips
+            fingerprint : simhash of the page, None if it is a duplicate
+            links, freqs, length, subdomain : what was scraped and counted
+                                              from the page
+            final_url : url the page was served from, if not url
+
+        '''
+        if self.records is not None:
+            self.records.append(CrawlRecord(
+                url, final_url or url, status, duplicate, length, subdomain,
+                content_digest, fingerprint, freqs or None))
+        if self.history is None or content_digest is None:
+            return
+        urlhash = get_urldigest(url).hex()
+        previous = self.history.get(urlhash)
+        self.history.visit(urlhash, PageRecord(
+            final_url or url, content_digest, fingerprint, list(links), dict(freqs) if freqs else None,
+            length, subdomain, time.time(), 0, 0, 0), previous)
+        if previous is not None:
+            # Unchanged pages were completed by reuse_unchanged.
+            self.metrics.inc("recrawl_changed")
+
+    def _new_token_ratio(self, freqs):
+        vocabulary = self.vocabulary
+        new = [token for token in freqs if token not in vocabulary]
+        vocabulary.update(new)
+        return len(new) / len(freqs)
+
+    def add_links(self, url, links, freqs=None):
+        ''' Queues the outlinks of the fetched url, ranked with its depth and
+        the share of its tokens new to the crawl, and scores what it added to
+        the crawl for trap detection. Called before mark_url_complete. Links
+        whose pages are replayed from the history are replayed after the
+        lock is released.
+
+        Args:
+            url : url that was fetched
+            links : urls scraped from its page
+            freqs : Map<token, count> of its page, empty for pages without content
+
+        Returns:
+            int : number of links that were new and queued
+
+        '''
+        replay_later = getattr(self.local, "replay_later", False)
+        self.local.replay_later = True
+        try:
+            with self.lock:
+                novelty = self._new_token_ratio(freqs) if freqs else None
+                depth = self.in_flight.get(url, 0) + 1
+                new_links = sum(self.add_url(link, depth, novelty or 0.0) for link in links)
+                if self.traps is not None:
+                    self.traps.record_page(url, novelty, new_links, len(links))
+        finally:
+            self.local.replay_later = replay_later
+        self._replay_pending()
+        return new_links
+
+    def record_yield(self, url):
+        ''' Scores a fetched url that added nothing to the crawl, such as a
+        duplicate, for trap detection. Called before mark_url_complete. '''
+        if self.traps is not None:
+            self.traps.record_page(url)
 
     def mark_url_complete(self, url):
-        urlhash = get_urlhash(url)
-        if urlhash not in self.save:
-            # This should not happen.
-            self.logger.error(
-                f"Completed url {url}, but have not seen it before.")
-
-        self.save[urlhash] = (url, True)
-        self.save.sync()
+        urldigest = get_urldigest(url)
+        with self.metrics.timer("frontier_complete"), self.lock:
+            if urldigest not in self.seen:
+                # This should not happen.
+                self.logger.error(
+                    f"Completed url {url}, but have not seen it before.")
+
+            self.save[urldigest.hex()] = (url, True)
+            self.in_flight.pop(url, None)
+            if not self.in_flight:
+                # Waiting workers may now be able to tell the crawl is over.
+                self.host_ready.notify_all()
+            if (self.config.checkpoint_interval
+                    and time.monotonic() - self.last_checkpoint >= self.config.checkpoint_interval):
+                self.checkpoint()
+
+    def close(self):
+        self.logger.info(self.duplicates.summary())
+        if self.traps is not None:
+            for line in self.traps.summary():
+                self.logger.info(f"Trap template {line}")
+        self.checkpoint()
+        self.save.close()
+        self.fingerprints.close()
+        if self.history is not None:
+            self.history.close()
+        if self.records is not None:
+            self.records.close()
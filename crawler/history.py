@@ -0,0 +1,126 @@
+import pickle
+import sqlite3
+import time
+import zlib
+from collections import namedtuple
+
+from crawler.storage import GroupCommitStorage
+from tokenizer.fingerprints import HASH_BYTES
+
+DAY = 86400.0
+
+# What the last visit of a url found.
+#   url: url the page was served from, after redirects
+#   digest: digest() of the page content
+#   fingerprint: simhash of the page, None if it was a duplicate
+#   links, freqs, length, subdomain: what process_response got from the page,
+#       empty for duplicates
+#   fetched: time.time() of the last visit
+#   interval: seconds after fetched the page is due again
+#   visits, changes: number of visits, and of visits that found new content
+PageRecord = namedtuple("PageRecord", [
+    "url", "digest", "fingerprint", "links", "freqs", "length", "subdomain",
+    "fetched", "interval", "visits", "changes"])
+
+
+def _signed(value):
+    ''' 64-bit unsigned digest as the signed integer SQLite stores. '''
+    return value - (1 << 64) if value is not None and value >= 1 << 63 else value
+
+
+def _unsigned(value):
+    return value + (1 << 64) if value is not None and value < 0 else value
+
+
+def _fingerprint_bytes(fingerprint):
+    return fingerprint.to_bytes(HASH_BYTES, "big") if fingerprint is not None else None
+
+
+def _fingerprint_int(data):
+    return int.from_bytes(data, "big") if data is not None else None
+
+
+class PageHistory(GroupCommitStorage):
+    ''' SQLite table of what every fetched page held at its last visit, kept
+    across crawls for launch.py --recrawl.
+
+    A page is due again `interval` seconds after its last visit. The first
+    visit sets the interval to INTERVAL days, a visit that finds the same
+    content doubles it and a visit that finds new content halves it, within
+    MININTERVAL and MAXINTERVAL days, so pages are revisited about as often
+    as they change. Writes are group committed like the save file.
+
+    Args:
+        path : path of the history file
+        config : Config object with the [RECRAWL] settings
+
+    '''
+    def __init__(self, path, config):
+        super().__init__(config.flush_batch, config.flush_interval)
+        self.interval = config.recrawl_interval * DAY
+        self.min_interval = config.recrawl_min_interval * DAY
+        self.max_interval = config.recrawl_max_interval * DAY
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            "urlhash TEXT PRIMARY KEY, url TEXT NOT NULL, digest INTEGER, fingerprint BLOB, "
+            "page BLOB, fetched REAL NOT NULL, interval REAL NOT NULL, "
+            "visits INTEGER NOT NULL, changes INTEGER NOT NULL)")
+        self.db.commit()
+
+    def _write(self, urlhash, record):
+        page = zlib.compress(pickle.dumps(
+            (record.links, record.freqs, record.length, record.subdomain),
+            pickle.HIGHEST_PROTOCOL))
+        self.db.execute(
+            "INSERT OR REPLACE INTO pages (urlhash, url, digest, fingerprint, page, fetched, "
+            "interval, visits, changes) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (urlhash, record.url, _signed(record.digest), _fingerprint_bytes(record.fingerprint), page,
+             record.fetched, record.interval, record.visits, record.changes))
+
+    def _flush(self):
+        self.db.commit()
+
+    def get(self, urlhash):
+        ''' Returns the PageRecord of the url with hash urlhash, None if it was
+        never fetched. '''
+        with self.lock:
+            row = self.db.execute(
+                "SELECT url, digest, fingerprint, page, fetched, interval, visits, changes "
+                "FROM pages WHERE urlhash = ?", (urlhash,)).fetchone()
+        if row is None:
+            return None
+        url, digest, fingerprint, page, fetched, interval, visits, changes = row
+        links, freqs, length, subdomain = pickle.loads(zlib.decompress(page))
+        return PageRecord(url, _unsigned(digest), _fingerprint_int(fingerprint), links, freqs, length,
+                          subdomain, fetched, interval, visits, changes)
+
+    def due(self, record, now=None):
+        return (now or time.time()) >= record.fetched + record.interval
+
+    def visit(self, urlhash, record, previous=None):
+        ''' Stores the record of a visit and schedules the next one from
+        whether the content changed since the previous record. '''
+        if previous is None:
+            record = record._replace(interval=self.interval, visits=1, changes=0)
+        elif previous.digest == record.digest:
+            record = record._replace(
+                interval=min(self.max_interval, previous.interval * 2),
+                visits=previous.visits + 1, changes=previous.changes)
+        else:
+            record = record._replace(
+                interval=max(self.min_interval, previous.interval / 2),
+                visits=previous.visits + 1, changes=previous.changes + 1)
+        self[urlhash] = record
+        return record
+
+    def __len__(self):
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.sync()
+            self.db.close()
@@ -0,0 +1,196 @@
+import multiprocessing
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from threading import Thread, Lock, BoundedSemaphore
+
+from utils import get_logger
+from utils.download import download
+from utils.concurrency import get_controller
+from utils.metrics import get_metrics
+from utils.page import ParsedPage, set_text_backend
+from utils.canonical import set_canonical_rules
+from utils.response import Response
+from tokenizer import getFingerprint
+from tokenizer.duplicates import digest, text_digest
+import scraper
+
+# What a parse process sends back to the crawler, all plain picklable values.
+#   check_duplicate: the page goes through the simhash check
+#   fingerprint: simhash of the page, None when the check rejects it outright
+#   raw_digest, text_digest: keys of the page in the DuplicateDetector tiers
+ParseResult = namedtuple("ParseResult", [
+    "check_duplicate", "fingerprint", "raw_digest", "text_digest",
+    "links", "length", "freqs", "url", "subdomain", "status"])
+
+_pool = None
+_pool_lock = Lock()
+
+
+def parse_page(url, status, final_url, pickled):
+    """Everything process_response computes from a page, without touching
+    the frontier. Runs in a parse process.
+
+    Args:
+        url : url that was downloaded
+        status : status of the response
+        final_url : resp.url, the actual url of the page
+        pickled : pickled requests.Response as sent by the cache server,
+            None if the response had none
+
+    Returns:
+        ParseResult : outlinks, statistics and fingerprint of the page
+
+    """
+    resp = Response({"url": final_url, "status": status, "response": pickled})
+    page = ParsedPage(resp)
+
+    check_duplicate = resp.status == 200
+    fingerprint = page_digest = page_text_digest = None
+    if check_duplicate and page.has_content and page.content != "":
+        # same test as checkSimilarity, without the lookups
+        page_digest = digest(page.content)
+        page_text_digest = text_digest(page.text)
+        fingerprint = getFingerprint(page.freqs)
+
+    links = scraper.scraper(url, resp, page)
+    length = scraper.getLengthOfResponseContent(resp, page)
+    freqs = page.freqs if resp.status == 200 and page.has_content else {}
+    is_subdomain, subdomain = scraper.checkSubdomain(url, resp)
+    return ParseResult(
+        check_duplicate, fingerprint, page_digest, page_text_digest, links, length, freqs, resp.url,
+        subdomain.netloc if is_subdomain else None, resp.status)
+
+
+def apply_parse_result(frontier, tbd_url, result, logger):
+    """Applies a ParseResult to the frontier and statistics, the way
+    process_response would have. Runs in the crawler process."""
+    metrics = get_metrics()
+    with metrics.timer("similarity"):
+        duplicate = result.check_duplicate and (
+            result.fingerprint is None
+            or frontier.duplicates.check_raw(result.raw_digest)
+            or frontier.duplicates.check_text(result.text_digest))
+        if result.check_duplicate and not duplicate:
+            duplicate = frontier.fingerprints.check_and_add(result.fingerprint)
+            frontier.duplicates.record_near(duplicate)
+    if duplicate:
+        logger.info(f"URL {tbd_url} found to be duplicate")
+        metrics.inc("duplicates")
+        frontier.record_page(tbd_url, result.status, True, result.raw_digest, final_url=result.url)
+        frontier.record_yield(tbd_url)
+        frontier.mark_url_complete(tbd_url)
+        return
+    with metrics.timer("statistics"):
+        frontier.statistics.record_page(result.url, result.length, result.freqs, result.subdomain)
+    frontier.record_page(
+        tbd_url, result.status, False, result.raw_digest, result.fingerprint, result.links,
+        result.freqs, result.length, result.subdomain, result.url)
+    frontier.add_links(tbd_url, result.links, result.freqs)
+    frontier.mark_url_complete(tbd_url)
+
+
+def init_parse_process(text_backend, canonical_enabled, canonical_drop_params):
+    """Sets up a parse process to scrape pages the way this process does."""
+    set_text_backend(text_backend)
+    set_canonical_rules(canonical_enabled, canonical_drop_params)
+
+
+def get_parse_pool(config):
+    """Returns the process pool shared by all PipelineWorkers, created on
+    first use. Processes are spawned, not forked, since the crawler already
+    runs threads holding locks when the pool starts."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                config.parse_processes or os.cpu_count(),
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=init_parse_process,
+                initargs=(config.text_backend, config.canonical_enabled, config.canonical_drop_params))
+        return _pool
+
+
+def shutdown_parse_pool():
+    """Stops the parse processes once no PipelineWorker is running."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
+
+
+class PipelineWorker(Thread):
+    """Fetch thread that hands parsing to a process pool.
+
+    The worker only downloads. Page content goes to a ProcessPoolExecutor of
+    PARSEPROCESSES processes, which run parse_page outside the GIL, and the
+    results are applied to the frontier back in this process. At most
+    PARSEQUEUE pages, shared by all workers, wait for or sit in the pool, so
+    fetch threads block instead of buffering pages without bound.
+    Use it with `launch.py --engine process`.
+    """
+    one_fetch_per_thread = True
+    queue_slots = None
+    queue_slots_lock = Lock()
+
+    def __init__(self, worker_id, config, frontier):
+        self.logger = get_logger(f"PipelineWorker-{worker_id}", "Worker")
+        self.config = config
+        self.frontier = frontier
+        with PipelineWorker.queue_slots_lock:
+            if PipelineWorker.queue_slots is None:
+                PipelineWorker.queue_slots = BoundedSemaphore(
+                    config.parse_queue or 2 * (config.parse_processes or os.cpu_count()))
+        super().__init__(daemon=True)
+
+    @staticmethod
+    def shutdown():
+        """Called by Crawler.join once every worker finished."""
+        shutdown_parse_pool()
+
+    def run(self):
+        pool = get_parse_pool(self.config)
+        metrics = get_metrics()
+        controller = get_controller(self.config)
+        while True:
+            metrics.profile_checkpoint()
+            with controller.slot():
+                tbd_url = self.frontier.get_tbd_url()
+                if not tbd_url:
+                    self.logger.info("Frontier is empty. Stopping Crawler.")
+                    break
+                resp = download(tbd_url, self.config, self.logger)
+            self.logger.info(
+                f"Downloaded {tbd_url}, status <{resp.status}>, "
+                f"using cache {self.config.cache_server} in {resp.latency:.3f}s.")
+            metrics.observe("download", resp.latency)
+            metrics.inc("pages")
+            metrics.inc("responses", status=resp.status)
+            if resp.status != 200:
+                metrics.inc("non_200")
+            # Still pickled, the parse process decodes it, not this one.
+            pickled = resp.pickled
+            if (self.frontier.history is not None and resp.status == 200
+                    and resp.content is not None
+                    and self.frontier.reuse_unchanged(tbd_url, digest(resp.content))):
+                self.logger.info(f"URL {tbd_url} did not change since its last visit")
+                continue
+            with metrics.timer("parse_queue_wait"):
+                self.queue_slots.acquire()
+            future = pool.submit(parse_page, tbd_url, resp.status, resp.url, pickled)
+            future.add_done_callback(
+                lambda future, tbd_url=tbd_url, submitted=time.perf_counter():
+                self._apply(tbd_url, future, submitted))
+
+    def _apply(self, tbd_url, future, submitted):
+        # parse time in the pool, including the wait for a free process
+        get_metrics().observe("parse_process", time.perf_counter() - submitted)
+        try:
+            apply_parse_result(self.frontier, tbd_url, future.result(), self.logger)
+        except Exception as e:
+            self.logger.error(f"Failed to parse {tbd_url}: {e!r}")
+            self.frontier.mark_url_complete(tbd_url)
+        finally:
+            self.queue_slots.release()
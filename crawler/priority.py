@@ -0,0 +1,88 @@
+from collections import Counter
+
+
+class DepthFirstOrder(object):
+    ''' Newest url first, the order of the original stack frontier.
+
+    An order ranks every queued url, lower ranks are fetched first. rank is
+    called when a url is queued, with the depth of the url (seeds are 0) and
+    the novelty of the page it was found on, the share of its tokens new to
+    the crawl, or None if unknown. host_rank ranks a host by the rank of its
+    best url when it may be fetched again. fetched is called for every url
+    handed to a worker.
+
+    Args:
+        config : Config object with the [CRAWLER] settings
+        traps : TrapDetector of the frontier, or None
+
+    '''
+    def __init__(self, config, traps):
+        pass
+
+    def rank(self, url, depth, novelty, sequence):
+        return -sequence
+
+    def host_rank(self, host, rank):
+        return rank
+
+    def fetched(self, host):
+        pass
+
+
+class BreadthFirstOrder(DepthFirstOrder):
+    ''' Shallowest url first, oldest first at the same depth. '''
+    def rank(self, url, depth, novelty, sequence):
+        return depth
+
+
+class BestFirstOrder(DepthFirstOrder):
+    ''' Most promising url first.
+
+    A url's value is the product of the novelty of the page it was found on,
+    the relative yield of its template in trap detection (pages of templates
+    that keep giving duplicates and known words are worth less) and
+    1 / (1 + DEPTHWEIGHT * depth). When a host may be fetched again, the value
+    of its best url is divided by 1 + HOSTWEIGHT * the host's share of the
+    fetched pages relative to the average host, so that no host starves the
+    others of workers.
+    '''
+    # Keeps a url of a page without new words or of a poor template above 0,
+    # so its depth still counts.
+    FLOOR = 0.1
+
+    def __init__(self, config, traps):
+        self.traps = traps
+        self.depth_weight = config.order_depth_weight
+        self.host_weight = config.order_host_weight
+        self.host_pages = Counter()
+        self.pages = 0
+
+    def rank(self, url, depth, novelty, sequence):
+        value = self.FLOOR + (1.0 if novelty is None else novelty)
+        if self.traps is not None:
+            value *= self.FLOOR + min(2.0, self.traps.relative_yield(url))
+        return -value / (1 + self.depth_weight * depth)
+
+    def host_rank(self, host, rank):
+        if not self.pages:
+            return rank
+        balance = self.host_pages[host] * len(self.host_pages) / self.pages
+        return rank / (1 + self.host_weight * balance)
+
+    def fetched(self, host):
+        self.host_pages[host] += 1
+        self.pages += 1
+
+
+ORDERS = {
+    "dfs": DepthFirstOrder,
+    "bfs": BreadthFirstOrder,
+    "best": BestFirstOrder,
+}
+
+
+def get_order(config, traps):
+    ''' Returns the crawl order named by [CRAWLER] ORDER. '''
+    if config.crawl_order not in ORDERS:
+        raise ValueError(f"Unknown crawl order {config.crawl_order}, expected one of {sorted(ORDERS)}")
+    return ORDERS[config.crawl_order](config, traps)
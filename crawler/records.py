@@ -0,0 +1,177 @@
+import os
+import struct
+import sys
+import zlib
+from array import array
+from collections import namedtuple
+from threading import Lock
+
+from tokenizer.fingerprints import HASH_BYTES
+
+# Every segment starts with magic and format version.
+MAGIC = b"CRAWLREC"
+VERSION = 1
+SEGMENT_HEADER = struct.Struct(">8sH")
+# Every record is framed by the length and crc32 of its zlib compressed payload.
+FRAME = struct.Struct(">II")
+# status, flags, length, digest, fingerprint, then the byte lengths of url,
+# final url and subdomain and the number of tokens, followed by those bytes,
+# the tokens joined by newlines and their counts as little-endian uint32.
+PAYLOAD = struct.Struct(">HBIQ%dsIIII" % HASH_BYTES)
+DUPLICATE, HAS_DIGEST, HAS_FINGERPRINT = 1, 2, 4
+SEGMENT_PREFIX = "segment-"
+SEGMENT_SUFFIX = ".log"
+
+# One processed page, see Frontier.record_page.
+#   final_url: url the page was served from, the url of the longest page
+#   duplicate: the page was not counted, neither its words nor its subdomain
+#   digest, fingerprint: content digest and simhash of the page, or None
+#   freqs: Map<token, count> of the page, None if there is none
+CrawlRecord = namedtuple("CrawlRecord", [
+    "url", "final_url", "status", "duplicate", "length", "subdomain",
+    "digest", "fingerprint", "freqs"])
+
+
+class RecordLogError(Exception):
+    ''' A segment of the record log is not of this format version. '''
+
+
+def encode_record(record):
+    url = record.url.encode("utf-8")
+    final_url = b"" if record.final_url in (None, record.url) else record.final_url.encode("utf-8")
+    subdomain = (record.subdomain or "").encode("utf-8")
+    freqs = record.freqs or {}
+    tokens = "\n".join(freqs).encode("utf-8")
+    counts = array("I", freqs.values())
+    if sys.byteorder == "big":
+        counts.byteswap()
+    flags = ((DUPLICATE if record.duplicate else 0)
+             | (HAS_DIGEST if record.digest is not None else 0)
+             | (HAS_FINGERPRINT if record.fingerprint is not None else 0))
+    head = PAYLOAD.pack(
+        record.status, flags, record.length, record.digest or 0,
+        (record.fingerprint or 0).to_bytes(HASH_BYTES, "big"),
+        len(url), len(final_url), len(subdomain), len(freqs))
+    return zlib.compress(b"".join((head, url, final_url, subdomain, tokens, counts.tobytes())), 1)
+
+
+def decode_record(data):
+    payload = zlib.decompress(data)
+    (status, flags, length, digest, fingerprint, url_size, final_url_size,
+     subdomain_size, token_count) = PAYLOAD.unpack_from(payload)
+    offset = PAYLOAD.size
+    url = payload[offset:offset + url_size].decode("utf-8")
+    offset += url_size
+    final_url = payload[offset:offset + final_url_size].decode("utf-8") or url
+    offset += final_url_size
+    subdomain = payload[offset:offset + subdomain_size].decode("utf-8") or None
+    offset += subdomain_size
+    counts = array("I")
+    counts.frombytes(payload[len(payload) - 4 * token_count:])
+    if sys.byteorder == "big":
+        counts.byteswap()
+    freqs = None
+    if token_count:
+        tokens = payload[offset:len(payload) - 4 * token_count].decode("utf-8").split("\n")
+        freqs = dict(zip(tokens, counts))
+    return CrawlRecord(
+        url, final_url, status, bool(flags & DUPLICATE), length, subdomain,
+        digest if flags & HAS_DIGEST else None,
+        int.from_bytes(fingerprint, "big") if flags & HAS_FINGERPRINT else None, freqs)
+
+
+def segment_paths(directory):
+    ''' Paths of the segments in directory, oldest first. '''
+    if not os.path.isdir(directory):
+        return []
+    return [os.path.join(directory, name) for name in sorted(os.listdir(directory))
+            if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX)]
+
+
+def read_segment(path, logger=None):
+    ''' Yields the CrawlRecords of one segment. Stops at the first torn or
+    corrupt record, such as one still being written by a running crawl. '''
+    with open(path, "rb") as f:
+        header = f.read(SEGMENT_HEADER.size)
+        if len(header) < SEGMENT_HEADER.size:
+            return
+        magic, version = SEGMENT_HEADER.unpack(header)
+        if magic != MAGIC or version != VERSION:
+            raise RecordLogError(f"{path} is not a version {VERSION} record log segment")
+        while True:
+            frame = f.read(FRAME.size)
+            if len(frame) < FRAME.size:
+                return
+            size, crc = FRAME.unpack(frame)
+            data = f.read(size)
+            if len(data) < size or zlib.crc32(data) != crc:
+                if logger is not None:
+                    logger.warning(f"Stopped reading {path} at a torn record, offset {f.tell() - len(data) - FRAME.size}.")
+                return
+            yield decode_record(data)
+
+
+def read_records(directory, logger=None):
+    ''' Yields the CrawlRecords of every segment in directory, in the order
+    they were appended. '''
+    for path in segment_paths(directory):
+        yield from read_segment(path, logger)
+
+
+class RecordLog(object):
+    ''' Append-only log of a CrawlRecord per processed page.
+
+    Records go to numbered segment files in `directory`. Each run of the
+    crawler starts a new segment, and a segment is closed once it holds
+    `segment_bytes` bytes, so a segment is only ever appended to by one
+    process. Records are flushed as they are appended, so report.py can read
+    the log while the crawl is running. A record cut short by a crash is
+    skipped by readers.
+
+    Args:
+        directory : directory of the segments
+        segment_bytes : size after which a new segment is started
+        restart : remove the segments of earlier crawls
+
+    '''
+    def __init__(self, directory, segment_bytes, restart):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.lock = Lock()
+        if restart:
+            for path in segment_paths(directory):
+                os.remove(path)
+        os.makedirs(directory, exist_ok=True)
+        existing = segment_paths(directory)
+        self.segment = int(os.path.basename(existing[-1])[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)]) if existing else 0
+        self.file = None
+        self._open_segment()
+
+    def _open_segment(self):
+        if self.file is not None:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.file.close()
+        self.segment += 1
+        path = os.path.join(self.directory, f"{SEGMENT_PREFIX}{self.segment:06d}{SEGMENT_SUFFIX}")
+        self.file = open(path, "ab")
+        self.file.write(SEGMENT_HEADER.pack(MAGIC, VERSION))
+        self.size = SEGMENT_HEADER.size
+
+    def append(self, record):
+        data = encode_record(record)
+        with self.lock:
+            self.file.write(FRAME.pack(len(data), zlib.crc32(data)))
+            self.file.write(data)
+            self.file.flush()
+            self.size += FRAME.size + len(data)
+            if self.size >= self.segment_bytes:
+                self._open_segment()
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.flush()
+                os.fsync(self.file.fileno())
+                self.file.close()
+                self.file = None
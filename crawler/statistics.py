@@ -0,0 +1,185 @@
+import pickle
+from collections import Counter
+from heapq import heapify, heappush, heappop
+from threading import Lock, local
+
+
+class SpaceSaving(object):
+    """Weighted Space-Saving heavy hitters over at most `capacity` items.
+
+    Once full, a new item replaces the item with the smallest count and
+    inherits that count as its error, so counts are overestimates by at most
+    the smallest tracked count, and every item whose true count is above that
+    is guaranteed to be tracked.
+
+    Args:
+        capacity: int, number of items tracked
+
+    """
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+        # Lazy min-heap of (count, item), stale entries are skipped on pop.
+        self.heap = []
+
+    def __len__(self):
+        return len(self.counts)
+
+    def _min_item(self):
+        while True:
+            count, item = self.heap[0]
+            if self.counts.get(item) == count:
+                return item
+            heappop(self.heap)
+
+    def update(self, item, count=1):
+        counts = self.counts
+        if item in counts:
+            counts[item] += count
+        elif len(counts) < self.capacity:
+            counts[item] = count
+            self.errors[item] = 0
+        else:
+            evicted = self._min_item()
+            floor = counts.pop(evicted)
+            del self.errors[evicted]
+            counts[item] = floor + count
+            self.errors[item] = floor
+        heappush(self.heap, (counts[item], item))
+        if len(self.heap) > 4 * self.capacity:
+            self.heap = [(c, i) for i, c in counts.items()]
+            heapify(self.heap)
+
+    def items(self):
+        return self.counts.items()
+
+
+class StatisticsShard(object):
+    """Counters updated by one worker thread, drained into CrawlStatistics."""
+    def __init__(self):
+        self.lock = Lock()
+        self.words = Counter()
+        self.subdomains = Counter()
+        self.pages = 0
+
+
+class CrawlStatistics(object):
+    """Word frequencies, subdomain counts and the longest page of a crawl.
+
+    Each worker thread counts into its own shard, guarded by a lock only the
+    owner and the aggregator ever take, so workers do not contend with each
+    other. A shard is merged in place into the global counters every
+    `merge_every` pages, and all shards are merged before anything is read.
+
+    Word counts are exact by default. With `top_words_capacity` set they are
+    kept in a SpaceSaving summary of that many words, which bounds memory
+    while still finding the top words.
+
+    Args:
+        merge_every: int, pages a shard counts before it is merged
+        top_words_capacity: int, 0 for exact word counts, else SpaceSaving size
+
+    """
+    def __init__(self, merge_every=50, top_words_capacity=0):
+        self.merge_every = merge_every
+        self.lock = Lock()
+        self.words = SpaceSaving(top_words_capacity) if top_words_capacity else Counter()
+        self.subdomains = Counter()
+        self.longest_web_page = 0
+        self.longest_URL = ""
+        self.shards = []
+        self.local = local()
+
+    def _shard(self):
+        shard = getattr(self.local, "shard", None)
+        if shard is None:
+            shard = self.local.shard = StatisticsShard()
+            with self.lock:
+                self.shards.append(shard)
+        return shard
+
+    def record_page(self, url, length, freqs, subdomain=None):
+        """Counts one scraped page.
+
+        Args:
+            url: str, url of the page
+            length: int, number of tokens on the page
+            freqs: Map<token, count> of the page
+            subdomain: str, ics.uci.edu subdomain of the page, or None
+
+        """
+        shard = self._shard()
+        with shard.lock:
+            shard.words.update(freqs)
+            if subdomain is not None:
+                shard.subdomains[subdomain] += 1
+            shard.pages += 1
+            full = shard.pages >= self.merge_every
+        if length > self.longest_web_page:
+            with self.lock:
+                if length > self.longest_web_page:
+                    self.longest_web_page = length
+                    self.longest_URL = url
+        if full:
+            self._merge(shard)
+
+    def _merge(self, shard):
+        with shard.lock:
+            words, subdomains = shard.words, shard.subdomains
+            shard.words, shard.subdomains, shard.pages = Counter(), Counter(), 0
+        with self.lock:
+            if isinstance(self.words, Counter):
+                self.words.update(words)
+            else:
+                for word, count in words.items():
+                    self.words.update(word, count)
+            self.subdomains.update(subdomains)
+
+    def merge_all(self):
+        with self.lock:
+            shards = list(self.shards)
+        for shard in shards:
+            self._merge(shard)
+
+    def dumps(self):
+        """Returns bytes: the merged counters and longest page, for loads()."""
+        self.merge_all()
+        with self.lock:
+            return pickle.dumps(
+                (self.words, self.subdomains, self.longest_web_page, self.longest_URL),
+                pickle.HIGHEST_PROTOCOL)
+
+    def loads(self, data):
+        """Restores the counters saved by dumps(), replacing any counted so far.
+        Word counts keep the format, exact or SpaceSaving, they were saved in."""
+        words, subdomains, longest_web_page, longest_URL = pickle.loads(data)
+        with self.lock:
+            self.words, self.subdomains = words, subdomains
+            self.longest_web_page, self.longest_URL = longest_web_page, longest_URL
+
+    def merge(self, data):
+        """Adds the counters saved by dumps(), e.g. of another crawler node."""
+        words, subdomains, longest_web_page, longest_URL = pickle.loads(data)
+        self.merge_all()
+        with self.lock:
+            if isinstance(self.words, Counter):
+                self.words.update(dict(words.items()))
+            else:
+                for word, count in words.items():
+                    self.words.update(word, count)
+            self.subdomains.update(subdomains)
+            if longest_web_page > self.longest_web_page:
+                self.longest_web_page, self.longest_URL = longest_web_page, longest_URL
+
+    def top_words(self, n=50):
+        """Returns list of (word, count), highest count first, ties by word."""
+        self.merge_all()
+        with self.lock:
+            return sorted(self.words.items(), key=lambda item: (-item[1], item[0]))[:n]
+
+    def subdomain_counts(self):
+        """Returns list of (subdomain, pages) sorted by subdomain."""
+        self.merge_all()
+        with self.lock:
+            return sorted(self.subdomains.items())
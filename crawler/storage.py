@@ -0,0 +1,209 @@
+import os
+import shelve
+import sqlite3
+import time
+
+from threading import RLock
+
+from utils.metrics import get_metrics
+
+SQLITE_MAGIC = b"SQLite format 3\x00"
+# Files dbm may create next to a shelve path, depending on the dbm module.
+SHELVE_SUFFIXES = ("", ".db", ".dir", ".dat", ".bak")
+SQLITE_SUFFIXES = ("", "-wal", "-shm", "-journal")
+
+
+class GroupCommitStorage(object):
+    ''' Mapping of urlhash -> (url, completed) that batches durable writes.
+
+    Writes are applied immediately but only made durable every `batch_size`
+    writes or `flush_interval` seconds, whichever comes first. Writes are
+    flushed in order, so after a crash the save file holds an exact prefix of
+    the (url, completed) updates made by the frontier.
+
+    Backends that number their writes keep the number of the last one in
+    `seq` and return the entries written after a given number from
+    changes_since(), which a frontier checkpoint uses to replay only the
+    writes made after it. Others leave seq None.
+    '''
+    seq = None
+
+    def __init__(self, batch_size, flush_interval):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.lock = RLock()
+        self.pending = 0
+        self.last_flush = time.monotonic()
+        self.metrics = get_metrics()
+
+    def _write(self, urlhash, value):
+        raise NotImplementedError
+
+    def _flush(self):
+        raise NotImplementedError
+
+    def __setitem__(self, urlhash, value):
+        with self.lock:
+            with self.metrics.timer("save_write"):
+                self._write(urlhash, value)
+            self.pending += 1
+            if (self.pending >= self.batch_size
+                    or time.monotonic() - self.last_flush >= self.flush_interval):
+                self.sync()
+
+    def sync(self):
+        with self.lock:
+            if self.pending:
+                with self.metrics.timer("save_sync"):
+                    self._flush()
+                self.pending = 0
+            self.last_flush = time.monotonic()
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def changes_since(self, seq):
+        raise NotImplementedError
+
+
+class ShelveStorage(GroupCommitStorage):
+    ''' The original shelve save file, synced once per batch. '''
+    def __init__(self, path, batch_size=1, flush_interval=0.0):
+        super().__init__(batch_size, flush_interval)
+        self.db = shelve.open(path)
+
+    def _write(self, urlhash, value):
+        self.db[urlhash] = value
+
+    def _flush(self):
+        self.db.sync()
+
+    def __contains__(self, urlhash):
+        with self.lock:
+            return urlhash in self.db
+
+    def __getitem__(self, urlhash):
+        with self.lock:
+            return self.db[urlhash]
+
+    def __len__(self):
+        with self.lock:
+            return len(self.db)
+
+    def values(self):
+        with self.lock:
+            return list(self.db.values())
+
+    def items(self):
+        with self.lock:
+            return list(self.db.items())
+
+    def close(self):
+        with self.lock:
+            self.sync()
+            self.db.close()
+
+
+class SQLiteStorage(GroupCommitStorage):
+    ''' SQLite save file in WAL mode, one transaction per batch. Every write
+    stamps its row with the next sequence number. '''
+    def __init__(self, path, batch_size=500, flush_interval=1.0):
+        super().__init__(batch_size, flush_interval)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS urls ("
+            "urlhash TEXT PRIMARY KEY, url TEXT NOT NULL, completed INTEGER NOT NULL, "
+            "seq INTEGER NOT NULL DEFAULT 0)")
+        columns = [row[1] for row in self.db.execute("PRAGMA table_info(urls)")]
+        if "seq" not in columns:
+            # Save file from before sequence numbers, its rows all count as old.
+            self.db.execute("ALTER TABLE urls ADD COLUMN seq INTEGER NOT NULL DEFAULT 0")
+        self.db.execute("CREATE INDEX IF NOT EXISTS urls_seq ON urls (seq)")
+        self.db.commit()
+        self.seq = self.db.execute("SELECT COALESCE(MAX(seq), 0) FROM urls").fetchone()[0]
+
+    def _write(self, urlhash, value):
+        url, completed = value
+        self.seq += 1
+        self.db.execute(
+            "INSERT OR REPLACE INTO urls (urlhash, url, completed, seq) VALUES (?, ?, ?, ?)",
+            (urlhash, url, int(completed), self.seq))
+
+    def _flush(self):
+        self.db.commit()
+
+    def __contains__(self, urlhash):
+        with self.lock:
+            return self.db.execute(
+                "SELECT 1 FROM urls WHERE urlhash = ?", (urlhash,)).fetchone() is not None
+
+    def __getitem__(self, urlhash):
+        with self.lock:
+            row = self.db.execute(
+                "SELECT url, completed FROM urls WHERE urlhash = ?", (urlhash,)).fetchone()
+        if row is None:
+            raise KeyError(urlhash)
+        return (row[0], bool(row[1]))
+
+    def __len__(self):
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM urls").fetchone()[0]
+
+    def values(self):
+        with self.lock:
+            return [(url, bool(completed)) for url, completed in
+                    self.db.execute("SELECT url, completed FROM urls")]
+
+    def items(self):
+        with self.lock:
+            return [(urlhash, (url, bool(completed))) for urlhash, url, completed in
+                    self.db.execute("SELECT urlhash, url, completed FROM urls")]
+
+    def changes_since(self, seq):
+        ''' Returns [(urlhash, (url, completed))] of the rows last written
+        after sequence number seq, in the order they were written. '''
+        with self.lock:
+            return [(urlhash, (url, bool(completed))) for urlhash, url, completed in
+                    self.db.execute(
+                        "SELECT urlhash, url, completed FROM urls WHERE seq > ? ORDER BY seq",
+                        (seq,))]
+
+    def close(self):
+        with self.lock:
+            self.sync()
+            self.db.close()
+
+
+BACKENDS = {"shelve": ShelveStorage, "sqlite": SQLiteStorage}
+
+
+def storage_exists(path):
+    return any(os.path.exists(path + suffix) for suffix in SHELVE_SUFFIXES)
+
+
+def remove_storage(path):
+    for suffix in set(SHELVE_SUFFIXES + SQLITE_SUFFIXES):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+def detect_backend(path):
+    ''' Name of the backend that wrote the save file at path, or None. '''
+    if os.path.isfile(path):
+        with open(path, "rb") as f:
+            if f.read(len(SQLITE_MAGIC)) == SQLITE_MAGIC:
+                return "sqlite"
+    if storage_exists(path):
+        return "shelve"
+    return None
+
+
+def open_storage(path, backend="sqlite", batch_size=500, flush_interval=1.0):
+    ''' Open the save file at path with the backend that wrote it, or create
+    a new one with `backend` if there is none. '''
+    backend = detect_backend(path) or backend
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown frontier storage {backend}, expected one of {sorted(BACKENDS)}")
+    return BACKENDS[backend](path, batch_size, flush_interval)
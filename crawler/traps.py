@@ -0,0 +1,202 @@
+import re
+from threading import Lock
+from urllib.parse import urlparse, parse_qsl
+
+from utils import get_logger
+from utils.metrics import get_metrics
+
+ACCEPT = "accept"
+DEFER = "defer"
+DROP = "drop"
+
+# Path segments that vary between urls of the same template.
+NUMBER_SEGMENT = re.compile(r"^\d+$")
+DATE_SEGMENT = re.compile(r"^\d{4}-\d{1,2}(?:-\d{1,2})?$")
+ID_SEGMENT = re.compile(r"^(?=.*\d)[0-9a-zA-Z_-]{16,}$")
+
+
+def path_shape(path):
+    ''' Path with numbers, dates and long ids replaced by placeholders. '''
+    shape = []
+    for segment in path.split("/"):
+        if NUMBER_SEGMENT.match(segment):
+            shape.append("{n}")
+        elif DATE_SEGMENT.match(segment):
+            shape.append("{date}")
+        elif ID_SEGMENT.match(segment):
+            shape.append("{id}")
+        else:
+            shape.append(segment.lower())
+    return "/".join(shape)
+
+
+def url_template(url):
+    ''' Template of url: host, path shape and the sorted set of query keys.
+    https://www.ics.uci.edu/events/2020-01-02?view=day&page=3 has the
+    template www.ics.uci.edu/events/{date}?page&view '''
+    parsed = urlparse(url)
+    keys = sorted(set(key for key, _ in parse_qsl(parsed.query, keep_blank_values=True)))
+    return f"{parsed.netloc.lower()}{path_shape(parsed.path)}?{'&'.join(keys)}"
+
+
+def repeated_segment(url, limit):
+    ''' The first path segment that occurs `limit` or more times in url, else None. '''
+    counts = {}
+    for segment in urlparse(url).path.lower().split("/"):
+        if segment:
+            counts[segment] = counts.get(segment, 0) + 1
+            if counts[segment] >= limit:
+                return segment
+    return None
+
+
+class TemplateStats(object):
+    ''' Yield of the pages of one url template. '''
+    def __init__(self):
+        self.fetched = 0
+        self.outstanding = 0
+        self.yield_ewma = 1.0
+        self.deferred = 0
+        self.dropped = 0
+        self.verdict = ACCEPT
+
+
+class TrapDetector(object):
+    ''' Adaptive crawl trap detector.
+
+    Urls are grouped into templates (see url_template). Every fetched page
+    scores its template's yield: 0 for duplicates, errors and empty pages,
+    otherwise the share of its tokens never seen before in the crawl, scaled
+    from half to full by the share of its outlinks new to the frontier. A page
+    adding no new words scores 0 however many new links it has, such as the
+    next day of a calendar. Each template keeps an EWMA of that score and is
+    compared to the EWMA over all pages, so yield falling as the whole crawl
+    saturates is not held against any template.
+
+    After WARMUP pages, a template whose relative yield falls below DEFERYIELD
+    has its new urls deferred, queued behind every url not deferred,
+    and below DROPYIELD its new urls are dropped. A template may have at most
+    BUDGET times its relative yield urls waiting in the frontier, further urls
+    are deferred. Urls repeating a path segment REPEATLIMIT times are always
+    dropped. Every defer, drop and change of a template's verdict is logged to
+    Logs/TRAPS.log.
+
+    Args:
+        config: Config object with the [TRAPS] settings
+
+    '''
+    def __init__(self, config):
+        self.logger = get_logger("TRAPS")
+        self.metrics = get_metrics()
+        self.warmup = config.trap_warmup
+        self.alpha = config.trap_alpha
+        self.defer_yield = config.trap_defer_yield
+        self.drop_yield = config.trap_drop_yield
+        self.budget = config.trap_budget
+        self.repeat_limit = config.trap_repeat_limit
+        self.lock = Lock()
+        self.templates = dict()
+        self.global_yield = None
+
+    def _stats(self, template):
+        stats = self.templates.get(template)
+        if stats is None:
+            stats = self.templates[template] = TemplateStats()
+        return stats
+
+    def _relative_yield(self, stats):
+        if not self.global_yield:
+            return 1.0
+        return stats.yield_ewma / self.global_yield
+
+    def check(self, url):
+        ''' Decides whether a new url is accepted, deferred or dropped.
+
+        Returns:
+            str : ACCEPT, DEFER or DROP
+
+        '''
+        segment = repeated_segment(url, self.repeat_limit) if self.repeat_limit else None
+        template = url_template(url)
+        with self.lock:
+            stats = self._stats(template)
+            if segment is not None:
+                verdict, reason = DROP, f"segment {segment!r} repeats {self.repeat_limit} times"
+            elif stats.fetched < self.warmup:
+                verdict, reason = ACCEPT, None
+            else:
+                relative = self._relative_yield(stats)
+                if relative < self.drop_yield:
+                    verdict, reason = DROP, f"relative yield {relative:.3f}"
+                elif relative < self.defer_yield:
+                    verdict, reason = DEFER, f"relative yield {relative:.3f}"
+                elif stats.outstanding >= self.budget * min(1.0, relative):
+                    verdict, reason = DEFER, f"{stats.outstanding} urls waiting"
+                else:
+                    verdict, reason = ACCEPT, None
+            if verdict == DROP:
+                stats.dropped += 1
+            else:
+                stats.outstanding += 1
+                if verdict == DEFER:
+                    stats.deferred += 1
+        self.metrics.inc("trap_decisions", verdict=verdict)
+        if reason is not None:
+            self.logger.info(f"{verdict.upper()} {url} template {template}: {reason}")
+        return verdict
+
+    def relative_yield(self, url):
+        ''' Yield of url's template relative to the whole crawl, 1.0 until
+        WARMUP pages of the template were fetched. '''
+        template = url_template(url)
+        with self.lock:
+            stats = self.templates.get(template)
+            if stats is None or stats.fetched < self.warmup:
+                return 1.0
+            return self._relative_yield(stats)
+
+    def record_page(self, url, new_tokens=None, new_links=0, links=0):
+        ''' Scores the yield of a fetched url.
+
+        Args:
+            url : url that was fetched
+            new_tokens : share of the page's tokens never seen before in the
+                         crawl, None for duplicates, errors and pages
+                         without content
+            new_links : number of its outlinks that were new to the frontier
+            links : number of its outlinks
+
+        '''
+        template = url_template(url)
+        with self.lock:
+            if new_tokens is not None:
+                novelty = new_links / links if links else 0.0
+                score = new_tokens * (1 + novelty) / 2
+            else:
+                score = 0.0
+            stats = self._stats(template)
+            stats.fetched += 1
+            stats.outstanding = max(0, stats.outstanding - 1)
+            stats.yield_ewma += self.alpha * (score - stats.yield_ewma)
+            if self.global_yield is None:
+                self.global_yield = score
+            else:
+                self.global_yield += self.alpha / 10 * (score - self.global_yield)
+            if stats.fetched < self.warmup:
+                return
+            relative = self._relative_yield(stats)
+            verdict = DROP if relative < self.drop_yield else DEFER if relative < self.defer_yield else ACCEPT
+            changed, stats.verdict = stats.verdict != verdict, verdict
+        if changed:
+            self.logger.info(
+                f"Template {template} now {verdict}s new urls: yield {stats.yield_ewma:.3f}, "
+                f"relative yield {relative:.3f} after {stats.fetched} pages.")
+
+    def summary(self, n=10):
+        ''' Returns a line per template with the most deferred and dropped urls. '''
+        with self.lock:
+            templates = sorted(
+                self.templates.items(), key=lambda item: -(item[1].dropped + item[1].deferred))[:n]
+        return [f"{template}: {stats.fetched} fetched, {stats.deferred} deferred, "
+                f"{stats.dropped} dropped, yield {stats.yield_ewma:.3f}"
+                for template, stats in templates if stats.dropped or stats.deferred]
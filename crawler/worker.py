@@ -2,20 +2,26 @@ from threading import Thread
 
 from inspect import getsource
 from utils.download import download
+from utils.concurrency import get_controller
 from utils import get_logger
+from utils.page import ParsedPage
+from utils.metrics import get_metrics
 import scraper
-import time
 
 from tokenizer import checkSimilarity
+from tokenizer.duplicates import digest
+
+STATS_FILE = "STATS_FILE.txt"
 
 
 class Worker(Thread):
+    # Each worker thread has one download in flight at a time.
+    one_fetch_per_thread = True
+
     def __init__(self, worker_id, config, frontier):
         self.logger = get_logger(f"Worker-{worker_id}", "Worker")
         self.config = config
         self.frontier = frontier
-        self.STATS_FILE_NAME = "STATS_FILE.txt"         # FIXME: choose different name per worker to make thread-safe
-        self.statistics_file = None
 
         # basic check for requests in scraper
         assert {getsource(scraper).find(req) for req in {"from requests import", "import requests"}} == {-1}, "Do not use requests in scraper.py"
@@ -23,60 +29,125 @@ class Worker(Thread):
         super().__init__(daemon=True)
 
     def run(self):
+        controller = get_controller(self.config)
         while True:
-            tbd_url = self.frontier.get_tbd_url()
-            if not tbd_url:
-                self.logger.info("Frontier is empty. Stopping Crawler.")
-                break
-            resp = download(tbd_url, self.config, self.logger)
+            # Taken before the url, so a url never waits for a slot after the
+            # frontier started its host's politeness delay.
+            with controller.slot():
+                tbd_url = self.frontier.get_tbd_url()
+                if not tbd_url:
+                    self.logger.info("Frontier is empty. Stopping Crawler.")
+                    break
+                resp = download(tbd_url, self.config, self.logger)
             self.logger.info(
                 f"Downloaded {tbd_url}, status <{resp.status}>, "
-                f"using cache {self.config.cache_server}.")
-
-            # TODO: Simhash: compare hashed resp of tbd_url to other hashes obtained
-            #       from scraping. If similar to other hashes, do not scrape, download,
-            #       or generate statistics.
-            if (resp.status == 200 and resp is not None and checkSimilarity(resp)):
-                self.logger.info(f"URL {tbd_url} found to be duplicate")
-                time.sleep(self.config.time_delay)
-                continue
-
-            scraped_urls = scraper.scraper(tbd_url, resp)
-
-            # STATISTICS FOR REPORT
-            # lenth of the url
-            length = scraper.getLengthOfResponseContent(resp)
-            # max()
-            if length > self.frontier.longest_web_page:
-                self.frontier.longest_URL = resp.url
-                self.frontier.longest_web_page = length
-
-            #finding common words
-            self.frontier.words = scraper.tokenizeResponseContent(resp, self.frontier.words)
-
-            is_subdomain, subdomain = scraper.checkSubdomain(tbd_url, resp)
-            if (is_subdomain):
-                self.frontier.subdomains[subdomain] += 1
-
-            for scraped_url in scraped_urls:
-                self.frontier.add_url(scraped_url)
+                f"using cache {self.config.cache_server} in {resp.latency:.3f}s.")
+            get_metrics().observe("download", resp.latency)
+
+            self.process(tbd_url, resp)
+
+    def process(self, tbd_url, resp):
+        try:
+            process_response(self.frontier, tbd_url, resp, self.logger)
+        except Exception as e:
+            # A page that cannot be processed must not stay in flight, or
+            # the other workers wait for it forever.
+            self.logger.error(f"Failed to process {tbd_url}: {e!r}")
             self.frontier.mark_url_complete(tbd_url)
-            time.sleep(self.config.time_delay)
-
-        #sorting 50 most common words
-        sortFreq = dict(sorted(self.frontier.words.items(), key=lambda item: (-item[1], item[0])))
-        commonWords = {k: sortFreq[k] for k in list(sortFreq)[:50]}
-        # Write statistics to file
-        self.statistics_file = open(self.STATS_FILE_NAME, "w")
-        self.statistics_file.write(f"Num Unique Pages: {self.frontier.uniquePages}\n")
-        self.statistics_file.write("\n\n")
-        self.statistics_file.write(f"Longest Web Page: {self.frontier.longest_URL}\n")
-        self.statistics_file.write("\n\n")
-        self.statistics_file.write(f"Top 50 Common Words:\n")
-        for k, v in commonWords.items():
-            self.statistics_file.write(k + "=" + str(v) +"\n")
-        self.statistics_file.write("\n\n")
-        self.statistics_file.write(f"Subdomains:\n")
-        for k, v in sorted(self.frontier.subdomains.items(), key=lambda item: (item[0], item[1])):
-            self.statistics_file.write(str(k) + ", " + str(v) +"\n")
-        self.statistics_file.close()
+
+
+def process_response(frontier, tbd_url, resp, logger):
+    """Deduplicates, scrapes and records statistics for a downloaded url,
+    then marks it complete. Shared by every crawl engine.
+
+    Args:
+        frontier : Frontier the url came from
+        tbd_url : url that was downloaded
+        resp : response object containing status code and page content
+        logger : logger of the calling worker
+
+    """
+    metrics = get_metrics()
+    metrics.profile_checkpoint()
+    metrics.inc("pages")
+    metrics.inc("responses", status=resp.status)
+    if resp.status != 200:
+        metrics.inc("non_200")
+
+    # Parse the page once; dedup, scraping and statistics share it.
+    page = ParsedPage(resp)
+
+    content_digest = None
+    if (frontier.history is not None or frontier.records is not None) and resp.status == 200 and page.has_content:
+        content_digest = digest(page.content)
+        if frontier.reuse_unchanged(tbd_url, content_digest):
+            logger.info(f"URL {tbd_url} did not change since its last visit")
+            return
+
+    # TODO: Simhash: compare hashed resp of tbd_url to other hashes obtained
+    #       from scraping. If similar to other hashes, do not scrape, download,
+    #       or generate statistics.
+    with metrics.timer("similarity"):
+        duplicate = resp.status == 200 and resp is not None and checkSimilarity(resp, page, frontier.fingerprints, frontier.duplicates)
+    if duplicate:
+        logger.info(f"URL {tbd_url} found to be duplicate")
+        metrics.inc("duplicates")
+        frontier.record_page(tbd_url, resp.status, True, content_digest, final_url=resp.url)
+        frontier.record_yield(tbd_url)
+        frontier.mark_url_complete(tbd_url)
+        return
+
+    with metrics.timer("scrape"):
+        scraped_urls = scraper.scraper(tbd_url, resp, page)
+
+    with metrics.timer("statistics"):
+        # STATISTICS FOR REPORT
+        # lenth of the url
+        length = scraper.getLengthOfResponseContent(resp, page)
+        # common words, only pages getLengthOfResponseContent counted have any
+        freqs = page.freqs if resp.status == 200 and page.has_content else {}
+
+        is_subdomain, subdomain = scraper.checkSubdomain(tbd_url, resp)
+        frontier.statistics.record_page(
+            resp.url, length, freqs, subdomain.netloc if is_subdomain else None)
+
+    frontier.record_page(
+        tbd_url, resp.status, False, content_digest,
+        page.fingerprint if content_digest is not None else None,
+        scraped_urls, freqs, length, subdomain.netloc if is_subdomain else None, resp.url)
+    frontier.add_links(tbd_url, scraped_urls, freqs)
+    # Politeness is enforced per host by the frontier.
+    frontier.mark_url_complete(tbd_url)
+
+
+def write_statistics(frontier, file_name=STATS_FILE):
+    """Writes the report statistics gathered in frontier to file_name.
+    Called once the crawl is over, see Crawler.join; report.py builds the
+    same report from the record log at any time.
+
+    Args:
+        frontier : Frontier holding the statistics
+        file_name : path of the statistics file
+
+    """
+    statistics = frontier.statistics
+    # Write statistics to file
+    statistics_file = open(file_name, "w")
+    statistics_file.write(f"Num Unique Pages: {frontier.uniquePages}\n")
+    statistics_file.write("\n\n")
+    statistics_file.write(f"Longest Web Page: {statistics.longest_URL}\n")
+    statistics_file.write("\n\n")
+    statistics_file.write(f"Top 50 Common Words:\n")
+    for k, v in statistics.top_words(50):
+        statistics_file.write(k + "=" + str(v) +"\n")
+    statistics_file.write("\n\n")
+    statistics_file.write(f"Subdomains:\n")
+    for k, v in statistics.subdomain_counts():
+        statistics_file.write(str(k) + ", " + str(v) +"\n")
+    cross_node = getattr(frontier, "crossNodeDuplicates", 0)
+    if cross_node:
+        # See crawler/distributed.py merge_nodes.
+        statistics_file.write("\n\n")
+        statistics_file.write(
+            f"Counted above, but near-duplicates of pages of other nodes: {cross_node}\n")
+    statistics_file.close()
@@ -1,23 +1,69 @@
 from configparser import ConfigParser
 from argparse import ArgumentParser
 
-from utils.server_registration import get_cache_server
+from utils import get_logger
 from utils.config import Config
 from crawler import Crawler
+from crawler.worker import Worker, write_statistics
+from crawler.async_worker import AsyncWorker
+from crawler.pipeline import PipelineWorker
+from crawler.distributed import (
+    PartitionedFrontier, local_addresses, merge_nodes, run_local_nodes)
 
+ENGINES = {"thread": Worker, "async": AsyncWorker, "process": PipelineWorker}
 
-def main(config_file, restart):
+
+def main(config_file, restart, engine="thread", cache_server=None, nodes=0, node=None, merge=None,
+         recrawl=False):
     cparser = ConfigParser()
     cparser.read(config_file)
     config = Config(cparser)
-    config.cache_server = get_cache_server(config, restart)
-    crawler = Crawler(config, restart)
-    crawler.start()
+    if recrawl:
+        assert config.history_enabled, "Set ENABLED in [RECRAWL] in config.ini to keep a history to recrawl"
+        # Starts over from the seeds like --restart, but keeps the history.
+        config.recrawl = restart = True
+    if merge:
+        # Directories of nodes that ran on other machines.
+        write_statistics(merge_nodes(config, merge, get_logger("NODES")))
+        return
+    if cache_server:
+        # Local cache server such as benchmarks.cache_server, no registration.
+        host, port = cache_server.rsplit(":", 1)
+        config.cache_server = (host, int(port))
+    else:
+        from utils.server_registration import get_cache_server
+        config.cache_server = get_cache_server(config, restart)
+    if node is not None:
+        # One node of a distributed crawl, see crawler/distributed.py.
+        config.node_id = node
+        if not config.node_addresses:
+            config.node_addresses = local_addresses(nodes, config.node_port)
+        if config.metrics_port:
+            config.metrics_port += node
+        crawler = Crawler(
+            config, restart, frontier_factory=PartitionedFrontier, worker_factory=ENGINES[engine])
+        crawler.start()
+    elif nodes:
+        # Registers with the cache server once, for all the nodes.
+        merged = run_local_nodes(config_file, config, restart, engine, nodes, recrawl)
+        write_statistics(merged)
+    else:
+        crawler = Crawler(config, restart, worker_factory=ENGINES[engine])
+        crawler.start()
 
 
 if __name__ == "__main__":
     parser = ArgumentParser()
     parser.add_argument("--restart", action="store_true", default=False)
+    parser.add_argument("--recrawl", action="store_true", default=False,
+                        help="start over from the seeds, fetching only pages due for a visit")
     parser.add_argument("--config_file", type=str, default="config.ini")
+    parser.add_argument("--engine", choices=sorted(ENGINES), default="thread")
+    parser.add_argument("--cache_server", type=str, default=None, metavar="HOST:PORT")
+    parser.add_argument("--nodes", type=int, default=0, help="crawl with this many local nodes")
+    parser.add_argument("--node", type=int, default=None, help="run only this node")
+    parser.add_argument("--merge", nargs="+", default=None, metavar="DIR",
+                        help="merge the results of the nodes that ran in these directories")
     args = parser.parse_args()
-    main(args.config_file, args.restart)
+    main(args.config_file, args.restart, args.engine, args.cache_server,
+         args.nodes, args.node, args.merge, args.recrawl)
@@ -0,0 +1,64 @@
+from configparser import ConfigParser
+from argparse import ArgumentParser
+
+from utils import get_logger, get_urldigest
+from utils.config import Config
+from utils.cuckoo import ScalableCuckooFilter
+from crawler.statistics import CrawlStatistics
+from crawler.records import read_records
+from crawler.worker import write_statistics
+from crawler.distributed import MergedCrawl
+
+# Candidate top words kept when TOPWORDSCAPACITY counts every word exactly.
+DEFAULT_CAPACITY = 100000
+# Next to STATS_FILE.txt, and not report.txt, the report of the course crawl.
+REPORT_FILE = "RECORDS_REPORT.txt"
+
+
+def build_report(config, directories, capacity, logger):
+    ''' Streams the record logs in directories into the report statistics.
+    Only the candidate top words, the subdomain counts and a filter of the
+    urls seen are held in memory. A url recorded twice, such as one fetched
+    again after resuming from a checkpoint, counts once.
+
+    Returns:
+        MergedCrawl : statistics and unique pages of the records
+
+    '''
+    statistics = CrawlStatistics(config.stats_merge, capacity)
+    seen = ScalableCuckooFilter(config.seen_capacity, config.seen_error_rate)
+    unique_pages = records = 0
+    for directory in directories:
+        for record in read_records(directory, logger):
+            records += 1
+            if not seen.add(get_urldigest(record.url)):
+                continue
+            unique_pages += 1
+            if not record.duplicate:
+                statistics.record_page(record.final_url, record.length, record.freqs or {}, record.subdomain)
+    logger.info(f"Read {records} records of {unique_pages} unique pages from {', '.join(directories)}.")
+    if not records and not config.records_enabled:
+        logger.warning("No records, crawl with ENABLED in section RECORDS to write them.")
+    return MergedCrawl(statistics, unique_pages)
+
+
+def main(config_file, records=None, output=REPORT_FILE, capacity=None):
+    cparser = ConfigParser()
+    cparser.read(config_file)
+    config = Config(cparser)
+    if capacity is None:
+        capacity = config.top_words_capacity or DEFAULT_CAPACITY
+    crawl = build_report(config, records or [config.records_directory], capacity, get_logger("REPORT"))
+    write_statistics(crawl, output)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--config_file", type=str, default="config.ini")
+    parser.add_argument("--records", nargs="+", default=None, metavar="DIR",
+                        help="record log directories, DIRECTORY in [RECORDS] by default")
+    parser.add_argument("--output", type=str, default=REPORT_FILE)
+    parser.add_argument("--capacity", type=int, default=None,
+                        help="candidate top words kept in memory, 0 to count every word exactly")
+    args = parser.parse_args()
+    main(args.config_file, args.records, args.output, args.capacity)
@@ -1,8 +1,36 @@
 import re
-from urllib.parse import urlparse
+from functools import lru_cache
+from urllib.parse import urlparse, urlsplit
 from urllib.parse import urljoin
-from bs4 import BeautifulSoup
-from tokenizer import tokenize, computeWordFrequencies, mergeDictionary
+from tokenizer import mergeDictionary
+from utils.page import ParsedPage
+from utils.canonical import canonicalize
+from utils.metrics import get_metrics
+
+# Rules used by is_valid, compiled once at import.
+VALID_SCHEMES = frozenset(["http", "https"])
+VALID_DOMAINS = frozenset(["ics.uci.edu", "cs.uci.edu", "informatics.uci.edu", "stat.uci.edu"])
+# urls whose path starts with one of these are mailto / embedded javascript links
+BLOCKED_PATH_PREFIXES = ("/mailto:", "/javascript:")
+# matched against lowercased path + "?" + query: pdf and wp-json directories in
+# the path, share= and =pdf anywhere in the query
+BLOCKED_PATH_QUERY = re.compile(r"^[^?]*/(?:pdf|wp-json)/|\?.*(?:share=|=pdf)", re.DOTALL)
+BLOCKED_EXTENSIONS = frozenset([
+    "css", "js", "bmp", "gif", "jpg", "jpeg", "ico",
+    "png", "tif", "tiff", "mid", "mp2", "mp3", "mp4",
+    "wav", "avi", "mov", "mpeg", "ram", "m4v", "mkv", "ogg", "ogv", "pdf",
+    "ps", "eps", "tex", "ppt", "pptx", "doc", "docx", "xls", "xlsx", "names",
+    "data", "dat", "exe", "bz2", "tar", "msi", "bin", "7z", "psd", "dmg", "iso",
+    "epub", "dll", "cnf", "tgz", "sha1",
+    "thmx", "mso", "arff", "rtf", "jar", "csv",
+    "apk", "war", "img", "ppsx", "pps", "odc", "bib", "json", "svg", "diff", "db", "ova",
+    "sql", "r", "m", "py", "c", "h", "java", "scm", "sh", "ss", "nb", "ipynb", "jsp",
+    "rm", "smil", "wmv", "swf", "wma", "zip", "rar", "gz"])
+# Number of urls whose is_valid verdict is remembered.
+VERDICT_CACHE_SIZE = 1 << 16
+# An href with none of these is a plain path: no scheme, host, params, query
+# or fragment, and nothing urlsplit strips or removes
+NOT_PLAIN_PATH = frozenset(":;?#" + "".join(map(chr, range(32))))
 
 
 def checkSubdomain(url, resp):
@@ -31,11 +59,12 @@ def checkSubdomain(url, resp):
     return (False, None)
 
 
-def getLengthOfResponseContent(resp):
+def getLengthOfResponseContent(resp, page=None):
     """This function finds the largest web page crawled
 
     Args:
         resp : response object that contains stauts code and content of a url
+        page : ParsedPage built from resp, parsed here if not given
 
     Returns:
         int : returns length for the response content
@@ -45,16 +74,18 @@ def getLengthOfResponseContent(resp):
     if resp.status != 200 or resp is None or resp.raw_response is None or resp.raw_response.content is None :
         return 0
 
-    soup = BeautifulSoup(resp.raw_response.content, "html.parser")
-    return len(tokenize(soup.get_text()))
+    if page is None:
+        page = ParsedPage(resp)
+    return page.token_count
 
 # Returns all the common words
-def tokenizeResponseContent(resp, words):
+def tokenizeResponseContent(resp, words, page=None):
     """this function is tokenizes the content of a webpage
 
     Args:
         resp : response object that contains stauts code and content of a url
         words : dictionary of current common words
+        page : ParsedPage built from resp, parsed here if not given
 
     Returns:
         dictionary : merged diction of common words 
@@ -64,34 +95,37 @@ def tokenizeResponseContent(resp, words):
     if resp.status != 200 or resp is None or resp.raw_response is None or resp.raw_response.content is None :
         return words
 
-    soup = BeautifulSoup(resp.raw_response.content, "html.parser")
-    return mergeDictionary(computeWordFrequencies(tokenize(soup.get_text())), words)
+    if page is None:
+        page = ParsedPage(resp)
+    return mergeDictionary(page.freqs, words)
 
 
-def scraper(url, resp):
+def scraper(url, resp, page=None):
     """This function is used to scrape the webpage
 
     Args:
         url : Url that we want to check if it has a sub domain
         resp : response object containing status code and page content
+        page : ParsedPage built from resp, parsed here if not given
 
     Returns:
         list : next links to crawl that are valid
 
     """
-    links = extract_next_links(url, resp)
+    links = extract_next_links(url, resp, page)
     # use starting url and response to grab next links and data
     # create structure to store all links to visit
 
 
-    return [link for link in links if is_valid(link)]
+    return valid_links(links)
 
-def extract_next_links(url, resp):
+def extract_next_links(url, resp, page=None):
     """Getting next links from a url
 
     Args:
         url : Url that we want to check if it has a sub domain
         resp : response object containing status code and page content
+        page : ParsedPage built from resp, parsed here if not given
 
     Returns:
         list : next links to crawl
@@ -109,7 +143,12 @@ def extract_next_links(url, resp):
     # convert relative urls to absolute urls
     links = []
     #checking if response is 200, resp is null , content is null
-    if resp is None or resp.raw_response is None or resp.raw_response.content is None :
+    if resp is None:
+        return list()
+    # only 200 and redirects can have links, skip decoding anything else
+    if resp.status != 200 and not (resp.status > 299 and resp.status < 400):
+        return links
+    if resp.raw_response is None or resp.raw_response.content is None :
         return list()
 
     if resp.status != 200:
@@ -123,6 +162,7 @@ def extract_next_links(url, resp):
             if (bool(urlparse(newLink).fragment)):
                 newLink = newLink.split('#')[0]
 
+            newLink = canonicalize(newLink)
             if (is_valid(newLink)):
                 links.append(newLink)
 
@@ -132,45 +172,95 @@ def extract_next_links(url, resp):
     if len(resp.raw_response.content) > 4 * 1e9:
         return list()
 
-    soup = BeautifulSoup(resp.raw_response.content, "html.parser")
+    if page is None:
+        page = ParsedPage(resp)
 
-    tokens = computeWordFrequencies(tokenize(soup.get_text()))
-    numTokens = sum([v for _, v in tokens.items()])
+    numTokens = sum([v for _, v in page.freqs.items()])
     if numTokens < 50:
         return links
 
-    a_tags = soup.find_all("a")
     #begin the scraping 
 
-    for a in a_tags:
-        link = a.get("href")
+    # relative links resolve against the <base> of the page, if it has one
+    base = urljoin(url, page.base) if page.base else url
+    parsed = urlsplit(base)
+    root = f"{parsed.scheme}://{parsed.netloc}" if parsed.scheme in VALID_SCHEMES and parsed.netloc else None
+    # href -> link, or None if it is not valid. Pages repeat many hrefs
+    # (navigation, headers, footers), each is resolved once.
+    resolved = {}
+    for href in page.hrefs:
 
         #if link is empty or is None
-        if(not link or link is None):
+        if(not href or href is None):
             continue
 
-        link = link.strip()
+        if href in resolved:
+            link = resolved[href]
+        else:
+            link = resolved[href] = resolve_link(base, href, root)
+        if link is not None:
+            links.append(link)
+
+
+    return links
+
+def resolve_link(base, href, root=None):
+    """Turns an href into the absolute url to crawl
 
-        # if is relative link
-        if (bool(urlparse(link).netloc) == False):
-            if (link is not None and link != "" and link[0] != "/"):
-                link = "/" + link
-            link = urljoin(url, link)
+    Args:
+        base : absolute url relative hrefs are resolved against
+        href : non-empty href of a link
+        root : "scheme://host" of base, if given plain paths are joined
+               to it directly, which is what urljoin would return
+
+    Returns:
+        str : canonical absolute url (see utils/canonical.py), None if it
+              is not valid
 
+    """
+    link = href.strip()
+
+    # plain path without "." or ".." segments, urljoin keeps it as it is
+    if (root is not None and link and link[:2] != "//" and "/." not in "/" + link
+            and NOT_PLAIN_PATH.isdisjoint(link)):
+        link = canonicalize(root + (link if link[0] == "/" else "/" + link))
+        return link if is_valid(link) else None
+
+    # if is relative link
+    if not urlsplit(link).netloc:
         # if is relative link, correct faulty relative links
         # e.g. `href = "internal/path"` => `href = "/internal/path"`
-        if (bool(urlparse(link).fragment)):
-            link = link.split('#')[0]
+        if (link != "" and link[0] != "/"):
+            link = "/" + link
+        link = urljoin(base, link)
 
-        if (is_valid(link)):
-            links.append(link)
+    # a fragment needs a "#", most links have none and are not parsed again
+    if "#" in link and urlsplit(link).fragment:
+        link = link.split('#')[0]
 
+    link = canonicalize(link)
+    return link if is_valid(link) else None
 
-    return links
+def valid_links(links):
+    """Validates all links of a page at once, each distinct link is checked once
+
+    Args:
+        links : list of urls, may contain duplicates
+
+    Returns:
+        list : links for which is_valid is true, in their original order
+
+    """
+    with get_metrics().timer("is_valid"):
+        verdicts = {link: is_valid(link) for link in set(links)}
+        return [link for link in links if verdicts[link]]
 
+@lru_cache(maxsize=VERDICT_CACHE_SIZE)
 def is_valid(url):
     """checks is a url is a valid url to crawl
 
+    Verdicts are cached per url, the rules only depend on the url itself.
+
     Args:
         url : url that we are currently trying to crawl
 
@@ -183,48 +273,31 @@ def is_valid(url):
     # There are already some conditions that return False.
     try:
         parsed = urlparse(url)
-        if parsed.scheme not in set(["http", "https"]):
+        if parsed.scheme not in VALID_SCHEMES:
             return False
 
         #check if url contains valid domain to visit
         new_domain = parsed.netloc.split('.', 1)
-        if len(new_domain) > 1 and new_domain[1] not in set(["ics.uci.edu", "cs.uci.edu", "informatics.uci.edu", "stat.uci.edu"]):
-            return False
-
-        # filter out any "mailto" links
-        if re.match(r"/(mailto):.*", parsed.path):
+        if len(new_domain) > 1 and new_domain[1] not in VALID_DOMAINS:
             return False
 
-        # filter out embedded javascript code
-        if re.match(r"/javascript:.*", parsed.path):
+        # filter out any "mailto" links and embedded javascript code
+        if parsed.path.startswith(BLOCKED_PATH_PREFIXES):
             return False
 
         # # filter out problematic urls (calendar, swiki)
         # if re.match(r".*(calendar|swiki|wiki).*", parsed.hostname):
         #     return False
 
-        # These if statements continue to filter out links that we do not want
-        if re.search(r"/(pdf|wp-json)/", parsed.path.lower()):
-            return False
-
-        if re.search(r"share=", parsed.query.lower()):
-            return False
-
-        if re.search(r".*\=pdf", parsed.query.lower()):
+        # These checks continue to filter out links that we do not want
+        path = parsed.path.lower()
+        if BLOCKED_PATH_QUERY.search(path + "?" + parsed.query.lower()):
             return False
 
-        return not re.match(
-            r".*\.(css|js|bmp|gif|jpe?g|ico"
-            + r"|png|tiff?|mid|mp2|mp3|mp4"
-            + r"|wav|avi|mov|mpeg|ram|m4v|mkv|ogg|ogv|pdf"
-            + r"|ps|eps|tex|ppt|pptx|doc|docx|xls|xlsx|names"
-            + r"|data|dat|exe|bz2|tar|msi|bin|7z|psd|dmg|iso"
-            + r"|epub|dll|cnf|tgz|sha1"
-            + r"|thmx|mso|arff|rtf|jar|csv"
-            + r"|apk|war|img|ppsx|pps|odc|bib|json|svg|tex|diff|db|ova|ps"
-            + r"|sql|r|m|py|r|c|h|java|scm|sh|ss|nb|ipynb|jsp"
-            + r"|rm|smil|wmv|swf|wma|zip|rar|gz)$", parsed.path.lower())
+        # file extension of the last path segment
+        _, dot, extension = path.rpartition("/")[2].rpartition(".")
+        return not (dot and extension in BLOCKED_EXTENSIONS)
 
     except TypeError:
-        print ("TypeError for ", parsed)
+        print ("TypeError for ", url)
         raise
@@ -1,11 +1,70 @@
 import re
 import hashlib
-from bs4 import BeautifulSoup       # FIXME: extract all soup references to worker.py
+from collections import Counter
+from threading import Lock
+
+from tokenizer.fingerprints import FingerprintStore
+from tokenizer.duplicates import digest, text_digest
+from tokenizer.simhash import SimHasher
+
+HASH_FILE_NAME = "HASH_FILE.bin"
+_default_store = None
+_default_store_lock = Lock()
+_hasher = SimHasher()
+# Runs of 3 or more letters and digits of the lowercased text. Shorter runs
+# can never be tokens, so they are skipped by the regex instead of in Python.
+TOKEN_PATTERN = re.compile(r"[a-z0-9]{3,}")
+STOP_WORDS = frozenset([ 'a','about','above','after','again','against','all','am','an','and','any','are',"aren't","as","at","be","because","been","before","being","below","between","both","but","by","can't","cannot","could","couldn't","did","didn't","do","does","doesn't","doing","don't","down","during","each","few","for","from","further","had","hadn't","has","hasn't","have","haven't","having","he","he'd","he'll","he's","her","here","here's","hers","herself","him","himself","his","how","how's","i","i'd","i'll","i'm","i've","if","in","into","is","isn't","it","it's","its","itself","let's","me","more","most","mustn't","my","myself","no","nor","not","of","off","on","once","only","or","other","ought","our","ours","ourselves","out","over","own","same","shan't","she","she'd","she'll","she's","should","shouldn't","so","some","such","than","that","that's","the","their","theirs","them","themselves","then","there","there's","these","they","they'd","they'll","they're","they've","this","those","through","to","too","under","until","up","very","was","wasn't","we","we'd","we'll","we're","we've","were","weren't","what","what's","when","when's","where","where's","which","while","who","who's","whom","why","why's","with","won't","would","wouldn't","you","you'd","you'll","you're","you've","your","yours","yourself","yourselves"])
+
+
+def iterTokens(text):
+    """Yields the tokens of text one at a time, in a single pass over the text.
+    Tokens are lowercased runs of at least 3 ASCII letters and digits that are
+    not stop words.
+
+    Args:
+        text: str or bytes, extracted text from HTML content i.e. no tags.
+              bytes are decoded as utf-8
+
+    Returns:
+        Iterator<Token>: tokens parsed from the text, includes duplicates
+
+    """
+    if isinstance(text, bytes):
+        text = text.decode("utf-8", "replace")
+    stop_words = STOP_WORDS
+    for match in TOKEN_PATTERN.finditer(text.lower()):
+        token = match.group()
+        if token not in stop_words:
+            yield token
+
+
+def countTokens(text, counter=None):
+    """Counts the tokens of text into a Counter. Stop words are removed from
+    the counts afterwards instead of being tested for every token.
+
+    Args:
+        text: str or bytes, as in iterTokens()
+        counter: Counter to add to, a new one if None
+
+    Returns:
+        Counter<token, count>: counter, the frequency of every token of text added
+
+    """
+    if isinstance(text, bytes):
+        text = text.decode("utf-8", "replace")
+    counts = Counter(TOKEN_PATTERN.findall(text.lower()))
+    for stop_word in STOP_WORDS.intersection(counts):
+        del counts[stop_word]
+    if counter is None:
+        return counts
+    counter.update(counts)
+    return counter
+
+
 # List<Token> tokenize(TextFile)
 def tokenize(text):
-    """Would be O(N*M), where N is the number of lines and M is the number of tokens within
-    the line. Since there is technically a nested for loop within the program for iterating through
-    the file and the list comprehension for every token, this would have to lead to a quadratic time complexity
+    """O(N) in the length of the text, the list of tokens iterTokens() yields.
 
     Assumption: tokenizer does not handle contractions
 
@@ -16,10 +75,10 @@ def tokenize(text):
         List<Token>: list of tokens parsed from HTML content, includes duplicates
 
     """
-    tokens = re.findall(r"[a-zA-Z0-9]+", text.lower())
-    stop_words = set([ 'a','about','above','after','again','against','all','am','an','and','any','are',"aren't","as","at","be","because","been","before","being","below","between","both","but","by","can't","cannot","could","couldn't","did","didn't","do","does","doesn't","doing","don't","down","during","each","few","for","from","further","had","hadn't","has","hasn't","have","haven't","having","he","he'd","he'll","he's","her","here","here's","hers","herself","him","himself","his","how","how's","i","i'd","i'll","i'm","i've","if","in","into","is","isn't","it","it's","its","itself","let's","me","more","most","mustn't","my","myself","no","nor","not","of","off","on","once","only","or","other","ought","our","ours","ourselves","out","over","own","same","shan't","she","she'd","she'll","she's","should","shouldn't","so","some","such","than","that","that's","the","their","theirs","them","themselves","then","there","there's","these","they","they'd","they'll","they're","they've","this","those","through","to","too","under","until","up","very","was","wasn't","we","we'd","we'll","we're","we've","were","weren't","what","what's","when","when's","where","where's","which","while","who","who's","whom","why","why's","with","won't","would","wouldn't","you","you'd","you'll","you're","you've","your","yours","yourself","yourselves"])
-    return [i.lower() for i in tokens if i.lower() not in stop_words and len(i.lower()) >= 3 ]
-    #exception handling
+    if isinstance(text, bytes):
+        text = text.decode("utf-8", "replace")
+    stop_words = STOP_WORDS
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in stop_words]
 
 
 def computeWordFrequencies(tokens):
@@ -27,24 +86,14 @@ def computeWordFrequencies(tokens):
     This function is O(n) because we are iterating through the array tokens which has a length of n.
 
     Args:
-        tokens: List<str>, value from tokenize(text)
+        tokens: List<str>, value from tokenize(text), already lowercase
 
     Returns:
         Map<token, count>: dictionary of each token provided from tokens and the
                            frequency it shows up
 
     """
-
-    freq = {}
-
-    #adding to hashmap
-    for i in tokens:
-        i = i.lower()
-        if i not in freq:
-            freq[i] = 1
-        else:
-            freq[i] +=1
-    return freq
+    return Counter(tokens)
 
 def findCommonTokens(text1, text2):
     """Finds common tokens between two different text strings using tokenize() function
@@ -141,19 +190,33 @@ def getFinalHash(freqs, hashes):
     hash_str = ''.join(res)
     return hash_str
 
-def compareHash(hash1, hash2):
+def getFingerprint(freqs):
+    """Integer SimHash of a page, same value as int(getFinalHash(freqs, generateHashes(freqs)), 2)
+    but computed in one batch with per-token hashes cached across pages.
+
+    Args:
+        freqs: Map<token, count>, result from computeWordFrequencies
+
+    Returns:
+        int: 128-bit fingerprint used by FingerprintStore
+
+    """
+    return _hasher.fingerprint(freqs)
+
+def compareHash(hash1, hash2, threshold=0.8):
     """Compare hashes from getFinalHash, determines if similar by SIMILARITY_THRESHOLD
 
     Args:
         hash1: str, result from getFinalHash
         hash2: str, result from getFinalHash
+        threshold: float, SIMILARITY_THRESHOLD
 
     Returns:
         bool: if hashes are within SIMILARITY_THRESHOLD
 
     """
 
-    SIMILARITY_THRESHOLD = 0.8
+    SIMILARITY_THRESHOLD = threshold
     length = 128
     numMatches = 0
     for num in range(length):
@@ -164,36 +227,53 @@ def compareHash(hash1, hash2):
         return True
     return False
 
-def checkSimilarity(resp):
+def getDefaultStore():
+    """FingerprintStore backed by HASH_FILE_NAME, used when the caller has none.
+
+    Returns:
+        FingerprintStore: process-wide store, created on first use
+
+    """
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = FingerprintStore(HASH_FILE_NAME)
+        return _default_store
+
+def checkSimilarity(resp, page=None, store=None, duplicates=None):
     """Determine if incoming URL's response is similar to any of the unique hashes
-    stored in HASH_FILE_NAME.
+    already stored.
 
     Args:
         resp: response to check if similar to other responses
+        page: ParsedPage built from resp, parsed here if not given
+        store: FingerprintStore to check against, getDefaultStore() if not given
+        duplicates: DuplicateDetector whose exact tiers are checked before the
+                    simhash, None to only check the simhash
 
     Returns:
-        bool: returns True if incoming response is similar, return False and write
-              new unique hash to file otherwise
+        bool: returns True if incoming response is similar, return False and store
+              new unique hash otherwise
 
     """
-    HASH_FILE_NAME = "HASH_FILE.txt"         # FIXME: choose different name per worker to make thread-safe
     # FIXME: what to return when resp is empty
     if resp is not None and resp.raw_response is not None and resp.raw_response.content is not None and resp.raw_response.content != "":
-        soup = BeautifulSoup(resp.raw_response.content, "html.parser")
-        tokens = tokenize(soup.get_text())
-        freqs = computeWordFrequencies(tokens)
-        hashes = generateHashes(freqs)
-        final_hash = getFinalHash(freqs, hashes)
-
-        with open(HASH_FILE_NAME, "a+", buffering=1) as f:
-            f.seek(0, 0)
-            for line in f.readlines():
-                # if line is not None and hashes similar, return True
-                if line is not None and compareHash(final_hash, line.strip()):
-                    return True
-
-            # no similar hashes found, write hash to file
-            f.write(f"{final_hash}\n")
-            return False
+        if page is None:
+            from utils.page import ParsedPage
+            page = ParsedPage(resp)
+        if store is None:
+            store = getDefaultStore()
+        if duplicates is not None and (
+                duplicates.check_raw(digest(page.content))
+                or duplicates.check_text(text_digest(page.text))):
+            return True
+        final_hash = page.fingerprint
+
+        # check_and_add looks up and stores under one lock, so two workers
+        # cannot both accept the same near-duplicate.
+        similar = store.check_and_add(final_hash)
+        if duplicates is not None:
+            duplicates.record_near(similar)
+        return similar
     # return True in the case the response is not valid so the response isn't processed
     return True
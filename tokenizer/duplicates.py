@@ -0,0 +1,99 @@
+from hashlib import blake2b
+from threading import Lock
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+# Tiers of DuplicateDetector, in the order a page goes through them.
+TIERS = ("exact_bytes", "exact_text", "near", "unique")
+
+
+def digest(data):
+    """64-bit non-cryptographic digest of data, xxh3 if xxhash is installed.
+
+    Args:
+        data: bytes or str, str is encoded as utf-8
+
+    Returns:
+        int: digest of data
+
+    """
+    if isinstance(data, str):
+        data = data.encode("utf-8", "surrogatepass")
+    if xxhash is not None:
+        return xxhash.xxh3_64_intdigest(data)
+    return int.from_bytes(blake2b(data, digest_size=8).digest(), "big")
+
+
+def text_digest(text):
+    """Digest of the extracted text of a page, ignoring case and whitespace.
+    Pages with the same text digest get the same tokens from tokenize().
+
+    Args:
+        text: str, extracted str from HTML content i.e. no tags
+
+    Returns:
+        int: digest of the normalized text
+
+    """
+    return digest(" ".join(text.lower().split()))
+
+
+class DuplicateDetector(object):
+    """Exact-duplicate tiers in front of the simhash near-duplicate check.
+
+    A page is first looked up by a digest of its raw bytes, which needs no
+    parsing, then by a digest of its normalized text, which needs the soup but
+    no tokenizing or simhash. Only pages missing from both sets go on to the
+    near-duplicate check. An exact copy of a page always has the simhash of
+    that page, so the tiers never change the verdict, they only skip work.
+    Digests of every checked page are kept, duplicate or not, since any copy
+    of it gets the same verdict. Each tier counts its hits.
+
+    Digests are kept in memory only, after a restart the simhash tier still
+    catches copies of pages crawled before.
+    """
+    def __init__(self):
+        self.lock = Lock()
+        self.raw_digests = set()
+        self.text_digests = set()
+        self.hits = dict.fromkeys(TIERS, 0)
+
+    def _check_and_add(self, digests, value, tier):
+        with self.lock:
+            if value in digests:
+                self.hits[tier] += 1
+                return True
+            digests.add(value)
+            return False
+
+    def check_raw(self, value):
+        """Returns True if a page with the digest(content) value was checked before."""
+        return self._check_and_add(self.raw_digests, value, "exact_bytes")
+
+    def check_text(self, value):
+        """Returns True if a page with the text_digest(text) value was checked before."""
+        return self._check_and_add(self.text_digests, value, "exact_text")
+
+    def record_near(self, duplicate):
+        """Counts the verdict of the simhash tier for a page both exact tiers missed."""
+        with self.lock:
+            self.hits["near" if duplicate else "unique"] += 1
+
+    def stats(self):
+        """Returns dict: hits per tier and the share of checked pages each tier decided."""
+        with self.lock:
+            hits = dict(self.hits)
+        checked = sum(hits.values())
+        stats = {"checked": checked}
+        for tier in TIERS:
+            stats[tier] = hits[tier]
+            stats[f"{tier}_rate"] = hits[tier] / checked if checked else 0.0
+        return stats
+
+    def summary(self):
+        stats = self.stats()
+        return (f"Duplicate check of {stats['checked']} pages: " + ", ".join(
+            f"{tier} {stats[tier]} ({stats[tier + '_rate']:.1%})" for tier in TIERS))
@@ -0,0 +1,183 @@
+import os
+from itertools import combinations
+from threading import RLock
+
+HASH_BITS = 128
+HASH_BYTES = HASH_BITS // 8
+
+
+if hasattr(int, "bit_count"):
+    def popcount(value):
+        """Number of set bits in a non-negative int."""
+        return value.bit_count()
+else:
+    def popcount(value):
+        """Number of set bits in a non-negative int."""
+        return bin(value).count("1")
+
+
+def max_distance(threshold, bits=HASH_BITS):
+    """Largest Hamming distance between two fingerprints that compareHash would
+    still call similar, i.e. the largest d with (bits - d) / bits > threshold.
+
+    Args:
+        threshold: float, fraction of matching bits required
+        bits: int, fingerprint width
+
+    Returns:
+        int: max distance, -1 if no two fingerprints can ever be similar
+
+    """
+    distance = -1
+    while distance < bits and (bits - distance - 1) / bits > threshold:
+        distance += 1
+    return distance
+
+
+def default_bands(distance):
+    """Band count for a FingerprintStore matching within `distance` bits: the
+    fewest bands that leave a radius of one bit flip per band.
+
+    Args:
+        distance: int, result of max_distance
+
+    Returns:
+        int: number of bands
+
+    """
+    return max(1, min(HASH_BITS, distance // 2 + 1))
+
+
+class FingerprintStore(object):
+    """Thread-safe set of integer SimHash fingerprints with a banded index.
+
+    The fingerprint is cut into `bands` bit ranges. By the pigeonhole principle
+    two fingerprints within `max_distance` bits of each other differ in at most
+    max_distance // bands bits in at least one band, so a lookup only has to
+    probe that many bit flips of each band. Candidates are confirmed with a
+    popcount of the XOR.
+
+    This is not sublinear at the default SIMILARITY. Fingerprints match
+    within 25 of 128 bits, so the default of 13 bands of 9-10 bits probes 11
+    keys of each band, and a lookup that finds nothing checks about 15% of
+    the stored fingerprints if they are random, and over a third of them for
+    pages, whose fingerprints share the bits of common words. It is still
+    about twice as fast as a linear scan since few keys are probed, see
+    benchmarks/bench_fingerprints.py, which compares band counts.
+
+    Fingerprints are persisted to an append-only file of fixed-size big-endian
+    records, which is read back in one pass on resume.
+
+    Args:
+        path: str, save file for fingerprints, None to keep them in memory only
+        threshold: float, similarity threshold as in compareHash
+        bands: int, number of bands in the index, None for default_bands
+        restart: bool, delete any existing save file before loading
+
+    """
+    def __init__(self, path=None, threshold=0.8, bands=None, restart=False):
+        self.path = path
+        self.threshold = threshold
+        self.max_distance = max_distance(threshold)
+        if bands is None:
+            bands = default_bands(self.max_distance)
+        if not 1 <= bands <= HASH_BITS:
+            raise ValueError(f"bands must be between 1 and {HASH_BITS}, got {bands}")
+        self.lock = RLock()
+        self.count = 0
+
+        # (shift, mask) of each band, widths as even as possible.
+        self.bands = []
+        start = 0
+        for i in range(bands):
+            width = HASH_BITS // bands + (1 if i < HASH_BITS % bands else 0)
+            self.bands.append((HASH_BITS - start - width, (1 << width) - 1))
+            start += width
+        self.tables = [dict() for _ in self.bands]
+
+        # XOR masks of at most `radius` flipped bits, per band width.
+        radius = self.max_distance // bands if self.max_distance >= 0 else -1
+        self.flips = {}
+        for _, mask in self.bands:
+            width = mask.bit_length()
+            if width not in self.flips:
+                self.flips[width] = [
+                    sum(1 << bit for bit in bits)
+                    for r in range(radius + 1)
+                    for bits in combinations(range(width), r)]
+
+        self.save = None
+        if path is not None:
+            if restart and os.path.exists(path):
+                os.remove(path)
+            self._load()
+            self.save = open(path, "ab")
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb") as f:
+            data = f.read()
+        usable = len(data) - len(data) % HASH_BYTES
+        for offset in range(0, usable, HASH_BYTES):
+            self._index(int.from_bytes(data[offset:offset + HASH_BYTES], "big"))
+        if usable != len(data):
+            # Drop a record torn by a crash mid-write.
+            with open(self.path, "r+b") as f:
+                f.truncate(usable)
+
+    def _index(self, fingerprint):
+        for table, (shift, mask) in zip(self.tables, self.bands):
+            key = (fingerprint >> shift) & mask
+            bucket = table.get(key)
+            if bucket is None:
+                table[key] = [fingerprint]
+            else:
+                bucket.append(fingerprint)
+        self.count += 1
+
+    def __len__(self):
+        return self.count
+
+    def find_similar(self, fingerprint):
+        """Return a stored fingerprint similar to `fingerprint`, or None."""
+        limit = self.max_distance
+        if limit < 0:
+            return None
+        with self.lock:
+            for table, (shift, mask) in zip(self.tables, self.bands):
+                key = (fingerprint >> shift) & mask
+                for flip in self.flips[mask.bit_length()]:
+                    bucket = table.get(key ^ flip)
+                    if bucket is None:
+                        continue
+                    for candidate in bucket:
+                        if popcount(candidate ^ fingerprint) <= limit:
+                            return candidate
+        return None
+
+    def add(self, fingerprint):
+        with self.lock:
+            self._index(fingerprint)
+            if self.save is not None:
+                self.save.write(fingerprint.to_bytes(HASH_BYTES, "big"))
+                self.save.flush()
+
+    def check_and_add(self, fingerprint):
+        """Atomically look up `fingerprint` and store it if nothing is similar.
+
+        Returns:
+            bool: True if a similar fingerprint was already stored
+
+        """
+        with self.lock:
+            if self.find_similar(fingerprint) is not None:
+                return True
+            self.add(fingerprint)
+            return False
+
+    def close(self):
+        with self.lock:
+            if self.save is not None:
+                self.save.close()
+                self.save = None
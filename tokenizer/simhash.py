@@ -0,0 +1,102 @@
+import hashlib
+import struct
+from collections import OrderedDict
+from threading import Lock
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from tokenizer.fingerprints import HASH_BITS, HASH_BYTES
+
+# The pure-Python engine packs one 64-bit counter per fingerprint bit into a
+# single big int, so adding a token's weight to all 128 counters is one
+# multiply-add instead of a 128-step loop.
+_FIELD_BYTES = 8
+_ZERO_FIELD = b"\x00" * _FIELD_BYTES
+_ONE_FIELD = b"\x00" * (_FIELD_BYTES - 1) + b"\x01"
+_UNPACK_FIELDS = struct.Struct(f">{HASH_BITS}Q").unpack
+
+
+class SimHasher(object):
+    """Computes integer SimHash fingerprints equal to
+    int(getFinalHash(freqs, generateHashes(freqs)), 2).
+
+    Each token's md5 is looked up once and kept in a bounded LRU shared by all
+    pages, so common words are never rehashed. A page's fingerprint is then
+    one weighted sum over a (tokens x 128) bit matrix, done with NumPy when it
+    is installed and with packed big-int counters otherwise.
+
+    Args:
+        cache_size: int, max number of tokens kept in the hash cache
+        use_numpy: bool, force the NumPy (True) or pure-Python (False)
+                   engine, None picks NumPy when it is available
+
+    """
+    def __init__(self, cache_size=1 << 17, use_numpy=None):
+        if use_numpy and numpy is None:
+            raise ImportError("numpy is not installed")
+        self.use_numpy = numpy is not None if use_numpy is None else use_numpy
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _token_hash(self, token):
+        digest = hashlib.md5(token.encode()).digest()
+        if self.use_numpy:
+            return digest
+        bits = format(int.from_bytes(digest, "big"), f"0{HASH_BITS}b").encode()
+        return int.from_bytes(
+            bits.replace(b"0", _ZERO_FIELD).replace(b"1", _ONE_FIELD), "big")
+
+    def _token_hashes(self, tokens):
+        cache = self.cache
+        res = []
+        with self.lock:
+            for token in tokens:
+                value = cache.get(token)
+                if value is None:
+                    self.misses += 1
+                    value = self._token_hash(token)
+                    cache[token] = value
+                    if len(cache) > self.cache_size:
+                        cache.popitem(last=False)
+                else:
+                    self.hits += 1
+                    cache.move_to_end(token)
+                res.append(value)
+        return res
+
+    def fingerprint(self, freqs):
+        """Fingerprint of a page.
+
+        Args:
+            freqs: Map<token, count> result from computeWordFrequencies
+
+        Returns:
+            int: 128-bit fingerprint, bit 127 is the first character of the
+                 getFinalHash string
+
+        """
+        if not freqs:
+            return 0
+        hashes = self._token_hashes(freqs)
+        total = sum(freqs.values())
+        if self.use_numpy:
+            matrix = numpy.unpackbits(
+                numpy.frombuffer(b"".join(hashes), dtype=numpy.uint8)
+                .reshape(len(hashes), HASH_BYTES), axis=1)
+            weights = numpy.fromiter(freqs.values(), dtype=numpy.int64, count=len(freqs))
+            bits = numpy.dot(weights, matrix) * 2 - total > 0
+            return int.from_bytes(numpy.packbits(bits).tobytes(), "big")
+
+        counters = 0
+        for value, count in zip(hashes, freqs.values()):
+            counters += value * count
+        res = 0
+        for ones in _UNPACK_FIELDS(counters.to_bytes(HASH_BITS * _FIELD_BYTES, "big")):
+            res = (res << 1) | (ones * 2 > total)
+        return res
@@ -0,0 +1,170 @@
+"""Canonical form of urls, so that every spelling of a url is fetched once.
+
+canonicalize lowercases the scheme and host, strips default ports and the
+fragment, resolves "." and ".." path segments, decodes percent-escapes of
+unreserved characters and uppercases the others, percent-encodes characters
+that need it, drops tracking and session parameters from the query and from
+path segments, sorts the query by key and strips trailing slashes from the
+path, as utils.normalize always did. So HTTP://WWW.ICS.UCI.EDU:80/a/../b?y=1&x=2
+becomes http://www.ics.uci.edu/b?x=2&y=1.
+"""
+from fnmatch import fnmatchcase
+from functools import lru_cache
+from urllib.parse import urlsplit, quote
+
+from utils import normalize
+
+SCHEMES = frozenset(["http", "https"])
+DEFAULT_PORTS = {"http": 80, "https": 443}
+# RFC 3986 unreserved characters, never percent-encoded in a canonical url.
+UNRESERVED = frozenset("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-._~")
+HEX_DIGITS = frozenset("0123456789ABCDEFabcdef")
+# Characters kept as they are, every other one is percent-encoded. "%" is
+# kept for the escapes already there, see _normalize_escapes.
+PATH_SAFE = "/:@!$&'()*+,;=-._~%"
+QUERY_SAFE = "/?:@!$'()*+,;=-._~%"
+# Query and path parameters dropped by default: share buttons, reply links,
+# analytics tags, session ids and the sort keys of Apache directory listings,
+# as in ?C=N;O=D.
+DEFAULT_DROP_PARAMS = (
+    "share", "replytocom", "utm_*", "fbclid", "gclid", "sessionid", "session_id",
+    "phpsessid", "jsessionid", "c=[nmsd]", "o=[ad]")
+# Number of urls whose canonical form is remembered.
+CANONICAL_CACHE_SIZE = 1 << 16
+
+_enabled = True
+_drop_exact = frozenset()
+_drop_patterns = ()
+_drop_pairs = ()
+
+
+def set_canonical_rules(enabled=True, drop_params=DEFAULT_DROP_PARAMS):
+    """Chooses how canonicalize treats urls. Call it before crawling, and in
+    every parse process, so all of them agree on the canonical urls.
+
+    Args:
+        enabled : bool, False keeps urls as utils.normalize leaves them
+        drop_params : names of the query and path parameters to drop,
+            case-insensitive, "*", "?" and "[...]" match like in file
+            names. A "name=value" entry only drops the parameter with a
+            matching value.
+
+    """
+    global _enabled, _drop_exact, _drop_patterns, _drop_pairs
+    names = [name.strip().lower() for name in drop_params if name.strip()]
+    _enabled = enabled
+    _drop_pairs = tuple(name for name in names if "=" in name)
+    names = [name for name in names if "=" not in name]
+    _drop_exact = frozenset(name for name in names if not any(char in name for char in "*?["))
+    _drop_patterns = tuple(name for name in names if name not in _drop_exact)
+    _canonicalize.cache_clear()
+
+
+def _dropped(param):
+    """Whether the "name=value" query or path parameter param is dropped."""
+    param = param.lower()
+    name = param.split("=", 1)[0]
+    return (name in _drop_exact
+            or any(fnmatchcase(name, pattern) for pattern in _drop_patterns)
+            or any(fnmatchcase(param, pair) for pair in _drop_pairs))
+
+
+def _normalize_escapes(text, safe):
+    """Percent-encodes what is not in safe, decodes escapes of unreserved
+    characters, uppercases the others and encodes a "%" starting none."""
+    text = quote(text, safe=safe)
+    if "%" not in text:
+        return text
+    pieces = text.split("%")
+    normalized = [pieces[0]]
+    for piece in pieces[1:]:
+        if len(piece) >= 2 and piece[0] in HEX_DIGITS and piece[1] in HEX_DIGITS:
+            char = chr(int(piece[:2], 16))
+            normalized.append(char + piece[2:] if char in UNRESERVED else "%" + piece[:2].upper() + piece[2:])
+        else:
+            normalized.append("%25" + piece)
+    return "".join(normalized)
+
+
+def _remove_dot_segments(path):
+    segments = path.split("/")
+    if "." not in segments and ".." not in segments:
+        return path
+    resolved = []
+    for segment in segments[1:]:
+        if segment == "..":
+            if resolved:
+                resolved.pop()
+        elif segment != ".":
+            resolved.append(segment)
+    if segments[-1] in (".", ".."):
+        resolved.append("")
+    return "/" + "/".join(resolved)
+
+
+def _canonical_path(path):
+    if ";" in path:
+        # path parameters such as /index.php;jsessionid=1234
+        segments = []
+        for segment in path.split("/"):
+            name, *params = segment.split(";")
+            segments.append(";".join([name] + [param for param in params if not _dropped(param)]))
+        path = "/".join(segments)
+    path = _remove_dot_segments(_normalize_escapes(path, PATH_SAFE))
+    return path.rstrip("/")
+
+
+def _canonical_query(query):
+    params = []
+    for param in query.split("&"):
+        if ";" in param:
+            # parameters separated by ";", as in ?C=N;O=D
+            param = ";".join(part for part in param.split(";") if not _dropped(part))
+        elif _dropped(param):
+            continue
+        if param:
+            params.append(_normalize_escapes(param, QUERY_SAFE))
+    # stable, values of a repeated key keep their order
+    params.sort(key=lambda param: param.split("=", 1)[0])
+    return "&".join(params)
+
+
+@lru_cache(maxsize=CANONICAL_CACHE_SIZE)
+def _canonicalize(url):
+    try:
+        parsed = urlsplit(url.strip())
+        port = parsed.port
+    except ValueError:
+        # invalid port or host, left for is_valid to reject
+        return normalize(url)
+    if parsed.scheme not in SCHEMES or not parsed.hostname:
+        return normalize(url)
+    host = parsed.hostname.rstrip(".")
+    if not host or " " in host or not host.isprintable():
+        # not a host name, left for is_valid to reject
+        return normalize(url)
+    if ":" in host:
+        host = f"[{host}]"
+    if parsed.username is not None:
+        userinfo = parsed.username if parsed.password is None else f"{parsed.username}:{parsed.password}"
+        host = f"{userinfo}@{host}"
+    if port is not None and port != DEFAULT_PORTS[parsed.scheme]:
+        host = f"{host}:{port}"
+    query = _canonical_query(parsed.query) if parsed.query else ""
+    return f"{parsed.scheme}://{host}{_canonical_path(parsed.path)}" + (f"?{query}" if query else "")
+
+
+def canonicalize(url):
+    """Returns the canonical form of url, see the module docstring. Urls
+    that are not http(s) are only normalized.
+
+    Args:
+        url : str, absolute url
+
+    """
+    if not _enabled:
+        return normalize(url)
+    return _canonicalize(url)
+
+
+set_canonical_rules()
@@ -0,0 +1,195 @@
+from threading import Condition, Lock
+
+from utils import get_logger
+from utils.metrics import get_metrics
+
+_controller = None
+_controller_lock = Lock()
+
+
+class _Slot(object):
+    __slots__ = ("controller",)
+
+    def __init__(self, controller):
+        self.controller = controller
+
+    def __enter__(self):
+        self.controller.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.controller.release()
+
+
+class NullController(object):
+    """ Controller used when [CONCURRENCY] ADAPTIVE is false: no limit besides
+    the number of workers. """
+    enabled = False
+
+    def slot(self):
+        return _NULL_SLOT
+
+    def acquire(self):
+        pass
+
+    def try_acquire(self):
+        return True
+
+    def on_slot_free(self, callback):
+        return False
+
+    def release(self):
+        pass
+
+    def observe(self, latency, failed):
+        pass
+
+
+class _NullSlot(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+_NULL_SLOT = _NullSlot()
+
+
+class AIMDController(NullController):
+    """ Additive-increase, multiplicative-decrease limit on in-flight fetches.
+
+    Workers take a slot before they ask the frontier for a url and return it
+    after the download, so at most `window` downloads run at once. The
+    frontier still spaces out fetches of a host by POLITENESS, the window
+    only decides how many hosts are fetched in parallel.
+
+    Every answer of the cache server is observed. While the smoothed latency
+    stays under LATENCYLIMIT, or when no limit is set under TOLERANCE times
+    the baseline, a much slower moving average of the latency, the window
+    grows by about one slot per window of answers. A failed request or a latency over the limit multiplies the
+    window by BACKOFF, at most once per window of answers so that the answers
+    to requests sent before a decrease do not shrink it again. The window
+    stays between MIN and MAX.
+
+    Args:
+        config : Config object with the [CONCURRENCY] settings
+
+    """
+    enabled = True
+
+    def __init__(self, config):
+        self.logger = get_logger("CONCURRENCY")
+        self.minimum = max(1, config.concurrency_min)
+        self.maximum = max(self.minimum, config.concurrency_max)
+        self.latency_limit = config.concurrency_latency_limit
+        self.tolerance = config.concurrency_tolerance
+        self.backoff = config.concurrency_backoff
+        self.alpha = 0.2
+        self.baseline_alpha = 0.01
+        self.lock = Lock()
+        self.slot_free = Condition(self.lock)
+        # callbacks of on_slot_free, for workers that cannot block a thread
+        self.listeners = []
+        self.window = float(min(self.maximum, max(self.minimum, config.threads_count)))
+        self.in_flight = 0
+        self.smoothed = None
+        self.baseline = None
+        self.answers = 0
+        # answers observed when the window was last decreased
+        self.last_decrease = -self.maximum
+        self.failures = 0
+        metrics = get_metrics()
+        metrics.gauge("concurrency_window", lambda: self.window)
+        metrics.gauge("concurrency_in_flight", lambda: self.in_flight)
+        self.logger.info(f"Starting with {int(self.window)} fetches in flight, "
+                         f"between {self.minimum} and {self.maximum}.")
+
+    def slot(self):
+        return _Slot(self)
+
+    def acquire(self):
+        with self.lock:
+            while self.in_flight >= int(self.window):
+                self.slot_free.wait()
+            self.in_flight += 1
+
+    def try_acquire(self):
+        with self.lock:
+            if self.in_flight >= int(self.window):
+                return False
+            self.in_flight += 1
+            return True
+
+    def on_slot_free(self, callback):
+        """ Calls callback, from the thread that frees it, once a slot may be
+        free, for workers that cannot wait in acquire. Returns False without
+        calling it if a slot is free now. """
+        with self.lock:
+            if self.in_flight < int(self.window):
+                return False
+            self.listeners.append(callback)
+            return True
+
+    def _wake_listeners(self):
+        with self.lock:
+            listeners, self.listeners = self.listeners, []
+        for callback in listeners:
+            callback()
+
+    def release(self):
+        with self.lock:
+            self.in_flight -= 1
+            self.slot_free.notify()
+        if self.listeners:
+            self._wake_listeners()
+
+    def _limit(self):
+        if self.latency_limit:
+            return self.latency_limit
+        return self.baseline * self.tolerance
+
+    def observe(self, latency, failed):
+        """ Adjusts the window to the latency of one request and whether it
+        failed, i.e. could not reach the cache server or got a 5xx answer. """
+        with self.lock:
+            self.answers += 1
+            self.failures += failed
+            if not failed:
+                if self.smoothed is None:
+                    self.smoothed = self.baseline = latency
+                self.smoothed += self.alpha * (latency - self.smoothed)
+                self.baseline += self.baseline_alpha * (latency - self.baseline)
+            old = self.window
+            congested = failed or (self.smoothed is not None and self.smoothed > self._limit())
+            if congested:
+                if self.answers - self.last_decrease < old:
+                    return
+                self.last_decrease = self.answers
+                self.window = max(self.minimum, old * self.backoff)
+            else:
+                self.window = min(self.maximum, old + 1 / old)
+            if int(self.window) > int(old):
+                # wake a worker for the new slot
+                self.slot_free.notify()
+            smoothed = self.smoothed
+        if int(self.window) > int(old) and self.listeners:
+            self._wake_listeners()
+        if int(self.window) != int(old):
+            reason = "failed request" if failed else f"latency {smoothed:.3f}s"
+            (self.logger.warning if congested else self.logger.info)(
+                f"{'Decreased' if congested else 'Increased'} fetches in flight "
+                f"from {int(old)} to {int(self.window)}, {reason}.")
+            get_metrics().inc("concurrency_changes", direction="down" if congested else "up")
+
+
+def get_controller(config):
+    """ Returns the concurrency controller shared by all workers, a
+    NullController unless [CONCURRENCY] ADAPTIVE is set. """
+    global _controller
+    with _controller_lock:
+        if _controller is None:
+            _controller = AIMDController(config) if config.concurrency_adaptive else NullController()
+        return _controller
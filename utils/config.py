@@ -8,12 +8,89 @@ class Config(object):
         assert self.user_agent != "DEFAULT AGENT", "Set useragent in config.ini"
         assert re.match(r"^[a-zA-Z0-9_ ,]+$", self.user_agent), "User agent should not have any special characters outside '_', ',' and 'space'"
         self.threads_count = int(config["LOCAL PROPERTIES"]["THREADCOUNT"])
+        self.stats_merge = config.getint("LOCAL PROPERTIES", "STATSMERGE", fallback=50)
+        self.top_words_capacity = config.getint("LOCAL PROPERTIES", "TOPWORDSCAPACITY", fallback=0)
+        self.async_fetches = config.getint("LOCAL PROPERTIES", "ASYNCFETCHES", fallback=200)
+        self.parse_workers = config.getint("LOCAL PROPERTIES", "PARSEWORKERS", fallback=4)
+        self.text_backend = config.get("LOCAL PROPERTIES", "TEXTBACKEND", fallback="html.parser")
+        self.parse_processes = config.getint("LOCAL PROPERTIES", "PARSEPROCESSES", fallback=0)
+        self.parse_queue = config.getint("LOCAL PROPERTIES", "PARSEQUEUE", fallback=0)
         self.save_file = config["LOCAL PROPERTIES"]["SAVE"]
+        self.seen_capacity = config.getint("LOCAL PROPERTIES", "SEENCAPACITY", fallback=100000)
+        self.seen_error_rate = config.getfloat("LOCAL PROPERTIES", "SEENERRORRATE", fallback=1e-6)
+        self.seen_verify = config.getboolean("LOCAL PROPERTIES", "SEENVERIFY", fallback=False)
+        self.storage = config.get("LOCAL PROPERTIES", "STORAGE", fallback="sqlite")
+        self.flush_batch = config.getint("LOCAL PROPERTIES", "FLUSHBATCH", fallback=500)
+        self.flush_interval = config.getfloat("LOCAL PROPERTIES", "FLUSHINTERVAL", fallback=1.0)
+        self.checkpoint_file = config.get("LOCAL PROPERTIES", "CHECKPOINT", fallback=f"{self.save_file}.ckpt")
+        self.checkpoint_interval = config.getfloat("LOCAL PROPERTIES", "CHECKPOINTINTERVAL", fallback=300.0)
 
         self.host = config["CONNECTION"]["HOST"]
         self.port = int(config["CONNECTION"]["PORT"])
+        self.connect_timeout = config.getfloat("CONNECTION", "CONNECTTIMEOUT", fallback=5.0)
+        self.read_timeout = config.getfloat("CONNECTION", "READTIMEOUT", fallback=60.0)
+        self.retries = config.getint("CONNECTION", "RETRIES", fallback=3)
+        self.backoff = config.getfloat("CONNECTION", "BACKOFF", fallback=0.5)
+        self.max_backoff = config.getfloat("CONNECTION", "MAXBACKOFF", fallback=10.0)
+        self.max_bytes = config.getint("CONNECTION", "MAXBYTES", fallback=16 << 20)
 
         self.seed_urls = config["CRAWLER"]["SEEDURL"].split(",")
         self.time_delay = float(config["CRAWLER"]["POLITENESS"])
+        self.similarity_threshold = config.getfloat("CRAWLER", "SIMILARITY", fallback=0.8)
+        self.crawl_order = config.get("CRAWLER", "ORDER", fallback="dfs")
+        self.order_depth_weight = config.getfloat("CRAWLER", "DEPTHWEIGHT", fallback=0.1)
+        self.order_host_weight = config.getfloat("CRAWLER", "HOSTWEIGHT", fallback=1.0)
+
+        self.hash_file = config.get("LOCAL PROPERTIES", "HASHFILE", fallback="fingerprints.bin")
+        self.simhash_bands = config.getint("LOCAL PROPERTIES", "SIMHASHBANDS", fallback=0) or None
+
+        self.metrics_enabled = config.getboolean("METRICS", "ENABLED", fallback=False)
+        self.metrics_file = config.get("METRICS", "SNAPSHOTFILE", fallback="metrics.json")
+        self.metrics_interval = config.getfloat("METRICS", "SNAPSHOTINTERVAL", fallback=10.0)
+        self.metrics_port = config.getint("METRICS", "PORT", fallback=0)
+        self.profile_file = config.get("METRICS", "PROFILEFILE", fallback="profile.on")
+        self.profile_output = config.get("METRICS", "PROFILEOUT", fallback="profile.prof")
+        self.concurrency_adaptive = config.getboolean("CONCURRENCY", "ADAPTIVE", fallback=False)
+        self.concurrency_min = config.getint("CONCURRENCY", "MIN", fallback=1)
+        self.concurrency_max = config.getint("CONCURRENCY", "MAX", fallback=32)
+        self.concurrency_latency_limit = config.getfloat("CONCURRENCY", "LATENCYLIMIT", fallback=0.0)
+        self.concurrency_tolerance = config.getfloat("CONCURRENCY", "TOLERANCE", fallback=2.0)
+        self.concurrency_backoff = config.getfloat("CONCURRENCY", "BACKOFF", fallback=0.5)
+        # Threads of the thread and process engines, each fetches one page at a time.
+        self.fetch_threads = (
+            max(self.threads_count, self.concurrency_max) if self.concurrency_adaptive
+            else self.threads_count)
+        self.traps_enabled = config.getboolean("TRAPS", "ENABLED", fallback=False)
+        self.trap_warmup = config.getint("TRAPS", "WARMUP", fallback=10)
+        self.trap_alpha = config.getfloat("TRAPS", "ALPHA", fallback=0.1)
+        self.trap_defer_yield = config.getfloat("TRAPS", "DEFERYIELD", fallback=0.25)
+        self.trap_drop_yield = config.getfloat("TRAPS", "DROPYIELD", fallback=0.05)
+        self.trap_budget = config.getint("TRAPS", "BUDGET", fallback=1000)
+        self.trap_repeat_limit = config.getint("TRAPS", "REPEATLIMIT", fallback=3)
+        self.history_enabled = config.getboolean("RECRAWL", "ENABLED", fallback=False)
+        self.history_file = config.get("RECRAWL", "HISTORY", fallback=f"{self.save_file}.history")
+        self.recrawl_interval = config.getfloat("RECRAWL", "INTERVAL", fallback=7.0)
+        self.recrawl_min_interval = config.getfloat("RECRAWL", "MININTERVAL", fallback=1.0)
+        self.recrawl_max_interval = config.getfloat("RECRAWL", "MAXINTERVAL", fallback=56.0)
+        # Set by launch.py --recrawl.
+        self.recrawl = False
+        self.records_enabled = config.getboolean("RECORDS", "ENABLED", fallback=False)
+        self.records_directory = config.get("RECORDS", "DIRECTORY", fallback="records")
+        self.records_segment_bytes = config.getint("RECORDS", "SEGMENTBYTES", fallback=64 * 1024 * 1024)
+        self.canonical_enabled = config.getboolean("CANONICAL", "ENABLED", fallback=True)
+        self.canonical_drop_params = [
+            name.strip() for name in config.get(
+                "CANONICAL", "DROPPARAMS",
+                fallback="share,replytocom,utm_*,fbclid,gclid,sessionid,session_id,phpsessid,jsessionid,C=[NMSD],O=[AD]").split(",")
+            if name.strip()]
+        # Set by launch.py --node, None unless this is a node of a distributed crawl.
+        self.node_id = None
+        self.node_addresses = [
+            (address.rsplit(":", 1)[0], int(address.rsplit(":", 1)[1]))
+            for address in config.get("DISTRIBUTED", "ADDRESSES", fallback="").split(",") if address.strip()]
+        self.node_port = config.getint("DISTRIBUTED", "PORT", fallback=9400)
+        self.node_directory = config.get("DISTRIBUTED", "DIRECTORY", fallback="nodes")
+        self.node_batch = config.getint("DISTRIBUTED", "BATCH", fallback=200)
+        self.node_flush_interval = config.getfloat("DISTRIBUTED", "FLUSHINTERVAL", fallback=0.5)
 
         self.cache_server = None
\ No newline at end of file
@@ -0,0 +1,122 @@
+import math
+import random
+
+from array import array
+
+BUCKET_SIZE = 4
+# Fraction of slots filled before a scalable filter adds the next filter.
+MAX_LOAD = 0.9
+MAX_KICKS = 500
+
+
+class CuckooFilter(object):
+    """Cuckoo filter over binary digests of at least 16 bytes.
+
+    Every item is reduced to a small fingerprint stored in one of two buckets
+    of BUCKET_SIZE slots, so a lookup compares at most 8 slots. Items must
+    already be uniformly distributed digests such as sha256 output.
+
+    Args:
+        capacity: int, items the filter is sized for
+        fingerprint_bits: int, bits per fingerprint, at most 32. The false
+                          positive rate is about 2 * BUCKET_SIZE / 2^bits
+
+    """
+    def __init__(self, capacity, fingerprint_bits):
+        self.capacity = capacity
+        self.fingerprint_bits = fingerprint_bits
+        self.fingerprint_mask = (1 << fingerprint_bits) - 1
+        num_buckets = 1
+        while num_buckets * BUCKET_SIZE * MAX_LOAD < capacity:
+            num_buckets *= 2
+        self.bucket_mask = num_buckets - 1
+        self.table = array("I", bytes(4 * num_buckets * BUCKET_SIZE))
+        # Fingerprints that found no slot, checked on every lookup.
+        self.stash = set()
+        self.count = 0
+
+    def _locate(self, digest):
+        fingerprint = (int.from_bytes(digest[8:12], "big") & self.fingerprint_mask) or 1
+        i1 = int.from_bytes(digest[:8], "big") & self.bucket_mask
+        return fingerprint, i1, self._alternate(i1, fingerprint)
+
+    def _alternate(self, bucket, fingerprint):
+        return (bucket ^ (fingerprint * 0x5bd1e995)) & self.bucket_mask
+
+    def _bucket(self, bucket):
+        start = bucket * BUCKET_SIZE
+        return self.table[start:start + BUCKET_SIZE]
+
+    def __contains__(self, digest):
+        fingerprint, i1, i2 = self._locate(digest)
+        return (fingerprint in self._bucket(i1) or fingerprint in self._bucket(i2)
+                or (i1, fingerprint) in self.stash or (i2, fingerprint) in self.stash)
+
+    @property
+    def full(self):
+        return self.count >= self.capacity or len(self.stash) > 0
+
+    def add(self, digest):
+        fingerprint, i1, i2 = self._locate(digest)
+        self.count += 1
+        for bucket in (i1, i2):
+            slots = self._bucket(bucket)
+            if 0 in slots:
+                self.table[bucket * BUCKET_SIZE + slots.index(0)] = fingerprint
+                return
+        bucket = random.choice((i1, i2))
+        for _ in range(MAX_KICKS):
+            slot = bucket * BUCKET_SIZE + random.randrange(BUCKET_SIZE)
+            fingerprint, self.table[slot] = self.table[slot], fingerprint
+            bucket = self._alternate(bucket, fingerprint)
+            slots = self._bucket(bucket)
+            if 0 in slots:
+                self.table[bucket * BUCKET_SIZE + slots.index(0)] = fingerprint
+                return
+        self.stash.add((bucket, fingerprint))
+
+
+class ScalableCuckooFilter(object):
+    """Cuckoo filter that grows by adding larger, stricter filters when full.
+
+    Filter i holds initial_capacity * 2^i items with one more fingerprint bit
+    than filter i - 1, so the false positive rates form a geometric series
+    whose sum stays below `error_rate`, while memory stays at about 4 bytes
+    per item.
+
+    Args:
+        initial_capacity: int, items held by the first filter
+        error_rate: float, bound on the overall false positive rate
+
+    """
+    def __init__(self, initial_capacity=100000, error_rate=1e-6):
+        self.initial_capacity = initial_capacity
+        self.error_rate = error_rate
+        # Filter i has rate 2 * BUCKET_SIZE / 2^bits = error_rate / 2^(i + 1).
+        self.base_bits = math.ceil(math.log2(2 * BUCKET_SIZE / error_rate) + 1)
+        self.filters = []
+        self._grow()
+
+    def _grow(self):
+        i = len(self.filters)
+        self.filters.append(CuckooFilter(
+            self.initial_capacity * 2 ** i, min(32, self.base_bits + i)))
+
+    def __contains__(self, digest):
+        return any(digest in f for f in reversed(self.filters))
+
+    def __len__(self):
+        return sum(f.count for f in self.filters)
+
+    @property
+    def size_in_bytes(self):
+        return sum(f.table.itemsize * len(f.table) for f in self.filters)
+
+    def add(self, digest):
+        """Adds digest, returns False if it was (probably) already present."""
+        if digest in self:
+            return False
+        if self.filters[-1].full:
+            self._grow()
+        self.filters[-1].add(digest)
+        return True
@@ -1,21 +1,196 @@
 import requests
 import cbor
 import time
+import random
+
+from threading import Lock
+from requests.adapters import HTTPAdapter
 
 from utils.response import Response
+from utils.concurrency import get_controller
+
+# Status of the Response returned when the cache server could not be reached.
+NO_RESPONSE_STATUS = 0
+# Status of the Response returned when the answer is larger than MAXBYTES.
+TOO_LARGE_STATUS = 413
+# Bytes read at a time while streaming an answer.
+CHUNK_SIZE = 1 << 16
+
+# One DownloadClient per distinct client_key, shared by the workers using it.
+_clients = dict()
+_client_lock = Lock()
+
+
+class ResponseTooLarge(Exception):
+    """Raised when an answer of the cache server is larger than MAXBYTES."""
+    def __init__(self, size):
+        super().__init__(f"answer of at least {size} bytes")
+        self.size = size
+
+
+def read_body(resp, max_bytes):
+    """Reads the body of a streamed requests.Response, giving up as soon as
+    the Content-Length or the bytes read so far exceed max_bytes (0 for no
+    limit), so an oversized answer is never held in memory.
+
+    Raises:
+        ResponseTooLarge : the body is larger than max_bytes
+
+    """
+    length = resp.headers.get("Content-Length", "")
+    if max_bytes and length.isdigit() and int(length) > max_bytes:
+        resp.close()
+        raise ResponseTooLarge(int(length))
+    chunks = []
+    size = 0
+    for chunk in resp.iter_content(CHUNK_SIZE):
+        size += len(chunk)
+        if max_bytes and size > max_bytes:
+            resp.close()
+            raise ResponseTooLarge(size)
+        chunks.append(chunk)
+    return chunks[0] if len(chunks) == 1 else b"".join(chunks)
+
+
+def backoff_delay(config, attempt):
+    """Seconds to wait before retrying a request that failed attempt + 1
+    times: a random time up to BACKOFF * 2^attempt, capped at MAXBACKOFF."""
+    return random.uniform(0, min(config.max_backoff, config.backoff * 2 ** attempt))
+
+
+class DownloadClient(object):
+    """Thread-safe client for the cache server.
+
+    Keeps one keep-alive connection pool sized to the number of workers, puts
+    connect/read timeouts on every request, and retries connection errors,
+    timeouts and 5xx answers with exponential backoff and full jitter.
+    Answers are streamed and abandoned once they exceed MAXBYTES.
+    The latency of every request is recorded on the returned Response and in
+    the client's running statistics.
+
+    Args:
+        config : Config object, the cache server must already be set
+
+    """
+    def __init__(self, config):
+        self.config = config
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=1, pool_maxsize=max(1, config.fetch_threads),
+            max_retries=0)
+        self.session.mount("http://", adapter)
+        self.timeout = (config.connect_timeout, config.read_timeout)
+        self.lock = Lock()
+        self.requests = 0
+        self.failures = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self.last_latency = None
+        self.controller = get_controller(config)
+
+    def _record(self, latency, failed):
+        self.controller.observe(latency, failed)
+        with self.lock:
+            self.requests += 1
+            self.failures += failed
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+            self.last_latency = latency
+
+    def stats(self):
+        """Returns dict: requests, failures, mean/max/last latency in seconds."""
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "failures": self.failures,
+                "mean_latency": self.total_latency / self.requests if self.requests else None,
+                "max_latency": self.max_latency,
+                "last_latency": self.last_latency}
+
+    def _backoff(self, attempt):
+        time.sleep(backoff_delay(self.config, attempt))
+
+    def download(self, url, logger=None):
+        host, port = self.config.cache_server
+        resp = error = body = None
+        for attempt in range(self.config.retries + 1):
+            if attempt:
+                self._backoff(attempt - 1)
+            start = time.monotonic()
+            try:
+                resp = self.session.get(
+                    f"http://{host}:{port}/",
+                    params=[("q", f"{url}"), ("u", f"{self.config.user_agent}")],
+                    timeout=self.timeout, stream=True)
+                body = read_body(resp, self.config.max_bytes)
+                error = None
+            except (requests.ConnectionError, requests.Timeout,
+                    requests.exceptions.ChunkedEncodingError) as e:
+                resp, error = None, e
+            except ResponseTooLarge as e:
+                latency = time.monotonic() - start
+                self._record(latency, False)
+                if logger:
+                    logger.warning(f"Skipped {url}, {e} is over {self.config.max_bytes} bytes.")
+                res = Response({
+                    "error": f"Response of {url} is over {self.config.max_bytes} bytes.",
+                    "status": TOO_LARGE_STATUS,
+                    "url": url})
+                res.latency = latency
+                return res
+            latency = time.monotonic() - start
+            failed = resp is None or resp.status_code >= 500
+            self._record(latency, failed)
+            if not failed:
+                break
+            if logger:
+                reason = repr(error) if resp is None else resp.status_code
+                logger.warning(f"Attempt {attempt + 1} for {url} failed: {reason}.")
+
+        if resp is None:
+            if logger:
+                logger.error(f"Spacetime Response error {error!r} with url {url}.")
+            res = Response({
+                "error": f"Spacetime Response error {error!r} with url {url}.",
+                "status": NO_RESPONSE_STATUS,
+                "url": url})
+            res.latency = latency
+            return res
+        try:
+            if resp and body:
+                res = Response(cbor.loads(body))
+                res.latency = latency
+                return res
+        except (EOFError, ValueError) as e:
+            pass
+        if logger:
+            logger.error(f"Spacetime Response error {resp} with url {url}.")
+        res = Response({
+            "error": f"Spacetime Response error {resp} with url {url}.",
+            "status": resp.status_code,
+            "url": url})
+        res.latency = latency
+        return res
+
+
+def client_key(config):
+    """The settings of config a DownloadClient is built with or reads."""
+    return (tuple(config.cache_server), config.user_agent, config.connect_timeout,
+            config.read_timeout, config.retries, config.backoff, config.max_backoff,
+            config.max_bytes, config.fetch_threads)
+
+
+def get_client(config):
+    """Returns the DownloadClient shared by all workers whose config has the
+    same client_key, created on first use. Workers of a crawler with other
+    settings, such as another node or benchmark run, get their own."""
+    key = client_key(config)
+    with _client_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = DownloadClient(config)
+        return client
+
 
 def download(url, config, logger=None):
-    host, port = config.cache_server
-    resp = requests.get(
-        f"http://{host}:{port}/",
-        params=[("q", f"{url}"), ("u", f"{config.user_agent}")])
-    try:
-        if resp and resp.content:
-            return Response(cbor.loads(resp.content))
-    except (EOFError, ValueError) as e:
-        pass
-    logger.error(f"Spacetime Response error {resp} with url {url}.")
-    return Response({
-        "error": f"Spacetime Response error {resp} with url {url}.",
-        "status": resp.status_code,
-        "url": url})
+    return get_client(config).download(url, logger)
@@ -0,0 +1,341 @@
+import cProfile
+import json
+import os
+import pstats
+import time
+from bisect import bisect_left
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from threading import Thread, Lock, Event, local, current_thread
+
+from utils import get_logger
+
+# Upper bounds of the histogram buckets in seconds, 50us doubling up to ~52s.
+BUCKETS = tuple(0.00005 * 2 ** i for i in range(21))
+PREFIX = "crawler_"
+
+
+class Histogram(object):
+    """ Counts of observed durations in fixed exponential buckets. """
+    def __init__(self):
+        self.lock = Lock()
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        index = bisect_left(BUCKETS, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+            if value > self.max:
+                self.max = value
+
+    def quantile(self, fraction):
+        """ Upper bound of the bucket holding the quantile, max for the last one. """
+        with self.lock:
+            rank = fraction * self.count
+            seen = 0
+            for index, count in enumerate(self.counts):
+                seen += count
+                if count and seen >= rank:
+                    return min(BUCKETS[index], self.max) if index < len(BUCKETS) else self.max
+            return 0.0
+
+    def snapshot(self):
+        with self.lock:
+            count, total, largest = self.count, self.sum, self.max
+        return {
+            "count": count, "sum": total, "mean": total / count if count else 0.0,
+            "p50": self.quantile(0.5), "p90": self.quantile(0.9),
+            "p99": self.quantile(0.99), "max": largest}
+
+
+class Timer(object):
+    """ Context manager adding the duration of its block to a Histogram. """
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+class NullTimer(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+NULL_TIMER = NullTimer()
+
+
+class NullMetrics(object):
+    """ Metrics used when [METRICS] ENABLED is false, every call does nothing. """
+    enabled = False
+
+    def timer(self, name):
+        return NULL_TIMER
+
+    def observe(self, name, seconds):
+        pass
+
+    def inc(self, name, amount=1, **labels):
+        pass
+
+    def gauge(self, name, value):
+        pass
+
+    def profile_checkpoint(self):
+        pass
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+
+class Metrics(NullMetrics):
+    """ Timers, counters and gauges of a crawl.
+
+    Stages are timed with `with metrics.timer("parse"):` or observe(), events
+    counted with inc(), and gauges set to a value or to a function called
+    whenever a snapshot is taken. A background thread writes a JSON snapshot
+    to SNAPSHOTFILE every SNAPSHOTINTERVAL seconds, and with PORT set the
+    same metrics are served in the Prometheus text format on
+    http://127.0.0.1:PORT/metrics.
+
+    Creating PROFILEFILE turns cProfile on in every thread that calls
+    profile_checkpoint(), deleting it turns profiling off again and writes the
+    collected stats to PROFILEOUT, readable with pstats or snakeviz.
+    """
+    enabled = True
+
+    def __init__(self, config):
+        self.config = config
+        self.logger = get_logger("METRICS")
+        self.lock = Lock()
+        self.histograms = dict()
+        self.counters = dict()
+        self.gauges = dict()
+        self.started = time.time()
+        self.stopped = Event()
+        self.thread = None
+        self.server = None
+        # cProfile is per thread, so each thread enables its own profiler,
+        # and only that thread stops it, see profile_checkpoint.
+        self.profiling = False
+        # thread -> its running profiler
+        self.profilers = dict()
+        # stopped profilers with their stats created, to be dumped
+        self.profiles = list()
+        self.local = local()
+
+    def _histogram(self, name):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            with self.lock:
+                histogram = self.histograms.setdefault(name, Histogram())
+        return histogram
+
+    def timer(self, name):
+        return Timer(self._histogram(name))
+
+    def observe(self, name, seconds):
+        self._histogram(name).observe(seconds)
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def gauge(self, name, value):
+        with self.lock:
+            self.gauges[name] = value
+
+    def snapshot(self):
+        """ Returns all metrics as a JSON serializable dict. """
+        with self.lock:
+            histograms = dict(self.histograms)
+            counters = dict(self.counters)
+            gauges = dict(self.gauges)
+        return {
+            "time": time.time(),
+            "uptime": time.time() - self.started,
+            "timers": {name: histogram.snapshot() for name, histogram in sorted(histograms.items())},
+            "counters": {
+                name + "".join(f"{{{key}={value}}}" for key, value in labels): count
+                for (name, labels), count in sorted(counters.items())},
+            "gauges": {
+                name: value() if callable(value) else value
+                for name, value in sorted(gauges.items())}}
+
+    def prometheus(self):
+        """ Returns all metrics in the Prometheus text exposition format. """
+        with self.lock:
+            histograms = dict(self.histograms)
+            counters = dict(self.counters)
+            gauges = dict(self.gauges)
+        lines = []
+        for name, histogram in sorted(histograms.items()):
+            metric = f"{PREFIX}{name}_seconds"
+            with histogram.lock:
+                counts, count, total = list(histogram.counts), histogram.count, histogram.sum
+            lines.append(f"# TYPE {metric} histogram")
+            cumulative = 0
+            for bound, bucket in zip(BUCKETS, counts):
+                cumulative += bucket
+                lines.append(f'{metric}_bucket{{le="{bound:g}"}} {cumulative}')
+            lines.append(f'{metric}_bucket{{le="+Inf"}} {count}')
+            lines.append(f"{metric}_sum {total}")
+            lines.append(f"{metric}_count {count}")
+        typed = set()
+        for (name, labels), count in sorted(counters.items()):
+            metric = f"{PREFIX}{name}_total"
+            if metric not in typed:
+                typed.add(metric)
+                lines.append(f"# TYPE {metric} counter")
+            label_text = ",".join(f'{key}="{value}"' for key, value in labels)
+            lines.append(f"{metric}{{{label_text}}} {count}" if labels else f"{metric} {count}")
+        for name, value in sorted(gauges.items()):
+            lines.append(f"# TYPE {PREFIX}{name} gauge")
+            lines.append(f"{PREFIX}{name} {value() if callable(value) else value}")
+        return "\n".join(lines) + "\n"
+
+    def write_snapshot(self):
+        path = self.config.metrics_file
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.snapshot(), f, indent=2)
+        os.replace(tmp, path)
+
+    def profile_checkpoint(self):
+        """ Starts or stops profiling the calling thread to follow PROFILEFILE.
+        Called once per page by every worker thread. """
+        profiler = getattr(self.local, "profiler", None)
+        if self.profiling and profiler is None:
+            profiler = self.local.profiler = cProfile.Profile()
+            with self.lock:
+                self.profilers[current_thread()] = profiler
+            profiler.enable()
+        elif not self.profiling and profiler is not None:
+            # Stopped and snapshotted here, while the thread is not running
+            # any profiled code.
+            profiler.create_stats()
+            self.local.profiler = None
+            with self.lock:
+                del self.profilers[current_thread()]
+                self.profiles.append(profiler)
+
+    def _dump_profile(self):
+        """ Merges the stats of stopped profilers into PROFILEOUT. """
+        with self.lock:
+            # A thread that exited before its next checkpoint never stopped
+            # its profiler, but no longer runs it either.
+            for thread in [thread for thread in self.profilers if not thread.is_alive()]:
+                profiler = self.profilers.pop(thread)
+                profiler.create_stats()
+                self.profiles.append(profiler)
+            profiles, self.profiles = self.profiles, list()
+            running = len(self.profilers)
+        if running:
+            self.logger.warning(
+                f"Left out {running} threads that did not stop profiling yet.")
+        if not profiles:
+            return
+        stats = pstats.Stats(*profiles)
+        stats.dump_stats(self.config.profile_output)
+        self.logger.info(
+            f"Wrote profile of {len(profiles)} threads to {self.config.profile_output}.")
+
+    def _run(self):
+        next_snapshot = time.monotonic() + self.config.metrics_interval
+        while not self.stopped.wait(min(1.0, self.config.metrics_interval)):
+            profiling = os.path.exists(self.config.profile_file)
+            if profiling != self.profiling:
+                self.logger.info(f"Profiling {'started' if profiling else 'stopped'}.")
+                self.profiling = profiling
+                if not profiling:
+                    # give every thread a page to stop its profiler
+                    time.sleep(1.0)
+                    self._dump_profile()
+            if time.monotonic() >= next_snapshot:
+                next_snapshot += self.config.metrics_interval
+                try:
+                    self.write_snapshot()
+                except OSError as e:
+                    self.logger.error(f"Could not write metrics snapshot: {e!r}")
+
+    def start(self):
+        self.thread = Thread(target=self._run, name="metrics", daemon=True)
+        self.thread.start()
+        if self.config.metrics_port:
+            self.server = MetricsServer(self, ("127.0.0.1", self.config.metrics_port))
+            Thread(target=self.server.serve_forever, name="metrics-http", daemon=True).start()
+            self.logger.info(f"Serving metrics on http://127.0.0.1:{self.config.metrics_port}/metrics")
+
+    def stop(self):
+        """ Writes the final snapshot and any profile that was being taken. """
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+        if self.server is not None:
+            self.server.shutdown()
+        self.profiling = False
+        self._dump_profile()
+        self.write_snapshot()
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = self.server.metrics.prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class MetricsServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, metrics, address):
+        self.metrics = metrics
+        super().__init__(address, MetricsRequestHandler)
+
+
+NULL_METRICS = NullMetrics()
+_metrics = NULL_METRICS
+
+
+def get_metrics():
+    """ Returns the metrics of the running crawl, NULL_METRICS if disabled. """
+    return _metrics
+
+
+def start_metrics(config):
+    """ Creates and starts the metrics of a crawl if [METRICS] ENABLED is set. """
+    global _metrics
+    if config.metrics_enabled:
+        _metrics = Metrics(config)
+        _metrics.start()
+    else:
+        _metrics = NULL_METRICS
+    return _metrics
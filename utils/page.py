@@ -0,0 +1,247 @@
+from collections import Counter
+from html import parser as html_parser
+
+from bs4 import BeautifulSoup, UnicodeDammit
+
+from tokenizer import tokenize, countTokens, getFingerprint
+from utils.metrics import get_metrics
+
+try:
+    from selectolax.lexbor import LexborHTMLParser as HTMLParser
+except ImportError:
+    try:
+        # selectolax before 1.0
+        from selectolax.parser import HTMLParser
+    except ImportError:
+        HTMLParser = None
+try:
+    import lxml.html
+except ImportError:
+    lxml = None
+
+# Elements whose strings BeautifulSoup leaves out of get_text().
+NON_TEXT_TAGS = ("script", "style", "template")
+
+
+def _selectolax_text(content):
+    tree = HTMLParser(content)
+    for node in tree.css(", ".join(NON_TEXT_TAGS)):
+        node.decompose()
+    return tree.root.text(deep=True) if tree.root is not None else ""
+
+
+def _lxml_text(content):
+    try:
+        # lxml reads bytes without a declared charset as latin-1, BeautifulSoup
+        # tries utf-8 first
+        tree = lxml.html.fromstring(content.decode("utf-8"))
+    except (UnicodeDecodeError, ValueError):
+        # not utf-8, or a str with an xml encoding declaration lxml refuses
+        try:
+            tree = lxml.html.fromstring(content)
+        except Exception:
+            return None
+    except Exception:
+        # lxml refuses empty and some malformed documents
+        return None
+    for element in list(tree.iter(*NON_TEXT_TAGS)):
+        element.drop_tree()
+    return tree.text_content()
+
+
+# name -> function(content) returning the text of a page, or None to fall
+# back to BeautifulSoup, for every backend that is installed
+TEXT_BACKENDS = {"html.parser": None}
+if lxml is not None:
+    TEXT_BACKENDS["lxml"] = _lxml_text
+if HTMLParser is not None:
+    TEXT_BACKENDS["selectolax"] = _selectolax_text
+_text_backend = None
+
+
+def set_text_backend(name="html.parser"):
+    """Chooses how ParsedPage extracts text: "html.parser" for BeautifulSoup,
+    "selectolax" or "lxml" when installed, or "auto" for the fastest
+    installed one. Returns the name of the backend in use.
+
+    Args:
+        name : str, backend name or "auto"
+
+    """
+    global _text_backend
+    if name == "auto":
+        name = next(n for n in ("selectolax", "lxml", "html.parser") if n in TEXT_BACKENDS)
+    if name not in TEXT_BACKENDS:
+        raise ValueError(f"Text backend {name} is not installed, expected one of {sorted(TEXT_BACKENDS)}")
+    _text_backend = TEXT_BACKENDS[name]
+    return name
+
+
+set_text_backend()
+
+
+class HrefParser(html_parser.HTMLParser):
+    """Streams the href of every <a> tag and of the first <base> tag out of a
+    page, without building a tree.
+
+    Tags are read by the same html.parser tokenizer, with the same settings,
+    that BeautifulSoup(content, "html.parser") uses, so the hrefs are those
+    of soup.find_all("a"): in document order, the last of repeated href
+    attributes, "" for an href without value and None for an <a> without
+    href.
+    """
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self.hrefs = []
+        self.base = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "a":
+            href = None
+            for name, value in attrs:
+                if name == "href":
+                    href = value or ""
+            self.hrefs.append(href)
+        elif tag == "base" and self.base is None:
+            for name, value in attrs:
+                if name == "href":
+                    self.base = value or ""
+
+
+def decode_markup(content):
+    """The page as BeautifulSoup decodes it, ASCII pages without sniffing."""
+    if isinstance(content, str):
+        return content
+    if content.isascii():
+        return content.decode("ascii")
+    return UnicodeDammit(content, is_html=True).unicode_markup
+
+
+def extract_hrefs(content):
+    """Returns (hrefs of the <a> tags, href of the first <base> tag or None)
+    of a page, see HrefParser.
+
+    Args:
+        content : bytes or str, the page
+
+    """
+    parser = HrefParser()
+    parser.feed(decode_markup(content))
+    parser.close()
+    return parser.hrefs, parser.base
+
+
+class ParsedPage(object):
+    """Parse-once view of a downloaded page.
+
+    The DOM, extracted text, tokens, token frequencies and hrefs are each
+    computed on first access and then shared by the similarity check, the
+    link scraper and the report statistics, so a response is only run
+    through BeautifulSoup and tokenize() once. With a selectolax or lxml
+    text backend (see set_text_backend) the text is extracted without the
+    soup, and unless something else built the soup the hrefs are streamed
+    out of the page by extract_hrefs, so the soup is never built.
+
+    Args:
+        resp : response object containing status code and page content
+
+    """
+    def __init__(self, resp):
+        self.resp = resp
+        self._soup = None
+        self._text = None
+        self._tokens = None
+        self._freqs = None
+        self._fingerprint = None
+        self._hrefs = None
+        self._base = None
+
+    @property
+    def has_content(self):
+        resp = self.resp
+        return (resp is not None and resp.raw_response is not None
+                and resp.raw_response.content is not None)
+
+    @property
+    def content(self):
+        return self.resp.raw_response.content if self.has_content else None
+
+    @property
+    def soup(self):
+        if self._soup is None:
+            with get_metrics().timer("html_parse"):
+                self._soup = BeautifulSoup(self.content, "html.parser")
+        return self._soup
+
+    @property
+    def text(self):
+        if self._text is None:
+            if _text_backend is not None and self.content is not None:
+                with get_metrics().timer("get_text"):
+                    self._text = _text_backend(self.content)
+            if self._text is None:
+                soup = self.soup
+                with get_metrics().timer("get_text"):
+                    self._text = soup.get_text()
+        return self._text
+
+    @property
+    def tokens(self):
+        if self._tokens is None:
+            text = self.text
+            with get_metrics().timer("tokenize"):
+                self._tokens = tokenize(text)
+        return self._tokens
+
+    @property
+    def freqs(self):
+        """Counter of the tokens, counted in one pass without the token list."""
+        if self._freqs is None:
+            if self._tokens is not None:
+                self._freqs = Counter(self._tokens)
+            else:
+                text = self.text
+                with get_metrics().timer("tokenize"):
+                    self._freqs = countTokens(text)
+        return self._freqs
+
+    @property
+    def token_count(self):
+        """Number of tokens, duplicates included."""
+        if self._tokens is not None:
+            return len(self._tokens)
+        return sum(self.freqs.values())
+
+    @property
+    def fingerprint(self):
+        """Simhash of the token counts."""
+        if self._fingerprint is None:
+            self._fingerprint = getFingerprint(self.freqs)
+        return self._fingerprint
+
+    def _extract_links(self):
+        with get_metrics().timer("extract_hrefs"):
+            # finding the <a> tags of a built soup is several times cheaper
+            # than tokenizing the page again, see benchmarks/bench_links.py
+            if self._soup is not None:
+                self._hrefs = [a.get("href") for a in self._soup.find_all("a")]
+                base = self._soup.find("base", href=True)
+                self._base = base.get("href") if base is not None else None
+            elif self.content is not None:
+                self._hrefs, self._base = extract_hrefs(self.content)
+            else:
+                self._hrefs = []
+
+    @property
+    def hrefs(self):
+        """href of every <a> tag, None for those without one."""
+        if self._hrefs is None:
+            self._extract_links()
+        return self._hrefs
+
+    @property
+    def base(self):
+        """href of the first <base> tag with one, else None."""
+        if self._hrefs is None:
+            self._extract_links()
+        return self._base
@@ -1,14 +1,42 @@
 import pickle
 
 class Response(object):
+    """Response of the cache server.
+
+    url, status, error and size are read straight from the cache server's
+    answer. The pickled requests.Response holding the page is only unpickled
+    the first time raw_response is read, so pages that are never looked at,
+    such as error pages, cost no unpickling. The pickled bytes are dropped
+    once decoded, so a page is held in memory once.
+    """
     def __init__(self, resp_dict):
         self.url = resp_dict["url"]
         self.status = resp_dict["status"]
         self.error = resp_dict["error"] if "error" in resp_dict else None
-        try:
-            self.raw_response = (
-                pickle.loads(resp_dict["response"])
-                if "response" in resp_dict else
-                None)
-        except TypeError:
-            self.raw_response = None
+        # Seconds the cache server took to answer, set by the downloader.
+        self.latency = None
+        # Pickled requests.Response, until raw_response decodes it.
+        self.pickled = resp_dict.get("response")
+        self.size = len(self.pickled) if self.pickled is not None else 0
+        self._raw_response = None
+
+    @property
+    def raw_response(self):
+        if self.pickled is not None:
+            try:
+                self._raw_response = pickle.loads(self.pickled)
+            except TypeError:
+                self._raw_response = None
+            self.pickled = None
+        return self._raw_response
+
+    @raw_response.setter
+    def raw_response(self, value):
+        self.pickled = None
+        self._raw_response = value
+
+    @property
+    def content(self):
+        """Page content, None if the response has none."""
+        raw_response = self.raw_response
+        return raw_response.content if raw_response is not None else None